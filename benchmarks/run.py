@@ -0,0 +1,420 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Microbenchmarks of the logzero hot paths.
+
+Measures records per second and the memory allocated per record (with
+tracemalloc) and saves the results as JSON, to compare them across versions:
+
+    python benchmarks/run.py --output before.json
+    python benchmarks/run.py --output after.json --compare before.json
+
+Run only some benchmarks by passing their names (or prefixes):
+
+    python benchmarks/run.py format file_
+
+With ``--concurrency`` it also measures how the throughput of the file
+handlers scales with the number of threads logging at once.
+
+Needs Python 3.4+ (for tracemalloc).
+"""
+from __future__ import print_function
+
+import argparse
+import copy
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import logzero  # noqa: E402
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+# name -> function(tmpdir) returning (run_once, teardown or None)
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def _make_record(msg="request %s took %d ms", args=("/index", 42), level=logging.INFO, exc_info=None):
+    return logging.LogRecord("bench", level, __file__, 42, msg, args, exc_info)
+
+
+def _null_logger(name, level=logging.DEBUG, formatter=None):
+    """
+    A logger writing formatted records to an in-memory stream, which is emptied regularly
+    """
+    stream = io.StringIO() if sys.version_info >= (3, ) else io.BytesIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(formatter or logzero.LogFormatter(color=False))
+    _logger = logging.getLogger(name)
+    _logger.handlers = [handler]
+    _logger.propagate = False
+    _logger.setLevel(level)
+
+    def teardown():
+        _logger.handlers = []
+    return _logger, stream, teardown
+
+
+def _formatter_benchmark(**kwargs):
+    formatter = logzero.LogFormatter(**kwargs)
+    record = _make_record()
+    return lambda: formatter.format(record), None
+
+
+@benchmark("format")
+def bench_format(tmpdir):
+    return _formatter_benchmark(color=False)
+
+
+@benchmark("format_color")
+def bench_format_color(tmpdir):
+    os.environ["LOGZERO_FORCE_COLOR"] = "1"
+    try:
+        formatter = logzero.LogFormatter(color=True)
+        record = _make_record()
+        # Color support is detected with the first record
+        formatter.format(record)
+    finally:
+        del os.environ["LOGZERO_FORCE_COLOR"]
+    return lambda: formatter.format(record), None
+
+
+@benchmark("format_compiled")
+def bench_format_compiled(tmpdir):
+    return _formatter_benchmark(color=False, compiled=True)
+
+
+@benchmark("format_exception")
+def bench_format_exception(tmpdir):
+    formatter = logzero.LogFormatter(color=False)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = _make_record(exc_info=sys.exc_info())
+
+    def run():
+        # A fresh copy, so the traceback isn't served from record.exc_text
+        formatter.format(copy.copy(record))
+    return run, None
+
+
+@benchmark("disabled_level")
+def bench_disabled_level(tmpdir):
+    _logger, _stream, teardown = _null_logger("bench_disabled", level=logging.WARNING)
+    return lambda: _logger.debug("request %s took %d ms", "/index", 42), teardown
+
+
+@benchmark("log_call")
+def bench_log_call(tmpdir):
+    _logger, stream, teardown = _null_logger("bench_log_call")
+
+    def run():
+        _logger.info("request %s took %d ms", "/index", 42)
+        stream.seek(0)
+        stream.truncate()
+    return run, teardown
+
+
+def _log_call_short_benchmark(name, fast):
+    # A format without the call site, which FastLogger doesn't look up then
+    formatter = logzero.LogFormatter(color=False, fmt="%(color)s[%(levelname)1.1s %(asctime)s]%(end_color)s %(message)s")
+    _logger, stream, teardown = _null_logger(name, formatter=formatter)
+    logzero.use_fast_logger(_logger, fast)
+
+    def run():
+        _logger.info("request %s took %d ms", "/index", 42)
+        stream.seek(0)
+        stream.truncate()
+    return run, teardown
+
+
+@benchmark("log_call_short")
+def bench_log_call_short(tmpdir):
+    return _log_call_short_benchmark("bench_log_call_short", False)
+
+
+@benchmark("log_call_short_fast")
+def bench_log_call_short_fast(tmpdir):
+    return _log_call_short_benchmark("bench_log_call_short_fast", True)
+
+
+def _log_function_call_benchmark(level):
+    _logger, stream, teardown = _null_logger("bench_log_function_call", level=level)
+
+    @logzero.log_function_call(logger_to_use=_logger)
+    def add(a, b):
+        return a + b
+
+    def run():
+        add(1, b=2)
+        stream.seek(0)
+        stream.truncate()
+    return run, teardown
+
+
+@benchmark("log_function_call")
+def bench_log_function_call(tmpdir):
+    return _log_function_call_benchmark(logging.DEBUG)
+
+
+@benchmark("log_function_call_disabled")
+def bench_log_function_call_disabled(tmpdir):
+    return _log_function_call_benchmark(logging.INFO)
+
+
+@benchmark("setup_logger")
+def bench_setup_logger(tmpdir):
+    def run():
+        logzero.setup_logger(name="bench_setup_logger", level=logging.INFO)
+
+    def teardown():
+        logging.getLogger("bench_setup_logger").handlers = []
+    return run, teardown
+
+
+def _file_benchmark(tmpdir, name, **kwargs):
+    _logger = logzero.setup_logger(name="bench_" + name, logfile=os.path.join(tmpdir, name + ".log"),
+                                   disableStderrLogger=True, **kwargs)
+
+    def run():
+        _logger.info("request %s took %d ms", "/index", 42)
+
+    def teardown():
+        logzero.setup_logger(name="bench_" + name, disableStderrLogger=True)
+    return run, teardown
+
+
+@benchmark("file")
+def bench_file(tmpdir):
+    return _file_benchmark(tmpdir, "file")
+
+
+@benchmark("file_rotating")
+def bench_file_rotating(tmpdir):
+    return _file_benchmark(tmpdir, "file_rotating", maxBytes=100000, backupCount=3)
+
+
+@benchmark("file_fast_rotating")
+def bench_file_fast_rotating(tmpdir):
+    return _file_benchmark(tmpdir, "file_fast_rotating", maxBytes=100000, backupCount=3, rotation="numbered")
+
+
+@benchmark("file_batch")
+def bench_file_batch(tmpdir):
+    return _file_benchmark(tmpdir, "file_batch", maxBytes=100000, backupCount=3, batch_mode=True)
+
+
+@benchmark("file_async")
+def bench_file_async(tmpdir):
+    return _file_benchmark(tmpdir, "file_async", async_mode=True)
+
+
+@benchmark("file_binary")
+def bench_file_binary(tmpdir):
+    return _file_benchmark(tmpdir, "file_binary", binary=True)
+
+
+@benchmark("file_spool")
+def bench_file_spool(tmpdir):
+    return _file_benchmark(tmpdir, "file_spool", spool=os.path.join(tmpdir, "file_spool.spool"))
+
+
+@benchmark("file_and_stderr")
+def bench_file_and_stderr(tmpdir):
+    # Both formatters share the rendering of a record
+    _logger = logzero.setup_logger(name="bench_file_and_stderr", logfile=os.path.join(tmpdir, "file_and_stderr.log"))
+    stream = io.StringIO() if sys.version_info >= (3, ) else io.BytesIO()
+    for handler in _logger.handlers:
+        if not isinstance(handler, logging.FileHandler):
+            handler.stream = stream
+
+    def run():
+        _logger.info("request %s took %d ms", "/index", 42)
+        stream.seek(0)
+        stream.truncate()
+
+    def teardown():
+        logzero.setup_logger(name="bench_file_and_stderr", disableStderrLogger=True)
+    return run, teardown
+
+
+def measure(run, number, repeat):
+    """
+    Returns the best records per second of ``repeat`` runs of ``number``
+    records, and the peak and retained memory per record.
+    """
+    run()
+    best = None
+    for _ in range(repeat):
+        start = _clock()
+        for _ in range(number):
+            run()
+        elapsed = _clock() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # The peak of a single record shows the temporary allocations, the memory
+    # still held after many records the growth per record.
+    tracemalloc.start()
+    try:
+        run()
+        baseline = tracemalloc.get_traced_memory()[0]
+        peak = 0
+        for _ in range(100):
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            run()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "number": number,
+        "records_per_sec": round(number / best, 1),
+        "ns_per_record": round(best / number * 1e9, 1),
+        "alloc_peak_bytes": peak,
+        "retained_bytes_per_record": round(retained / 100.0, 1),
+    }
+
+
+# Logfile handlers compared by the concurrency benchmark: setup_logger(..) arguments
+CONCURRENCY_HANDLERS = {
+    "rotating": {},
+    "fast_rotating": {"rotation": "numbered"},
+    "batch": {"batch_mode": True},
+    "per_thread": {"batch_mode": "per_thread"},
+}
+THREAD_COUNTS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def measure_concurrency(tmpdir, name, kwargs, threads, number):
+    """
+    Returns the records per second of ``threads`` threads logging ``number``
+    records in total to the same logfile, until they are written.
+    """
+    _logger = logzero.setup_logger(name="bench_concurrency_" + name, logfile=os.path.join(tmpdir, name + ".log"),
+                                   disableStderrLogger=True, maxBytes=10 * 1024 * 1024, backupCount=3, **kwargs)
+    barrier = threading.Barrier(threads + 1)
+
+    def log_records():
+        barrier.wait()
+        for _ in range(number // threads):
+            _logger.info("request %s took %d ms", "/index", 42)
+
+    workers = [threading.Thread(target=log_records) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    try:
+        barrier.wait()
+        start = _clock()
+        for worker in workers:
+            worker.join()
+        for handler in _logger.handlers:
+            handler.flush()
+        elapsed = _clock() - start
+    finally:
+        logzero.setup_logger(name="bench_concurrency_" + name, disableStderrLogger=True)
+    return round(number // threads * threads / elapsed, 1)
+
+
+def run_concurrency(number=20000, thread_counts=THREAD_COUNTS):
+    tmpdir = tempfile.mkdtemp(prefix="logzero-bench-")
+    results = {}
+    try:
+        for name, kwargs in sorted(CONCURRENCY_HANDLERS.items()):
+            results[name] = dict((str(threads), measure_concurrency(tmpdir, name, kwargs, threads, number))
+                                 for threads in thread_counts)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return results
+
+
+def run_benchmarks(names=None, number=20000, repeat=3):
+    tmpdir = tempfile.mkdtemp(prefix="logzero-bench-")
+    results = {}
+    try:
+        for name in sorted(BENCHMARKS):
+            if names and not any(name.startswith(prefix) for prefix in names):
+                continue
+            run, teardown = BENCHMARKS[name](tmpdir)
+            try:
+                results[name] = measure(run, number, repeat)
+            finally:
+                if teardown is not None:
+                    teardown()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return {
+        "logzero_version": logzero.__version__,
+        "python": platform.python_implementation() + " " + platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def print_results(data, baseline=None):
+    print("%-28s %14s %10s %12s %12s" % ("benchmark", "records/sec", "ns", "peak bytes", "retained"))
+    for name, result in sorted(data["results"].items()):
+        line = "%-28s %14.0f %10.0f %12d %12.1f" % (
+            name, result["records_per_sec"], result["ns_per_record"],
+            result["alloc_peak_bytes"], result["retained_bytes_per_record"])
+        old = (baseline or {}).get("results", {}).get(name)
+        if old:
+            line += "  %+6.1f%%" % ((result["records_per_sec"] / old["records_per_sec"] - 1) * 100)
+        print(line)
+
+    concurrency = data.get("concurrency")
+    if concurrency:
+        thread_counts = sorted(next(iter(concurrency.values())), key=int)
+        print()
+        print("%-28s" % "records/sec by threads" + "".join("%10s" % threads for threads in thread_counts))
+        for name, result in sorted(concurrency.items()):
+            print("%-28s" % name + "".join("%10.0f" % result[threads] for threads in thread_counts))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the logzero microbenchmarks.")
+    parser.add_argument("names", nargs="*", help="only run benchmarks starting with these names")
+    parser.add_argument("-n", "--number", type=int, default=20000, help="records per run (default: 20000)")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="runs per benchmark, the best counts (default: 3)")
+    parser.add_argument("-o", "--output", help="save the results to this JSON file")
+    parser.add_argument("-c", "--compare", help="show the change in records/sec against this JSON file")
+    parser.add_argument("--concurrency", action="store_true",
+                        help="also measure the file handlers with 1 to 64 threads logging at once")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    data = run_benchmarks(args.names, number=args.number, repeat=args.repeat)
+    if args.concurrency:
+        data["concurrency"] = run_concurrency(number=max(args.number, max(THREAD_COUNTS)))
+    print_results(data, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -35,17 +35,23 @@ parameter `level`.
 See the documentation for more information: https://logzero.readthedocs.io
 """
 import functools
+import itertools
 import os
+import re
 import sys
+import threading
+import time
 import logging
+import weakref
+import operator
+from operator import itemgetter
 from logzero.colors import Fore as ForegroundColors
 from logzero.colors import Back as BackgroundColors
-from logging.handlers import RotatingFileHandler, SysLogHandler
-
-try:
-    import curses  # type: ignore
-except ImportError:
-    curses = None
+from logzero.filters import AdaptiveLevelController, RateLimitFilter, SamplingFilter
+from logzero.callsites import SITE_ATTRS, CallSiteCache  # noqa: F401
+from logzero.callsites import default_cache as _default_callsites
+from logzero.loggers import FastLogger, format_attrs, use_fast_logger  # noqa: F401
+from logzero.tracebacks import TracebackCache
 
 __author__ = """Chris Hager"""
 __email__ = 'chris@linuxuser.at'
@@ -68,6 +74,9 @@ LOGZERO_DEFAULT_LOGGER = "logzero_default"
 # Attribute which all internal loggers carry
 LOGZERO_INTERNAL_LOGGER_ATTR = "_is_logzero_internal"
 
+# Attribute which the internal logfile handlers carry
+LOGZERO_INTERNAL_LOGFILE_ATTR = "_is_logzero_internal_logfile"
+
 # Attribute signalling whether the handler has a custom loglevel
 LOGZERO_INTERNAL_HANDLER_IS_CUSTOM_LOGLEVEL = "_is_logzero_internal_handler_custom_loglevel"
 
@@ -79,6 +88,19 @@ _loglevel = logging.DEBUG
 _logfile = None
 _formatter = None
 
+# Default of the arguments which are left unchanged unless passed
+_UNCHANGED = object()
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        # Import the JSON formatter (and encoder) only when it is used
+        if name == 'JsonFormatter':
+            from logzero import formatters
+            return formatters.JsonFormatter
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+else:
+    from logzero.formatters import JsonFormatter  # noqa: F401
+
 # Setup colorama on Windows
 if os.name == 'nt':
     from colorama import init as colorama_init
@@ -87,7 +109,11 @@ if os.name == 'nt':
 
 def setup_logger(name=None, logfile=None, level=logging.DEBUG, formatter=None,
                  maxBytes=0, backupCount=0, fileLoglevel=None,
-                 disableStderrLogger=False):
+                 disableStderrLogger=False, async_mode=False, queueSize=10000,
+                 queueOverflow='block', batch_mode=False, rotation=None,
+                 compression=None, compressionLevel=None, rateLimit=None,
+                 multiprocess=False, compactTracebacks=False, sampling=None,
+                 adaptiveLevel=None, spool=None, binary=False, fastRecords=None):
     """
     Configures and returns a fully configured logger instance, no hassles.
     If a logger with the specified name already exists, it returns the existing instance,
@@ -112,27 +138,47 @@ def setup_logger(name=None, logfile=None, level=logging.DEBUG, formatter=None,
     :arg int backupCount: Number of backups to keep. Defaults to 0, rollover never occurs.
     :arg int fileLoglevel: Minimum `logging-level <https://docs.python.org/2/library/logging.html#logging-levels>`_ for the file logger (is not set, it will use the loglevel from the ``level`` argument)
     :arg bool disableStderrLogger: Should the default stderr logger be disabled. Defaults to False.
+    :arg bool async_mode: Write to the logfile from a background thread, see :class:`logzero.handlers.AsyncHandler`. With ``asyncio`` records logged on an event loop are queued on the loop and written in batches from a worker thread, see :class:`logzero.aio.AsyncioHandler`. Defaults to False.
+    :arg int queueSize: Maximum number of records waiting to be written in ``async_mode``. Defaults to 10000.
+    :arg string queueOverflow: What to do when the queue is full in ``async_mode``: ``block`` (default), ``drop_oldest``, ``drop_newest`` or ``sample``.
+    :arg bool batch_mode: Buffer records in memory and write them to the logfile in batches, see :class:`logzero.handlers.BufferedRotatingFileHandler`. With ``per_thread`` every thread has its own buffer, see :class:`logzero.handlers.ThreadBufferedFileHandler`. Defaults to False.
+    :arg string rotation: Rotate with :class:`logzero.handlers.FastRotatingFileHandler`, which doesn't block logging threads during rollover. ``numbered`` keeps the usual backup names, ``timestamp`` names backups by their rollover time. Defaults to None (standard ``RotatingFileHandler``).
+    :arg string compression: Compress rotated logfiles in a background thread with ``gzip``, ``zstd`` or ``lz4`` (the latter two need the ``zstandard``/``lz4`` packages). Defaults to None.
+    :arg int compressionLevel: Level for ``compression``, defaults to the default level of the compression.
+    :arg bool multiprocess: Let only one process write (and rotate) the logfile, the other processes send their records to it, see :class:`logzero.multiprocess.MultiprocessHandler`. Defaults to False.
+    :arg rateLimit: Let at most this many records per second through for every message template and call site, and log how many were suppressed. A number or a :class:`logzero.filters.RateLimitFilter`. Defaults to None (no limit).
+    :arg sampling: Keep only a fraction of the records of some levels, eg. ``{logging.DEBUG: 0.01, logging.INFO: 0.1}``. A dict or a :class:`logzero.filters.SamplingFilter` (which can sample by trace id). Defaults to None (all records are kept).
+    :arg adaptiveLevel: Raise the minimum level while more records per second than this are logged (or the queue of ``async_mode`` is half full), and lower it again afterwards. A number or a :class:`logzero.filters.AdaptiveLevelController`. Defaults to None.
+    :arg bool compactTracebacks: Log the traceback of an exception raised again and again from the same place in full once a minute, and in between only its first and last frame, see :class:`logzero.tracebacks.TracebackCache`. Defaults to False.
+    :arg string spool: Put records into this spool file on disk, from which a background thread writes them to the logfile, see :class:`logzero.spool.SpoolHandler`. Defaults to None.
+    :arg bool binary: Write the logfile in a compact binary format, to be rendered with ``python -m logzero.decode``, see :class:`logzero.binary.BinaryFileHandler`. Defaults to False.
+    :arg bool fastRecords: Create records without looking up the caller of the logging call (a walk of the stack) and the thread and process, unless a formatter, handler or filter of the logger uses them (eg. ``%(module)s:%(lineno)d`` of the default format), see :class:`logzero.loggers.FastLogger`. False turns the logger back into a `logging.Logger`. Defaults to None (the class of the logger is left alone).
     :return: A fully configured Python logging `Logger object <https://docs.python.org/2/library/logging.html#logger-objects>`_ you can use with ``.debug("msg")``, etc.
     """
     _logger = logging.getLogger(name or __name__)
     _logger.propagate = False
     _logger.setLevel(level)
 
+    # The internal formatters render every record once
+    stage = FormatStage()
+    tracebacks = TracebackCache(compact=True) if compactTracebacks else None
+
     # Reconfigure existing handlers
     stderr_stream_handler = None
     for handler in list(_logger.handlers):
         if hasattr(handler, LOGZERO_INTERNAL_LOGGER_ATTR):
-            if isinstance(handler, logging.FileHandler):
+            if _is_logfile_handler(handler):
                 # Internal FileHandler needs to be removed and re-setup to be able
                 # to set a new logfile.
-                _logger.removeHandler(handler)
+                _remove_internal_handler(_logger, handler)
                 continue
             elif isinstance(handler, logging.StreamHandler):
                 stderr_stream_handler = handler
 
         # reconfigure handler
         handler.setLevel(level)
-        handler.setFormatter(formatter or LogFormatter())
+        handler.setFormatter(formatter or LogFormatter(stream=getattr(handler, 'stream', None), stage=stage,
+                                                       tracebacks=tracebacks))
 
     # remove the stderr handler (stream_handler) if disabled
     if disableStderrLogger:
@@ -142,23 +188,154 @@ def setup_logger(name=None, logfile=None, level=logging.DEBUG, formatter=None,
         stderr_stream_handler = logging.StreamHandler()
         setattr(stderr_stream_handler, LOGZERO_INTERNAL_LOGGER_ATTR, True)
         stderr_stream_handler.setLevel(level)
-        stderr_stream_handler.setFormatter(formatter or LogFormatter())
+        stderr_stream_handler.setFormatter(formatter or LogFormatter(stream=stderr_stream_handler.stream, stage=stage,
+                                                                     tracebacks=tracebacks))
         _logger.addHandler(stderr_stream_handler)
 
     if logfile:
-        rotating_filehandler = RotatingFileHandler(filename=logfile,
-                                                   maxBytes=maxBytes,
-                                                   backupCount=backupCount,
-                                                   encoding='utf-8')
+        rotating_filehandler = _create_logfile_handler(
+            logfile, formatter or LogFormatter(color=False, stage=stage, tracebacks=tracebacks),
+            maxBytes=maxBytes, backupCount=backupCount, encoding='utf-8',
+            async_mode=async_mode, queueSize=queueSize,
+            queueOverflow=queueOverflow, batch_mode=batch_mode,
+            rotation=rotation, compression=compression,
+            compressionLevel=compressionLevel, multiprocess=multiprocess,
+            spool=spool, binary=binary)
         setattr(rotating_filehandler, LOGZERO_INTERNAL_LOGGER_ATTR, True)
         rotating_filehandler.setLevel(fileLoglevel or level)
-        rotating_filehandler.setFormatter(
-            formatter or LogFormatter(color=False))
         _logger.addHandler(rotating_filehandler)
 
+    _set_adaptive_level(_logger, adaptiveLevel)
+    _set_sampling(_logger, sampling)
+    _set_rate_limit(_logger, rateLimit)
+    if fastRecords is not None:
+        use_fast_logger(_logger, fastRecords)
     return _logger
 
 
+# The internal filters of a logger run in this order, after the custom ones
+_INTERNAL_FILTERS = (AdaptiveLevelController, SamplingFilter, RateLimitFilter)
+
+
+def _set_internal_filter(logger_to_update, filter_class, new_filter):
+    """
+    Replaces the internal filter of the given class of the logger, returns the
+    new filter (or None).
+    """
+    filters = []
+    for _filter in logger_to_update.filters:
+        if not (hasattr(_filter, LOGZERO_INTERNAL_LOGGER_ATTR) and isinstance(_filter, filter_class)):
+            filters.append(_filter)
+        elif _filter is not new_filter and hasattr(_filter, 'close'):
+            # eg. logs the pending summaries of a RateLimitFilter
+            _filter.close()
+    if new_filter is not None:
+        setattr(new_filter, LOGZERO_INTERNAL_LOGGER_ATTR, True)
+        filters.append(new_filter)
+
+    def rank(_filter):
+        for index, cls in enumerate(_INTERNAL_FILTERS):
+            if isinstance(_filter, cls):
+                return index
+        return len(_INTERNAL_FILTERS)
+    internal = sorted((_filter for _filter in filters if hasattr(_filter, LOGZERO_INTERNAL_LOGGER_ATTR)), key=rank)
+    logger_to_update.filters = [_filter for _filter in filters
+                                if not hasattr(_filter, LOGZERO_INTERNAL_LOGGER_ATTR)] + internal
+    return new_filter
+
+
+def _set_rate_limit(logger_to_update, rateLimit):
+    """
+    Replaces the internal rate limit filter of the logger, returns the new
+    filter (or None).
+    """
+    if rateLimit is not None and not isinstance(rateLimit, RateLimitFilter):
+        rateLimit = RateLimitFilter(rate=rateLimit)
+    return _set_internal_filter(logger_to_update, RateLimitFilter, rateLimit)
+
+
+def _set_sampling(logger_to_update, sampling):
+    """
+    Replaces the internal sampling filter of the logger, returns the new
+    filter (or None).
+    """
+    if sampling is not None and not isinstance(sampling, SamplingFilter):
+        sampling = SamplingFilter(sampling)
+    return _set_internal_filter(logger_to_update, SamplingFilter, sampling)
+
+
+def _set_adaptive_level(logger_to_update, adaptiveLevel):
+    """
+    Replaces the internal adaptive level controller of the logger, returns the
+    new controller (or None).
+    """
+    if adaptiveLevel is not None and not isinstance(adaptiveLevel, AdaptiveLevelController):
+        adaptiveLevel = AdaptiveLevelController(maxRate=adaptiveLevel)
+    return _set_internal_filter(logger_to_update, AdaptiveLevelController, adaptiveLevel)
+
+
+def _create_logfile_handler(filename, formatter, mode='a', maxBytes=0,
+                            backupCount=0, encoding=None, async_mode=False,
+                            queueSize=10000, queueOverflow='block',
+                            batch_mode=False, rotation=None, compression=None,
+                            compressionLevel=None, multiprocess=False, spool=None,
+                            binary=False):
+    """
+    Creates the internal file handler for `setup_logger(..)` and `logfile(..)`.
+    """
+    from logging.handlers import RotatingFileHandler
+    from logzero.handlers import AsyncHandler, BufferedRotatingFileHandler, FastRotatingFileHandler
+    from logzero.handlers import ThreadBufferedFileHandler, ASYNC_MODE_ASYNCIO, BATCH_PER_THREAD, ROTATION_NUMBERED
+
+    def create_file_handler():
+        if binary:
+            from logzero.binary import BinaryFileHandler
+            return BinaryFileHandler(
+                filename, mode=mode, maxBytes=maxBytes, backupCount=backupCount,
+                rotation=rotation or ROTATION_NUMBERED, compression=compression,
+                compressionLevel=compressionLevel)
+        elif batch_mode == BATCH_PER_THREAD:
+            return ThreadBufferedFileHandler(
+                filename, mode=mode, maxBytes=maxBytes, backupCount=backupCount,
+                encoding=encoding, rotation=rotation or ROTATION_NUMBERED,
+                compression=compression, compressionLevel=compressionLevel)
+        elif batch_mode:
+            return BufferedRotatingFileHandler(
+                filename, mode=mode, maxBytes=maxBytes, backupCount=backupCount,
+                encoding=encoding, rotation=rotation or ROTATION_NUMBERED,
+                compression=compression, compressionLevel=compressionLevel)
+        elif rotation or compression:
+            return FastRotatingFileHandler(
+                filename, mode=mode, maxBytes=maxBytes, backupCount=backupCount,
+                encoding=encoding, rotation=rotation or ROTATION_NUMBERED,
+                compression=compression, compressionLevel=compressionLevel)
+        return RotatingFileHandler(
+            filename, mode=mode, maxBytes=maxBytes, backupCount=backupCount,
+            encoding=encoding)
+
+    if multiprocess:
+        # Only the process writing the logfile creates the file handler
+        from logzero.multiprocess import MultiprocessHandler
+        file_handler = MultiprocessHandler(filename, createHandler=create_file_handler)
+    else:
+        file_handler = create_file_handler()
+    file_handler.setFormatter(formatter)
+
+    if spool:
+        from logzero.spool import SpoolHandler
+        file_handler = SpoolHandler(file_handler, spool)
+
+    if async_mode == ASYNC_MODE_ASYNCIO:
+        from logzero.aio import AsyncioHandler
+        file_handler = AsyncioHandler(file_handler, queueSize=queueSize,
+                                      overflow=queueOverflow)
+    elif async_mode:
+        file_handler = AsyncHandler(file_handler, queueSize=queueSize,
+                                    overflow=queueOverflow)
+    setattr(file_handler, LOGZERO_INTERNAL_LOGFILE_ATTR, True)
+    return file_handler
+
+
 class LogFormatter(logging.Formatter):
     """
     Log formatter used in Tornado. Key features of this formatter are:
@@ -176,11 +353,19 @@ class LogFormatter(logging.Formatter):
                         BackgroundColors.RED)
     }
 
+    # (key, rendered timestamp) of the last second formatted by formatTime
+    _time_cache = (None, None)
+
     def __init__(self,
                  color=True,
                  fmt=DEFAULT_FORMAT,
                  datefmt=DEFAULT_DATE_FORMAT,
-                 colors=DEFAULT_COLORS):
+                 colors=DEFAULT_COLORS,
+                 compiled=False,
+                 stream=None,
+                 stage=None,
+                 tracebacks=None,
+                 callsites=None):
         r"""
         :arg bool color: Enables color support.
         :arg string fmt: Log message format.
@@ -191,20 +376,216 @@ class LogFormatter(logging.Formatter):
           code
         :arg string datefmt: Datetime format.
           Used for formatting ``(asctime)`` placeholder in ``prefix_fmt``.
+        :arg bool compiled: Parse ``fmt`` once into a positional template and
+          the list of record attributes it uses, and only do the per-record
+          work the format actually needs. The output is identical to the
+          default mode. Formats which cannot be compiled (eg. ``%s`` without
+          a mapping key) silently use the default mode. Always on with
+          ``callsites``.
+        :arg stream: The stream the formatted records are written to, whose
+          color support is detected (default: ``sys.stderr``). Detection
+          happens when the first record is formatted, and its result is
+          cached per terminal.
+        :arg FormatStage stage: Share the rendering of records with the other
+          formatters using this stage, see `FormatStage`. Only the colors are
+          added by every formatter.
+        :arg TracebackCache tracebacks: Renders the tracebacks of exceptions,
+          caching the frames of every exception type and code path (default:
+          a cache shared by all formatters). Pass one with ``compact=True``
+          to shorten repeated tracebacks, or False to render every traceback
+          from scratch.
+        :arg CallSiteCache callsites: Renders the attributes of the call site
+          in ``fmt`` (eg. ``%(module)s:%(lineno)d``) once per call site and
+          message template, and counts the records logged from every site.
+          True uses a cache shared by all formatters. Off by default: looking
+          up the site costs about as much as rendering the default format's
+          ``%(module)s:%(lineno)d``, it pays off with longer site attributes
+          (``%(pathname)s``, ``%(funcName)s``) or when the counts are used.
         .. versionchanged:: 3.2
            Added ``fmt`` and ``datefmt`` arguments.
         """
         logging.Formatter.__init__(self, datefmt=datefmt)
 
         self._fmt = fmt
-        self._colors = {}
+        self._stream = stream
+        self._level_colors = colors
         self._normal = ''
-
-        if color and _stderr_supports_color():
-            self._colors = colors
+        self.callsites = _default_callsites if callsites is True else callsites
+        self._compiled = _compile_format(fmt) if compiled or self.callsites else None
+        # Level -> (color, end_color), rendered once by _detect_colors().
+        # Empty if colors are off, None until color support is detected.
+        self._color_codes = None if color else {}
+        # (fmt, format to render without colors, its compiled form, whether it
+        # still needs record.color), see _colorless_format()
+        self._colorless = None
+        self.stage = stage
+        self.tracebacks = _default_tracebacks if tracebacks is None else tracebacks
+        # (fmt, its _ColorLayout), see _color_layout()
+        self._layout = (None, None)
+
+    def _detect_colors(self):
+        if _stream_supports_color(self._stream):
             self._normal = ForegroundColors.RESET+BackgroundColors.RESET
+            codes = dict((level, (code, self._normal)) for level, code in self._level_colors.items())
+        else:
+            codes = {}
+        self._color_codes = codes
+        return codes
+
+    def _colorless_format(self):
+        """
+        Returns ``fmt`` with the ``%(color)s`` and ``%(end_color)s``
+        placeholders removed (they'd render as empty strings anyway), its
+        compiled form and whether records still need the ``color`` and
+        ``end_color`` attributes, as ``fmt`` uses them in some other way.
+        Cached until ``_fmt`` is replaced.
+        """
+        fmt = self._fmt
+        colorless = self._colorless
+        if colorless is None or colorless[0] is not fmt:
+            stripped = _strip_color_fields(fmt)
+            if stripped is None:
+                colorless = (fmt, fmt, self._compiled, True)
+            else:
+                compiled = _compile_format(stripped) if self._compiled is not None else None
+                colorless = (fmt, stripped, compiled, False)
+            self._colorless = colorless
+        return colorless[1:]
+
+    @property
+    def recordAttrs(self):
+        """
+        The record attributes rendered by ``fmt``, see
+        `logzero.loggers.record_attrs()`. Subclasses rendering other
+        attributes need to add them.
+        """
+        return format_attrs(self._fmt)
+
+    def _color_layout(self):
+        """
+        Returns ``fmt`` split at its color placeholders as a `_ColorLayout`,
+        or None if it uses them in another way. Cached until ``_fmt`` is
+        replaced.
+        """
+        fmt, layout = self._layout
+        if fmt is not self._fmt:
+            fmt = self._fmt
+            split = _split_color_fields(fmt)
+            layout = None if split is None else _ColorLayout(fmt, split[0], split[1], self._compiled is not None)
+            self._layout = (fmt, layout)
+        return layout
 
     def format(self, record):
+        codes = self._color_codes
+        if codes is None:
+            codes = self._detect_colors()
+        if self.stage is not None:
+            layout = self._color_layout()
+            if layout is not None:
+                return self._format_staged(record, codes, layout)
+        if codes:
+            fmt = self._fmt
+            compiled = self._compiled
+            record.color, record.end_color = codes.get(record.levelno, _NO_COLOR_CODES)
+        else:
+            # Colorless formatters leave record.color and record.end_color
+            # alone, unless the format can't do without them
+            fmt, compiled, needs_color = self._colorless_format()
+            if needs_color:
+                record.color = record.end_color = ''
+
+        if compiled is not None and compiled.fmt is fmt:
+            return self._format_compiled(record, compiled)
+
+        self._format_message(record)
+
+        record.asctime = self.formatTime(record, self.datefmt)
+# replacement here!
+        formatted = fmt % record.__dict__
+
+        formatted = self._append_exception(record, formatted)
+        return formatted.replace("\n", "\n    ")
+
+    def _format_staged(self, record, codes, layout):
+        texts = self.stage.render(self, record, layout)
+        if codes:
+            color, end_color = codes.get(record.levelno, _NO_COLOR_CODES)
+            parts = [texts[0]]
+            for marker, text in zip(layout.markers, texts[1:]):
+                parts.append(color if marker == 'color' else end_color)
+                parts.append(text)
+            formatted = ''.join(parts)
+        else:
+            formatted = ''.join(texts)
+
+        if record.exc_info or record.exc_text:
+            formatted = self._append_exception(record, formatted)
+        if "\n" in formatted:
+            formatted = formatted.replace("\n", "\n    ")
+        return formatted
+
+    def _render_pieces(self, record, layout):
+        """
+        Renders the pieces of ``fmt`` between its color placeholders, the
+        work shared through the `FormatStage`.
+        """
+        self._format_message(record)
+        if layout.uses_time:
+            record.asctime = self.formatTime(record, self.datefmt)
+        d = record.__dict__
+        if layout.compiled is not None:
+            pieces = layout.compiled
+            if layout.uses_site and self.callsites:
+                site = self.callsites.lookup(record)
+                if site is not None:
+                    pieces = site.format_for(layout)
+            return [compiled.template % compiled.getter(d) for compiled in pieces]
+        return [piece % d for piece in layout.pieces]
+
+    def _format_compiled(self, record, compiled):
+        self._format_message(record)
+
+        if compiled.uses_site and self.callsites:
+            site = self.callsites.lookup(record)
+            if site is not None:
+                compiled = site.format_for(compiled)
+
+        if compiled.uses_time:
+            record.asctime = self.formatTime(record, self.datefmt)
+
+        formatted = compiled.template % compiled.getter(record.__dict__)
+
+        if record.exc_info or record.exc_text:
+            formatted = self._append_exception(record, formatted)
+        if "\n" in formatted:
+            formatted = formatted.replace("\n", "\n    ")
+        return formatted
+
+    def formatTime(self, record, datefmt=None):
+        """
+        Same as `logging.Formatter.formatTime`, but the rendered timestamp is
+        cached for the current second, so only the first record of every
+        second pays for ``strftime``. The cache key includes the converter and
+        the timezone settings, a ``time.tzset()`` therefore invalidates it.
+        Milliseconds of the default date format are added per record.
+        """
+        key = (int(record.created), datefmt, self.converter,
+               time.timezone, time.altzone, time.daylight, time.tzname)
+        cached_key, s = self._time_cache
+        if cached_key != key:
+            ct = self.converter(record.created)
+            s = time.strftime(datefmt or getattr(self, 'default_time_format', '%Y-%m-%d %H:%M:%S'), ct)
+            # A single tuple assignment, so concurrent threads never see a
+            # key paired with another second's timestamp.
+            self._time_cache = (key, s)
+
+        if not datefmt:
+            msec_format = getattr(self, 'default_msec_format', '%s,%03d')
+            if msec_format:
+                s = msec_format % (s, record.msecs)
+        return s
+
+    def _format_message(self, record):
         try:
             message = record.getMessage()
             assert isinstance(message,
@@ -229,20 +610,20 @@ class LogFormatter(logging.Formatter):
         except Exception as e:
             record.message = "Bad message (%r): %r" % (e, record.__dict__)
 
-        record.asctime = self.formatTime(record, self.datefmt)
-
-        if record.levelno in self._colors:
-            record.color = self._colors[record.levelno]
-            record.end_color = self._normal
-        else:
-            record.color = record.end_color = ''
-# replacement here!
-        formatted = self._fmt % record.__dict__
+    def formatException(self, ei):
+        if self.tracebacks:
+            return self.tracebacks.format(ei)
+        return logging.Formatter.formatException(self, ei)
 
+    def _append_exception(self, record, formatted):
         if record.exc_info:
             if not record.exc_text:
                 record.exc_text = self.formatException(record.exc_info)
-        if record.exc_text:
+        exc_text = record.exc_text
+        if exc_text and isinstance(exc_text, unicode_type):
+            # Nothing to convert
+            formatted = formatted.rstrip() + '\n' + exc_text
+        elif exc_text:
             # exc_text contains multiple lines.  We need to _safe_unicode
             # each line separately so that non-utf8 bytes don't cause
             # all the newlines to turn into '\n'.
@@ -250,10 +631,208 @@ class LogFormatter(logging.Formatter):
             lines.extend(
                 _safe_unicode(ln) for ln in record.exc_text.split('\n'))
             formatted = '\n'.join(lines)
-        return formatted.replace("\n", "\n    ")
+        return formatted
+
+
+# Matches the ``%(key)spec`` placeholders and ``%%`` escapes of a format string
+# (compiled by the re module's cache on first use)
+_FORMAT_FIELD_PATTERN = (
+    r'%(?:\((?P<key>[^)]*)\)(?P<spec>[#0 +\-]*\d*(?:\.\d+)?[diouxXeEfFgGcrsa])'
+    r'|(?P<escape>%))')
+
+
+class _CompiledFormat(object):
+    """
+    A ``%(key)s`` style format string, parsed once into a positional template
+    and the record attributes which feed it.
+    """
+    def __init__(self, fmt, parts):
+        # Literal text and (key, spec) of the placeholders, alternating
+        self.fmt = fmt
+        self.parts = parts
+        template = []
+        keys = []
+        for part in parts:
+            if isinstance(part, tuple):
+                template.append('%' + part[1])
+                keys.append(part[0])
+            else:
+                template.append(part)
+        self.template = ''.join(template)
+        self.keys = keys = tuple(keys)
+        self.uses_site = not SITE_ATTRS.isdisjoint(keys)
+        self.uses_time = 'asctime' in keys
+        self.uses_color = 'color' in keys or 'end_color' in keys
+        if len(keys) == 1:
+            key = keys[0]
+            self.getter = lambda d: (d[key],)
+        elif keys:
+            self.getter = itemgetter(*keys)
+        else:
+            self.getter = lambda d: ()
+
+    def specialize(self, site):
+        """
+        Returns this format with the attributes of the `CallSite` rendered
+        into the template, so that they aren't rendered for every record.
+        """
+        parts = []
+        for part in self.parts:
+            if isinstance(part, tuple) and part[0] in SITE_ATTRS:
+                try:
+                    part = ('%' + part[1]) % getattr(site, part[0])
+                except (TypeError, ValueError):
+                    return self
+                part = part.replace('%', '%%')
+            parts.append(part)
+        return _CompiledFormat(self.fmt, parts)
+
+
+def _compile_format(fmt):
+    """
+    Turns ``fmt`` into a `_CompiledFormat` whose ``template % getter(d)``
+    renders exactly like ``fmt % d``. Returns None if the format string uses
+    anything besides named placeholders and ``%%``.
+    """
+    parts = []
+    pos = 0
+    for match in re.finditer(_FORMAT_FIELD_PATTERN, fmt):
+        parts.append(fmt[pos:match.start()])
+        if match.group('escape'):
+            parts.append('%%')
+        else:
+            parts.append((match.group('key'), match.group('spec')))
+        pos = match.end()
+    parts.append(fmt[pos:])
+
+    # Any '%' left in the literal text is a placeholder we don't understand
+    if any('%' in literal for literal in parts[::2]):
+        return None
+    return _CompiledFormat(fmt, parts)
+
+
+_NO_COLOR_CODES = ('', '')
+
+# Used by the formatters which aren't given a TracebackCache
+_default_tracebacks = TracebackCache()
+
+
+def _split_color_fields(fmt):
+    """
+    Splits ``fmt`` at its ``%(color)s`` and ``%(end_color)s`` placeholders.
+    Returns the pieces between them and the names of the placeholders, or
+    None if it uses ``color`` or ``end_color`` with another conversion (eg.
+    ``%(color)r``).
+    """
+    pieces = []
+    markers = []
+    pos = 0
+    for match in re.finditer(_FORMAT_FIELD_PATTERN, fmt):
+        key = match.group('key')
+        if key in ('color', 'end_color'):
+            if match.group('spec') != 's':
+                return None
+            pieces.append(fmt[pos:match.start()])
+            markers.append(key)
+            pos = match.end()
+    pieces.append(fmt[pos:])
+    return pieces, markers
+
+
+def _strip_color_fields(fmt):
+    """
+    Returns ``fmt`` without its ``%(color)s`` and ``%(end_color)s``
+    placeholders, or None if it uses them in another way.
+    """
+    split = _split_color_fields(fmt)
+    return None if split is None else ''.join(split[0])
+
+
+# Set by the formatter, or in between the pieces of a _ColorLayout
+_DERIVED_ATTRS = frozenset(['message', 'asctime', 'color', 'end_color'])
+_TIME_ATTRS = frozenset(['created', 'msecs'])
+_STAGE_ATTRS = ('msg', 'args', 'levelno')
+
+
+class _ColorLayout(object):
+    """
+    A format string split at its color placeholders: ``fmt`` renders like
+    ``pieces[0] + markers[0] + pieces[1] + ...``.
+    """
+    def __init__(self, fmt, pieces, markers, compiled):
+        self.fmt = fmt
+        self.pieces = pieces
+        self.markers = markers
+        self.compiled = None
+        # The default mode sets record.asctime whether it's used or not
+        self.uses_time = True
+        self.uses_site = False
+        # The record attributes the rendering depends on, see FormatStage
+        attrs = format_attrs(fmt)
+        if 'asctime' in attrs:
+            attrs = attrs | _TIME_ATTRS
+        self.attrs = _STAGE_ATTRS + tuple(sorted(attrs - _DERIVED_ATTRS))
+        if compiled:
+            compiled_pieces = [_compile_format(piece) for piece in pieces]
+            if None not in compiled_pieces:
+                self.compiled = compiled_pieces
+                self.uses_time = any(piece.uses_time for piece in compiled_pieces)
+                self.uses_site = any(piece.uses_site for piece in compiled_pieces)
+
+    def specialize(self, site):
+        """
+        Returns the compiled pieces with the attributes of the `CallSite`
+        rendered in, see `_CompiledFormat.specialize`.
+        """
+        return [piece.specialize(site) if piece.uses_site else piece for piece in self.compiled]
+
+
+class FormatStage(object):
+    """
+    Renders records once for all the `LogFormatter` instances sharing it,
+    which then only add their colors. The formatters of the stderr and the
+    logfile handler created by `setup_logger(..)` share a stage.
+
+    The message, the timestamp, the format string and the traceback are
+    rendered by the first formatter, and reused by all formatters with the
+    same format string and date format. Only the last record is kept (by weak
+    reference), handlers which format records later (eg. in a background
+    thread) render them again. So does a formatter which gets the record
+    changed, eg. by a filter of its handler which redacts the message: the
+    message, its arguments, the level and the attributes in the format are
+    compared (by identity) with the ones rendered.
+    """
+    def __init__(self):
+        # (weak reference to the last record, {key: rendered pieces})
+        self._cache = (None, None)
+
+    def render(self, formatter, record, layout):
+        ref, rendered = self._cache
+        if ref is None or ref() is not record:
+            # A single tuple assignment, so concurrent threads never pair a
+            # record with the pieces of another one
+            rendered = {}
+            self._cache = (weakref.ref(record), rendered)
+        key = (type(formatter), layout.fmt, formatter.datefmt, formatter.converter)
+        d = record.__dict__
+        values = [d.get(attr) for attr in layout.attrs]
+        cached = rendered.get(key)
+        if cached is not None and all(value is old for value, old in zip(values, cached[0])):
+            return cached[1]
+        texts = formatter._render_pieces(record, layout)
+        rendered[key] = (values, texts)
+        return texts
+
+
+# Color support of terminals by (file descriptor, $TERM)
+_terminal_colors = {}
 
 
 def _stderr_supports_color():
+    return _stream_supports_color(sys.stderr)
+
+
+def _stream_supports_color(stream=None):
     # Colors can be forced with an env variable
     if os.getenv('LOGZERO_FORCE_COLOR') == '1':
         return True
@@ -262,17 +841,30 @@ def _stderr_supports_color():
     if os.name == 'nt':
         return True
 
-    # Detect color support of stderr with curses (Linux/macOS)
-    if curses and hasattr(sys.stderr, 'isatty') and sys.stderr.isatty():
-        try:
-            curses.setupterm()
-            if curses.tigetnum("colors") > 0:
-                return True
+    if stream is None:
+        stream = sys.stderr
+    try:
+        if not stream.isatty():
+            return False
+        fd = stream.fileno()
+    except Exception:
+        return False
+
+    key = (fd, os.getenv('TERM'))
+    supported = _terminal_colors.get(key)
+    if supported is None:
+        supported = _terminal_colors[key] = _terminal_supports_color(fd)
+    return supported
 
-        except Exception:
-            pass
 
-    return False
+def _terminal_supports_color(fd):
+    # Detect color support of the terminal with curses (Linux/macOS)
+    try:
+        import curses
+        curses.setupterm(fd=fd)
+        return curses.tigetnum("colors") > 0
+    except Exception:
+        return False
 
 
 _TO_UNICODE_TYPES = (unicode_type, type(None))
@@ -300,7 +892,8 @@ def _safe_unicode(s):
 
 
 def setup_default_logger(logfile=None, level=logging.DEBUG, formatter=None,
-                         maxBytes=0, backupCount=0, disableStderrLogger=False):
+                         maxBytes=0, backupCount=0, disableStderrLogger=False,
+                         rateLimit=None):
     """
     Deprecated. Use `logzero.loglevel(..)`, `logzero.logfile(..)`, etc.
 
@@ -320,11 +913,13 @@ def setup_default_logger(logfile=None, level=logging.DEBUG, formatter=None,
     :arg int maxBytes: Size of the logfile when rollover should occur. Defaults to 0, rollover never occurs.
     :arg int backupCount: Number of backups to keep. Defaults to 0, rollover never occurs.
     :arg bool disableStderrLogger: Should the default stderr logger be disabled. Defaults to False.
+    :arg rateLimit: Let at most this many records per second through for every message template and call site, see `setup_logger(..)`. Defaults to None (no limit).
     """
     global logger
     logger = setup_logger(name=LOGZERO_DEFAULT_LOGGER, logfile=logfile,
                           level=level, formatter=formatter,
-                          disableStderrLogger=disableStderrLogger)
+                          disableStderrLogger=disableStderrLogger,
+                          rateLimit=rateLimit)
     return logger
 
 
@@ -343,21 +938,68 @@ def reset_default_logger():
                           level=_loglevel, formatter=_formatter)
 
 
-# Initially setup the default logger
-reset_default_logger()
+class _LazyLogger(object):
+    """
+    Stands in for the default logger in lazy mode, and sets it up when it is
+    first used.
+    """
+    def __getattr__(self, name):
+        return getattr(_default_logger(), name)
+
+    def __setattr__(self, name, value):
+        setattr(_default_logger(), name, value)
+
+    def __repr__(self):
+        return repr(_default_logger())
 
 
-def loglevel(level=logging.DEBUG, update_custom_handlers=False):
+_lazy_lock = threading.Lock()
+
+
+def _default_logger():
+    if isinstance(logger, _LazyLogger):
+        with _lazy_lock:
+            if isinstance(logger, _LazyLogger):
+                reset_default_logger()
+    return logger
+
+
+# Initially setup the default logger. With LOGZERO_LAZY=1 this happens when
+# `logzero.logger` is first used, for a faster `import logzero`.
+if os.getenv('LOGZERO_LAZY') == '1':
+    logger = _LazyLogger()
+else:
+    reset_default_logger()
+
+
+def loglevel(level=logging.DEBUG, update_custom_handlers=False, sampling=_UNCHANGED, adaptiveLevel=_UNCHANGED):
     """
     Set the minimum loglevel for the default logger (`logzero.logger`).
 
     This reconfigures only the internal handlers of the default logger (eg. stream and logfile).
     You can also update the loglevel for custom handlers by using `update_custom_handlers=True`.
 
+    Usage:
+
+    .. code-block:: python
+
+        import logging
+        import logzero
+
+        # Keep 1% of the debug and 10% of the info records, drop debug (and then info)
+        # records while more than 1000 records per second are logged
+        logzero.loglevel(logging.DEBUG, sampling={logging.DEBUG: 0.01, logging.INFO: 0.1}, adaptiveLevel=1000)
+
     :arg int level: Minimum `logging-level <https://docs.python.org/2/library/logging.html#logging-levels>`_ to display (default: `logging.DEBUG`).
     :arg bool update_custom_handlers: If you added custom handlers to this logger and want this to update them too, you need to set `update_custom_handlers` to `True`
+    :arg sampling: Keep only a fraction of the records of some levels, see `setup_logger(..)`. None keeps all records. Defaults to the current setting.
+    :arg adaptiveLevel: Raise the minimum level while the logger is overloaded, see `setup_logger(..)`. None turns it off. Defaults to the current setting.
     """
     logger.setLevel(level)
+    if adaptiveLevel is not _UNCHANGED:
+        _set_adaptive_level(logger, adaptiveLevel)
+    if sampling is not _UNCHANGED:
+        _set_sampling(logger, sampling)
 
     # Reconfigure existing internal handlers
     for handler in list(logger.handlers):
@@ -395,7 +1037,11 @@ def formatter(formatter, update_custom_handlers=False):
 
 
 def logfile(filename, formatter=None, mode='a', maxBytes=0, backupCount=0,
-            encoding=None, loglevel=None, disableStderrLogger=False):
+            encoding=None, loglevel=None, disableStderrLogger=False,
+            async_mode=False, queueSize=10000, queueOverflow='block',
+            batch_mode=False, rotation=None, compression=None,
+            compressionLevel=None, multiprocess=False, spool=None,
+            binary=False):
     """
     Setup logging to file (using a `RotatingFileHandler <https://docs.python.org/2/library/logging.handlers.html#rotatingfilehandler>`_ internally).
 
@@ -420,16 +1066,30 @@ def logfile(filename, formatter=None, mode='a', maxBytes=0, backupCount=0,
     :arg string encoding: Used to open the file with that encoding.
     :arg int loglevel: Set a custom loglevel for the file logger, else uses the current global loglevel.
     :arg bool disableStderrLogger: Should the default stderr logger be disabled. Defaults to False.
+    :arg bool async_mode: Write to the logfile from a background thread, so that logging calls don't wait for the disk. Queued records are written out on exit. See :class:`logzero.handlers.AsyncHandler`. For asyncio applications use ``asyncio``: records are queued on the event loop, and ``await logzero.aio.flush()`` waits until they are written. See :class:`logzero.aio.AsyncioHandler`. Defaults to False.
+    :arg int queueSize: Maximum number of records waiting to be written in ``async_mode``. Defaults to 10000.
+    :arg string queueOverflow: What to do when the queue is full in ``async_mode``: ``block`` (default), ``drop_oldest``, ``drop_newest`` or ``sample``.
+    :arg bool batch_mode: Buffer records in memory and write them in batches: when 64 KiB are collected, after one second, or immediately for errors. See :class:`logzero.handlers.BufferedRotatingFileHandler`. With ``per_thread`` every thread buffers its records without taking a lock, for many threads logging at once, see :class:`logzero.handlers.ThreadBufferedFileHandler`. Defaults to False.
+    :arg string rotation: Rotate with :class:`logzero.handlers.FastRotatingFileHandler`, which tracks the file size in memory and renames backups in a background thread. ``numbered`` keeps the backup names described above, with ``timestamp`` the logfile is renamed to eg. app.log.20170213-150200-123456 and never renamed again. Defaults to None (standard ``RotatingFileHandler``).
+    :arg string compression: Compress rotated logfiles in a background thread with ``gzip``, ``zstd`` or ``lz4`` (the latter two need the ``zstandard``/``lz4`` packages), eg. to app.log.1.gz. ``backupCount`` counts the compressed files. Defaults to None.
+    :arg int compressionLevel: Level for ``compression``, defaults to the default level of the compression.
+    :arg bool multiprocess: Set this in every process logging to the same file (eg. gunicorn or multiprocessing workers). Only one process writes and rotates the logfile, the others send their records to it over a Unix socket. Call it before forking to let the parent process write the logfile. See :class:`logzero.multiprocess.MultiprocessHandler`. Defaults to False.
+    :arg string spool: Put records into this spool file on disk first, and write them to the logfile from a background thread, so that logging calls don't wait for a slow disk or network filesystem. The spool file has a fixed size (64 MiB), and records which can't be written within 5 seconds when the process exits are written by the next process using it. See :class:`logzero.spool.SpoolHandler`. Defaults to None.
+    :arg bool binary: Write records in a compact binary format instead of text lines: the messages are only formatted when the logfile is read with ``python -m logzero.decode``. Records are written in batches like with ``batch_mode``. See :class:`logzero.binary.BinaryFileHandler`. Defaults to False.
     """
     # Step 1: If an internal RotatingFileHandler already exists, remove it
     __remove_internal_loggers(logger, disableStderrLogger)
 
     # Step 2: If wanted, add the RotatingFileHandler now
     if filename:
-        rotating_filehandler = RotatingFileHandler(filename, mode=mode,
-                                                   maxBytes=maxBytes,
-                                                   backupCount=backupCount,
-                                                   encoding=encoding)
+        rotating_filehandler = _create_logfile_handler(
+            filename, formatter or _formatter or LogFormatter(color=False, stage=_format_stage(logger)),
+            mode=mode, maxBytes=maxBytes, backupCount=backupCount,
+            encoding=encoding, async_mode=async_mode, queueSize=queueSize,
+            queueOverflow=queueOverflow, batch_mode=batch_mode,
+            rotation=rotation, compression=compression,
+            compressionLevel=compressionLevel, multiprocess=multiprocess,
+            spool=spool, binary=binary)
 
         # Set internal attributes on this handler
         setattr(rotating_filehandler, LOGZERO_INTERNAL_LOGGER_ATTR, True)
@@ -439,8 +1099,6 @@ def logfile(filename, formatter=None, mode='a', maxBytes=0, backupCount=0,
 
         # Configure the handler and add it to the logger
         rotating_filehandler.setLevel(loglevel or _loglevel)
-        rotating_filehandler.setFormatter(formatter or _formatter or
-                                          LogFormatter(color=False))
         logger.addHandler(rotating_filehandler)
 
 
@@ -452,44 +1110,340 @@ def __remove_internal_loggers(logger_to_update, disableStderrLogger=True):
     """
     for handler in list(logger_to_update.handlers):
         if hasattr(handler, LOGZERO_INTERNAL_LOGGER_ATTR):
-            if isinstance(handler, RotatingFileHandler):
-                logger_to_update.removeHandler(handler)
-            elif isinstance(handler, SysLogHandler):
-                logger_to_update.removeHandler(handler)
-            elif isinstance(handler, logging.StreamHandler) and disableStderrLogger:
+            if _is_logfile_handler(handler):
+                _remove_internal_handler(logger_to_update, handler)
+            elif not isinstance(handler, logging.StreamHandler):
+                # SysLogHandler
+                _remove_internal_handler(logger_to_update, handler)
+            elif disableStderrLogger:
                 logger_to_update.removeHandler(handler)
 
 
-def syslog(logger_to_update=logger, facility=SysLogHandler.LOG_USER, disableStderrLogger=True):
+def _format_stage(logger_to_update):
+    """
+    Returns the `FormatStage` of the internal handlers of the logger, or a new
+    one if they have none.
+    """
+    for handler in logger_to_update.handlers:
+        stage = getattr(handler.formatter, 'stage', None)
+        if hasattr(handler, LOGZERO_INTERNAL_LOGGER_ATTR) and isinstance(stage, FormatStage):
+            return stage
+    return FormatStage()
+
+
+def _is_logfile_handler(handler):
+    """
+    Whether the handler writes to a logfile.
+    """
+    return isinstance(handler, logging.FileHandler) or hasattr(handler, LOGZERO_INTERNAL_LOGFILE_ATTR)
+
+
+def _remove_internal_handler(logger_to_update, handler):
+    """
+    Remove an internal logfile handler from the logger and close it. Handlers
+    which hold back records (in a queue or buffer) or rotate in the background
+    finish their work now.
+    """
+    logger_to_update.removeHandler(handler)
+    handler.close()
+
+
+def syslog(logger_to_update=logger, facility=None, disableStderrLogger=True, async_mode=False,
+           address=None, transport=None, spool=None):
     """
     Setup logging to syslog and disable other internal loggers
     :param logger_to_update: the logger to enable syslog logging for
-    :param facility: syslog facility to log to
+    :param facility: syslog facility to log to, defaults to SysLogHandler.LOG_USER
     :param disableStderrLogger: should the default stderr logger be disabled? defaults to True
-    :return the new SysLogHandler, which can be modified externally (e.g. for custom log level)
+    :param async_mode: send from a background thread (True) or, for asyncio applications, from a worker thread fed by the event loop (``asyncio``), like ``async_mode`` of `logfile(..)`. Defaults to False.
+    :param address: ``(host, port)`` or path of the Unix socket of the syslog server, defaults to the local syslog
+    :param transport: ``tcp``, ``udp`` or ``unix``: send RFC 5424 messages in batches over a persistent connection, which is re-established when it breaks, see :class:`logzero.shipping.ShippingHandler`. Defaults to None, one datagram per record with ``SysLogHandler``.
+    :param spool: put records into this spool file on disk first, from which a background thread sends them, while the syslog server is down they pile up there, see :class:`logzero.spool.SpoolHandler`. Defaults to None.
+    :return the new SysLogHandler or ShippingHandler (or the handler wrapping it with ``spool`` or in ``async_mode``), which can be modified externally (e.g. for custom log level)
     """
     # remove internal loggers
     __remove_internal_loggers(logger_to_update, disableStderrLogger)
 
     # Setup logzero to only use the syslog handler with the specified facility
-    syslog_handler = SysLogHandler(facility=facility)
+    from logging.handlers import SysLogHandler
+    if facility is None:
+        facility = SysLogHandler.LOG_USER
+    if transport is not None:
+        from logzero.shipping import ShippingHandler
+        syslog_handler = ShippingHandler(address=address, transport=transport, facility=facility)
+    elif address is not None:
+        syslog_handler = SysLogHandler(address=address, facility=facility)
+    else:
+        syslog_handler = SysLogHandler(facility=facility)
+    if spool:
+        from logzero.spool import SpoolHandler
+        syslog_handler = SpoolHandler(syslog_handler, spool)
+    if async_mode:
+        from logzero.handlers import AsyncHandler, ASYNC_MODE_ASYNCIO
+        if async_mode == ASYNC_MODE_ASYNCIO:
+            from logzero.aio import AsyncioHandler
+            syslog_handler = AsyncioHandler(syslog_handler)
+        else:
+            syslog_handler = AsyncHandler(syslog_handler)
     setattr(syslog_handler, LOGZERO_INTERNAL_LOGGER_ATTR, True)
     logger_to_update.addHandler(syslog_handler)
     return syslog_handler
 
 
-def log_function_call(func):
-    @functools.wraps(func)
-    def wrap(*args, **kwargs):
-        args_str = ", ".join([str(arg) for arg in args])
-        kwargs_str = ", ".join(["%s=%s" % (key, kwargs[key])
+def ratelimit(rateLimit=10):
+    """
+    Rate limit the default logger (`logzero.logger`): let at most ``rateLimit``
+    records per second through for every message template and call site, and
+    log how many similar messages were suppressed.
+
+    Usage:
+
+    .. code-block:: python
+
+        import logzero
+        logzero.ratelimit(5)
+
+    :arg rateLimit: Records per second, or a :class:`logzero.filters.RateLimitFilter`. None removes the limit.
+    :return: The new RateLimitFilter, or None.
+    """
+    return _set_rate_limit(logger, rateLimit)
+
+
+class LazyValue(object):
+    """
+    A log message argument which is only computed when the message is
+    formatted, see `lazy(..)`.
+    """
+    __slots__ = ('_func', '_args', '_kwargs', '_value', '_evaluated')
+
+    def __init__(self, func, *args, **kwargs):
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self._value = None
+        self._evaluated = False
+
+    def value(self):
+        """
+        Returns the result of the function, which is called only once.
+        """
+        if not self._evaluated:
+            self._value = self._func(*self._args, **self._kwargs)
+            self._evaluated = True
+            self._func = self._args = self._kwargs = None
+        return self._value
+
+    def __str__(self):
+        return str(self.value())
+
+    def __repr__(self):
+        return repr(self.value())
+
+    def __format__(self, format_spec):
+        return format(self.value(), format_spec)
+
+    # For %d, %x, %f, ...
+    def __int__(self):
+        return int(self.value())
+
+    def __float__(self):
+        return float(self.value())
+
+    def __index__(self):
+        return operator.index(self.value())
+
+
+def lazy(func, *args, **kwargs):
+    """
+    Defers an expensive log message argument until a handler actually formats
+    the message. Logging calls below the minimum loglevel (of the logger or of
+    all handlers) never call ``func``, and it is called at most once even when
+    several handlers format the message.
+
+    Usage:
+
+    .. code-block:: python
+
+        from logzero import logger, lazy
+
+        logger.debug("state: %s", lazy(json.dumps, state, indent=2))
+        logger.debug("took %s", lazy(lambda: time.time() - start))
+
+    :arg callable func: Function which computes the value, called with ``args`` and ``kwargs``.
+    :return: A `LazyValue` to pass as argument of the logging call. ``%s`` and ``%r`` use the ``str()`` and ``repr()`` of the computed value, ``%d``, ``%x``, ``%f`` etc. the number.
+    """
+    return LazyValue(func, *args, **kwargs)
+
+
+def _truncate(text, maxLength):
+    if maxLength is not None and len(text) > maxLength:
+        return text[:maxLength] + "..."
+    return text
+
+
+# Clocks for the durations of log_function_call
+_wall_clock = getattr(time, 'perf_counter', time.time)
+_cpu_clock = getattr(time, 'thread_time', None) or getattr(time, 'process_time', None) or time.clock
+
+
+class _CallLogger(object):
+    """
+    The settings of a function decorated with `log_function_call(..)`, and
+    the logging before and after each of its calls.
+    """
+    def __init__(self, func, logger_to_use, level, timing, logResult,
+                 logExceptions, maxRepr, sampleRate, maxPerSecond):
+        self.name = func.__name__
+        self.logger_to_use = logger_to_use
+        self.level = level
+        self.timing = timing
+        self.logResult = logResult
+        self.logExceptions = logExceptions
+        self.maxRepr = maxRepr
+        self.sampleRate = sampleRate
+        self.maxPerSecond = maxPerSecond
+        # Without anything to report after the call, it is logged before
+        self.log_after = timing or logResult or logExceptions
+        self._calls = itertools.count()
+        self._window = (None, 0)
+
+    def begin(self, args, kwargs, cpu=True):
+        """
+        Called before the function. Returns None if nothing is left to do for
+        this call, else the state to pass to `end(..)`.
+        """
+        _logger = self.logger_to_use or logger
+        if not _logger.isEnabledFor(self.level):
+            return None
+        if self.sampleRate > 1 and next(self._calls) % self.sampleRate:
+            return None
+        if self.maxPerSecond is not None and not self._within_rate():
+            return None
+
+        if not self.log_after:
+            _logger.log(self.level, "%s(%s)", self.name,
+                        lazy(self._format_args, args, kwargs))
+            return None
+        return (_logger, args, kwargs, _wall_clock(), _cpu_clock() if cpu else None)
+
+    def end(self, call, result=None, exception=None, loop=None):
+        """
+        Called after the function returned ``result`` or raised ``exception``.
+        ``loop`` is the time a coroutine ran on the event loop.
+        """
+        _logger, args, kwargs, wall_start, cpu_start = call
+        wall = _wall_clock() - wall_start
+        cpu = None if cpu_start is None else _cpu_clock() - cpu_start
+        if exception is not None and not self.logExceptions and not self.timing:
+            return
+        _logger.log(self.level, "%s(%s)%s", self.name,
+                    lazy(self._format_args, args, kwargs),
+                    lazy(self._format_outcome, result, exception, wall, cpu, loop))
+
+    def _within_rate(self):
+        second = int(time.time())
+        window_second, count = self._window
+        if window_second != second:
+            self._window = (second, 1)
+            return True
+        if count < self.maxPerSecond:
+            self._window = (second, count + 1)
+            return True
+        return False
+
+    def _format_args(self, args, kwargs):
+        args_str = ", ".join([_truncate(str(arg), self.maxRepr) for arg in args])
+        kwargs_str = ", ".join(["%s=%s" % (key, _truncate(str(kwargs[key]), self.maxRepr))
                                 for key in kwargs])
         if args_str and kwargs_str:
-            all_args_str = ", ".join([args_str, kwargs_str])
-        else:
-            all_args_str = args_str or kwargs_str
-        logger.debug("%s(%s)", func.__name__, all_args_str)
-        return func(*args, **kwargs)
+            return ", ".join([args_str, kwargs_str])
+        return args_str or kwargs_str
+
+    def _format_outcome(self, result, exception, wall, cpu, loop=None):
+        outcome = ""
+        if exception is not None:
+            if self.logExceptions:
+                outcome = " raised %s" % _truncate(repr(exception), self.maxRepr)
+        elif self.logResult:
+            outcome = " -> %s" % _truncate(repr(result), self.maxRepr)
+        if self.timing:
+            if loop is not None:
+                outcome += " [%.3f ms, on loop %.3f ms]" % (wall * 1000, loop * 1000)
+            elif cpu is None:
+                outcome += " [%.3f ms]" % (wall * 1000)
+            else:
+                outcome += " [%.3f ms, cpu %.3f ms]" % (wall * 1000, cpu * 1000)
+        return outcome
+
+
+def log_function_call(func=None, logger_to_use=None, level=logging.DEBUG,
+                      timing=False, logResult=False, logExceptions=False,
+                      maxRepr=None, sampleRate=1, maxPerSecond=None):
+    """
+    Decorator which logs calls of the decorated function with their arguments.
+    Without any of ``timing``, ``logResult`` or ``logExceptions`` the call is
+    logged before the function runs, else once it returned.
+
+    Usage:
+
+    .. code-block:: python
+
+        from logzero import log_function_call
+
+        @log_function_call
+        def add(a, b):
+            return a + b
+
+        @log_function_call(level=logging.INFO, timing=True, logResult=True, sampleRate=100)
+        def handle_request(request):
+            ...
+
+    Coroutine functions, generator functions and async generator functions
+    are supported as well (Python 3.6+). For these, the duration covers the
+    whole coroutine or iteration and the CPU time isn't measured, as other
+    tasks run in between. The result of generators is their return value.
+
+    If the logger doesn't log ``level``, the function is called directly.
+
+    :arg Logger logger_to_use: The logger to log to. Defaults to `logzero.logger`.
+    :arg int level: The `logging-level <https://docs.python.org/2/library/logging.html#logging-levels>`_ of the messages. Defaults to ``logging.DEBUG``.
+    :arg bool timing: Log the wall clock time and the CPU time (of the calling thread) of the call.
+    :arg bool logResult: Log the ``repr()`` of the return value.
+    :arg bool logExceptions: Log the ``repr()`` of exceptions raised by the function (they are re-raised).
+    :arg int maxRepr: Truncate the string of every argument, result and exception to this many characters.
+    :arg int sampleRate: Only log one out of this many calls.
+    :arg int maxPerSecond: Log at most this many calls per second.
+    """
+    if func is None:
+        return functools.partial(log_function_call, logger_to_use=logger_to_use,
+                                 level=level, timing=timing, logResult=logResult,
+                                 logExceptions=logExceptions, maxRepr=maxRepr,
+                                 sampleRate=sampleRate, maxPerSecond=maxPerSecond)
+    if not callable(func):
+        raise TypeError("log_function_call needs a function, got %r. "
+                        "Pass options as keyword arguments." % (func, ))
+
+    call_logger = _CallLogger(func, logger_to_use, level, timing, logResult,
+                              logExceptions, maxRepr, sampleRate, maxPerSecond)
+
+    if sys.version_info >= (3, 6):
+        from logzero import _wrappers
+        wrapper = _wrappers.async_wrapper(func, call_logger)
+        if wrapper is not None:
+            return wrapper
+
+    @functools.wraps(func)
+    def wrap(*args, **kwargs):
+        call = call_logger.begin(args, kwargs)
+        if call is None:
+            return func(*args, **kwargs)
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            call_logger.end(call, exception=e)
+            raise
+        call_logger.end(call, result=result)
+        return result
     return wrap
 
 
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Copies of log records to hand them to other threads, and conversion of log
+records to bytes and back, to pass them to other processes.
+
+Records are encoded as JSON, not pickled: unpickling data from a socket
+could run arbitrary code, and JSON doesn't depend on the classes of the
+arguments being importable on the receiving side.
+"""
+import copy
+import json
+import logging
+
+
+def merged_copy(record):
+    """
+    Returns a copy of the record with the message already merged with its
+    arguments, as they may be changed by the caller before another thread
+    gets to the record.
+    """
+    record = copy.copy(record)
+    try:
+        record.msg = record.getMessage()
+        record.args = None
+    except Exception:
+        # Leave it to the handler to report the broken record
+        pass
+    return record
+
+
+def record_to_bytes(record):
+    """
+    Encodes the record as a JSON object. The message is merged with its
+    arguments and the traceback rendered into ``exc_text``, values which JSON
+    can't represent are converted with ``str()``.
+    """
+    attrs = dict(record.__dict__)
+    attrs['msg'] = record.getMessage()
+    attrs['args'] = None
+    if record.exc_info:
+        if not record.exc_text:
+            record.exc_text = _formatter.formatException(record.exc_info)
+        attrs['exc_text'] = record.exc_text
+    attrs['exc_info'] = None
+    from logzero import formatters
+    return formatters._dumps(attrs).encode('utf-8')
+
+
+def record_from_bytes(data):
+    """
+    Decodes a record encoded with `record_to_bytes`.
+    """
+    return logging.makeLogRecord(json.loads(data.decode('utf-8')))
+
+
+_formatter = logging.Formatter()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Wrappers of `logzero.log_function_call` for coroutine functions, generator
+functions and async generator functions. Needs Python 3.6+.
+"""
+import functools
+import inspect
+
+
+def async_wrapper(func, call_logger):
+    """
+    Returns the wrapper matching the kind of ``func``, or None for plain functions.
+    """
+    if inspect.iscoroutinefunction(func):
+        return _wrap_coroutine_function(func, call_logger)
+    if inspect.isasyncgenfunction(func):
+        return _wrap_async_generator_function(func, call_logger)
+    if inspect.isgeneratorfunction(func):
+        return _wrap_generator_function(func, call_logger)
+    return None
+
+
+def _wrap_coroutine_function(func, call_logger):
+    @functools.wraps(func)
+    async def wrap(*args, **kwargs):
+        call = call_logger.begin(args, kwargs, cpu=False)
+        if call is None:
+            return await func(*args, **kwargs)
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            call_logger.end(call, exception=e)
+            raise
+        call_logger.end(call, result=result)
+        return result
+    return wrap
+
+
+def _wrap_generator_function(func, call_logger):
+    @functools.wraps(func)
+    def wrap(*args, **kwargs):
+        call = call_logger.begin(args, kwargs, cpu=False)
+        if call is None:
+            return (yield from func(*args, **kwargs))
+        try:
+            result = yield from func(*args, **kwargs)
+        except Exception as e:
+            call_logger.end(call, exception=e)
+            raise
+        call_logger.end(call, result=result)
+        return result
+    return wrap
+
+
+def _wrap_async_generator_function(func, call_logger):
+    # Values sent with asend() are not passed on to the wrapped generator
+    @functools.wraps(func)
+    async def wrap(*args, **kwargs):
+        call = call_logger.begin(args, kwargs, cpu=False)
+        if call is None:
+            async for item in func(*args, **kwargs):
+                yield item
+            return
+        try:
+            async for item in func(*args, **kwargs):
+                yield item
+        except Exception as e:
+            call_logger.end(call, exception=e)
+            raise
+        call_logger.end(call)
+    return wrap
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+Logging from asyncio applications without blocking the event loop.
+
+* `AsyncioHandler` queues records on the event loop and writes them with
+  another handler in a worker thread.
+* `flush()` and `aclose()` wait for the queued records of a logger.
+* `log_function_call` logs calls of coroutine functions with the time they
+  ran on the event loop.
+
+Needs Python 3.5+.
+"""
+import asyncio
+import collections
+import functools
+import inspect
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from logzero._records import merged_copy
+from logzero.handlers import (OVERFLOW_BLOCK, OVERFLOW_DROP_NEWEST, OVERFLOW_POLICIES,
+                              OVERFLOW_SAMPLE)
+
+_get_running_loop = getattr(asyncio, '_get_running_loop', None) or getattr(asyncio, 'get_running_loop')
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class AsyncioHandler(logging.Handler):
+    """
+    Makes logging calls on the event loop return without waiting for the
+    wrapped ``handler``: records are queued, and a writer task hands them in
+    batches to a worker thread, where ``handler`` formats and writes them.
+
+    The handler attaches itself to the event loop on which a record is
+    logged first (and to the next one once that loop has stopped). Records
+    logged from other threads are passed to the loop. Without a running
+    loop, records are handed to the worker thread directly (or written
+    immediately if there is none yet).
+
+    When the queue is full, ``overflow`` decides what happens:
+
+    * ``block``: the loop waits until the worker thread has written the
+      queued records (nothing is lost).
+    * ``drop_oldest``: discard the oldest queued record.
+    * ``drop_newest``: discard the record being logged.
+    * ``sample``: keep only every ``sampleRate``-th record while the queue
+      is full (it replaces the oldest queued record), discard the others.
+
+    Discarded records are counted in ``dropped``. Await `aflush()` to wait
+    until the queued records are written, and `aclose()` on shutdown. When
+    the loop ends (eg. with ``asyncio.run()``), the queued records are still
+    written by the worker thread.
+    """
+    # Only passes records on, see logzero.loggers.record_attrs()
+    recordAttrs = frozenset()
+
+    def __init__(self, handler, queueSize=10000, overflow=OVERFLOW_BLOCK, sampleRate=100):
+        """
+        :arg Handler handler: The handler which does the actual formatting and writing.
+        :arg int queueSize: Maximum number of records waiting for the worker thread.
+        :arg string overflow: What to do when the queue is full, one of ``block``, ``drop_oldest``, ``drop_newest`` or ``sample``.
+        :arg int sampleRate: With ``overflow='sample'``, keep one out of this many records while the queue is full.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of %s, got %r" % (", ".join(OVERFLOW_POLICIES), overflow))
+        logging.Handler.__init__(self)
+        self.handler = handler
+        self.queueSize = queueSize
+        self.overflow = overflow
+        self.sampleRate = max(1, int(sampleRate))
+        self.dropped = 0
+        self._overflowed = 0
+        self._closed = False
+        # Set up by _attach() on the first loop records are logged on
+        self._loop = None
+        self._executor = None
+        self._task = None
+        self._wakeup = None
+        # Only touched on the loop (or while it isn't running)
+        self._pending = collections.deque()
+        self._writing = False
+        self._waiters = []
+
+    def setFormatter(self, fmt):
+        # Formatting happens in the worker thread, in the wrapped handler
+        self.handler.setFormatter(fmt)
+
+    def qsize(self):
+        """
+        Returns the number of records waiting for the worker thread.
+        """
+        return len(self._pending)
+
+    def emit(self, record):
+        try:
+            running = _get_running_loop()
+            loop = self._loop
+            if running is not None and running is not loop and not self._closed and (
+                    loop is None or not loop.is_running()):
+                self._attach(running)
+                loop = running
+
+            if self._closed or loop is None or not loop.is_running():
+                records = [record]
+                if self._pending and (loop is None or not loop.is_running()):
+                    # Left behind by a loop which has ended
+                    records[:0] = self._pending
+                    self._pending.clear()
+                self._write_outside_loop(records)
+            elif running is loop:
+                self._put(merged_copy(record))
+            else:
+                loop.call_soon_threadsafe(self._put, merged_copy(record))
+        except Exception:
+            self.handleError(record)
+
+    def _attach(self, loop):
+        if self._pending:
+            # Left behind by the previous loop
+            self._write_outside_loop(list(self._pending))
+            self._pending.clear()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    def _put(self, record):
+        if len(self._pending) >= self.queueSize:
+            if self.overflow == OVERFLOW_BLOCK:
+                records = list(self._pending)
+                records.append(record)
+                self._pending.clear()
+                self._executor.submit(self._write, records).result()
+                return
+            if self.overflow == OVERFLOW_DROP_NEWEST:
+                self.dropped += 1
+                return
+            if self.overflow == OVERFLOW_SAMPLE:
+                self._overflowed += 1
+                if self._overflowed % self.sampleRate:
+                    self.dropped += 1
+                    return
+            self._pending.popleft()
+            self.dropped += 1
+        self._pending.append(record)
+        self._wakeup.set()
+
+    async def _run(self):
+        loop = self._loop
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self._pending:
+                    records = list(self._pending)
+                    self._pending.clear()
+                    self._writing = True
+                    try:
+                        # Cancelling the task mustn't cancel the write
+                        await asyncio.shield(loop.run_in_executor(self._executor, self._write, records))
+                    finally:
+                        self._writing = False
+                waiters, self._waiters = self._waiters, []
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+                if self._closed:
+                    return
+        except asyncio.CancelledError:
+            # The loop shuts down (eg. at the end of asyncio.run()), leave the
+            # rest to the worker thread
+            if self._pending:
+                self._write_outside_loop(list(self._pending))
+                self._pending.clear()
+            raise
+
+    def _write(self, records):
+        for record in records:
+            try:
+                self.handler.handle(record)
+            except Exception:
+                self.handler.handleError(record)
+
+    def _write_outside_loop(self, records):
+        if self._executor is not None:
+            try:
+                # After the records the worker thread is still writing
+                self._executor.submit(self._write, records)
+                return
+            except RuntimeError:
+                # Shut down
+                pass
+        self._write(records)
+
+    async def aflush(self):
+        """
+        Waits until the records queued so far are written, and flushes the
+        wrapped handler.
+        """
+        loop = _get_running_loop()
+        if loop is self._loop and self._task is not None and not self._task.done():
+            if self._pending or self._writing:
+                waiter = loop.create_future()
+                self._waiters.append(waiter)
+                self._wakeup.set()
+                await waiter
+            await loop.run_in_executor(self._executor, self.handler.flush)
+        else:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes out the queued records and flushes the wrapped handler,
+        blocking the calling thread (and the loop, if called on it). Use
+        ``await aflush()`` on the loop instead.
+        """
+        loop = self._loop
+        if loop is not None and loop.is_running() and _get_running_loop() is not loop:
+            asyncio.run_coroutine_threadsafe(self.aflush(), loop).result()
+            return
+        if self._pending:
+            self._write_outside_loop(list(self._pending))
+            self._pending.clear()
+        if self._executor is not None:
+            try:
+                self._executor.submit(self.handler.flush).result()
+                return
+            except RuntimeError:
+                pass
+        self.handler.flush()
+
+    async def aclose(self):
+        """
+        Writes out the queued records, stops the writer task and the worker
+        thread, and closes the wrapped handler. Records logged afterwards are
+        written directly.
+        """
+        loop = _get_running_loop()
+        if loop is self._loop and self._task is not None and not self._task.done():
+            self._closed = True
+            self._wakeup.set()
+            await self._task
+            await loop.run_in_executor(self._executor, self.handler.close)
+            self._shutdown_executor(wait=False)
+            logging.Handler.close(self)
+        else:
+            self.close()
+
+    def close(self):
+        """
+        Writes out the queued records, stops the writer task and the worker
+        thread, and closes the wrapped handler. Blocks until the worker thread
+        is done, use ``await aclose()`` on the loop instead.
+        """
+        self.acquire()
+        try:
+            self._closed = True
+            loop, task = self._loop, self._task
+            self._task = None
+            if task is not None and not task.done():
+                if _get_running_loop() is loop:
+                    task.cancel()
+                elif not loop.is_closed():
+                    loop.call_soon_threadsafe(task.cancel)
+            self._shutdown_executor(wait=True)
+            if self._pending and (loop is None or not loop.is_running() or _get_running_loop() is loop):
+                self._write(list(self._pending))
+                self._pending.clear()
+            self.handler.close()
+        finally:
+            self.release()
+        logging.Handler.close(self)
+
+    def _shutdown_executor(self, wait):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+def _asyncio_handlers(logger_to_update):
+    if logger_to_update is None:
+        import logzero
+        logger_to_update = logzero.logger
+    return [handler for handler in logger_to_update.handlers if isinstance(handler, AsyncioHandler)]
+
+
+async def flush(logger_to_update=None):
+    """
+    Waits until the records queued by the `AsyncioHandler` instances of the
+    logger (default: `logzero.logger`) are written.
+    """
+    for handler in _asyncio_handlers(logger_to_update):
+        await handler.aflush()
+
+
+async def aclose(logger_to_update=None):
+    """
+    Writes out the queued records and closes the `AsyncioHandler` instances
+    of the logger (default: `logzero.logger`), eg. before the loop ends.
+    Records logged afterwards are written directly.
+    """
+    for handler in _asyncio_handlers(logger_to_update):
+        await handler.aclose()
+
+
+def log_function_call(func=None, logger_to_use=None, level=logging.DEBUG,
+                      timing=False, logResult=False, logExceptions=False,
+                      maxRepr=None, sampleRate=1, maxPerSecond=None):
+    """
+    Same as `logzero.log_function_call(..)`, but with ``timing`` the calls of
+    coroutine functions log the time the coroutine ran on the event loop
+    besides its duration, eg. ``fetch(url) [120.500 ms, on loop 0.310 ms]``.
+    A coroutine which keeps the loop busy for long has a large loop time,
+    one waiting for I/O a small one.
+    """
+    import logzero
+
+    kwargs = dict(logger_to_use=logger_to_use, level=level, timing=timing, logResult=logResult,
+                  logExceptions=logExceptions, maxRepr=maxRepr, sampleRate=sampleRate,
+                  maxPerSecond=maxPerSecond)
+    if func is None:
+        return functools.partial(log_function_call, **kwargs)
+    if not inspect.iscoroutinefunction(func):
+        return logzero.log_function_call(func, **kwargs)
+
+    call_logger = logzero._CallLogger(func, logger_to_use, level, timing, logResult,
+                                      logExceptions, maxRepr, sampleRate, maxPerSecond)
+
+    @functools.wraps(func)
+    async def wrap(*args, **kwargs):
+        call = call_logger.begin(args, kwargs, cpu=False)
+        if call is None:
+            return await func(*args, **kwargs)
+        coro = _TimedCoroutine(func(*args, **kwargs))
+        try:
+            result = await coro
+        except Exception as e:
+            call_logger.end(call, exception=e, loop=coro.busy)
+            raise
+        call_logger.end(call, result=result, loop=coro.busy)
+        return result
+    return wrap
+
+
+class _TimedCoroutine(object):
+    """
+    Awaits a coroutine and adds up the time its steps ran, ie. the time it
+    kept the event loop busy.
+    """
+    def __init__(self, coro):
+        self.coro = coro
+        self.busy = 0.0
+
+    def __await__(self):
+        coro = self.coro
+        value, error = None, None
+        while True:
+            start = _clock()
+            try:
+                if error is None:
+                    yielded = coro.send(value)
+                else:
+                    yielded = coro.throw(error)
+            except StopIteration as e:
+                self.busy += _clock() - start
+                return e.value
+            except BaseException:
+                self.busy += _clock() - start
+                raise
+            self.busy += _clock() - start
+            try:
+                value, error = (yield yielded), None
+            except GeneratorExit:
+                coro.close()
+                raise
+            except BaseException as e:
+                # Eg. the task was cancelled
+                value, error = None, e
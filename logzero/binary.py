@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+"""
+A compact binary format for log records, which defers formatting the
+messages until the logs are read.
+
+* `BinaryFileHandler` writes records to a logfile in the binary format.
+* `read_records` reads them back as log records, eg. to format them with
+  `LogFormatter` (see ``python -m logzero.decode``).
+
+A record holds its timestamp, level, the ids of its logger name, call site
+and message template, and its arguments, packed by type. The logger names,
+call sites and templates are written once, the first time they are used
+in a file. Arguments of other types than None, bool, int, float, text and
+bytes can't be formatted later, the messages of such records are formatted
+when they are written. Fields passed with ``extra={..}`` aren't stored.
+"""
+import logging
+import os
+import struct
+import sys
+
+from logzero.handlers import BufferedRotatingFileHandler
+
+# Starts every file, and resets the interned strings where it appears later
+MAGIC = b'LZB\x01'
+
+_NAME = b'N'
+_SITE = b'S'
+_TEMPLATE = b'T'
+_RECORD = b'R'
+
+_DOUBLE = struct.Struct('<d')
+
+if sys.version_info >= (3, ):
+    _TEXT_TYPE = str
+    _INT_TYPES = (int, )
+else:
+    _TEXT_TYPE = unicode  # noqa: F821
+    _INT_TYPES = (int, long)  # noqa: F821
+
+_TEMPLATE_TYPES = (str, _TEXT_TYPE)
+
+_formatter = logging.Formatter()
+
+
+def _varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _text(out, value):
+    if not isinstance(value, bytes):
+        value = value.encode('utf-8', 'replace')
+    _varint(out, len(value))
+    out += value
+
+
+def _pack_args(out, args):
+    """
+    Appends the packed ``args`` to ``out``. Returns False if one of them
+    can't be packed.
+    """
+    _varint(out, len(args))
+    for arg in args:
+        kind = type(arg)
+        if arg is None:
+            out += b'n'
+        elif kind is bool:
+            out += b'T' if arg else b'F'
+        elif kind in _INT_TYPES:
+            out += b'i'
+            # Zigzag, small negative numbers stay short
+            _varint(out, arg << 1 if arg >= 0 else ((-arg) << 1) - 1)
+        elif kind is float:
+            out += b'd'
+            out += _DOUBLE.pack(arg)
+        elif kind is _TEXT_TYPE:
+            out += b's'
+            _text(out, arg)
+        elif kind is bytes:
+            out += b'b'
+            _text(out, arg)
+        else:
+            return False
+    return True
+
+
+class BinaryEncoder(object):
+    """
+    Encodes records in the binary format. The logger names, call sites and
+    message templates it has seen are only referred to by their id, so the
+    output must be written in order to the same file, after `MAGIC`.
+    """
+    def __init__(self, maxInterned=10000):
+        """
+        :arg int maxInterned: Start over with the interned strings when this many of a kind are collected, so dynamic messages can't grow them without limit. Defaults to 10000.
+        """
+        self.maxInterned = maxInterned
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the interned strings, eg. when a new file is started.
+        """
+        self._names = {}
+        self._sites = {}
+        self._templates = {}
+
+    def encode(self, record, formatter=None):
+        """
+        Returns the record in the binary format, preceded by the logger
+        name, call site and template if they are new. ``formatter`` renders
+        the traceback of exceptions.
+        """
+        out = bytearray()
+        if max(len(self._names), len(self._sites), len(self._templates)) >= self.maxInterned:
+            self.reset()
+            out += MAGIC
+
+        name_id = self._names.get(record.name)
+        if name_id is None:
+            name_id = self._names[record.name] = len(self._names) + 1
+            out += _NAME
+            _varint(out, name_id)
+            _text(out, record.name)
+
+        site = (record.pathname, record.lineno, record.funcName)
+        site_id = self._sites.get(site)
+        if site_id is None:
+            site_id = self._sites[site] = len(self._sites) + 1
+            out += _SITE
+            _varint(out, site_id)
+            _text(out, record.pathname or '')
+            _varint(out, record.lineno or 0)
+            _text(out, record.funcName or '')
+
+        body = bytearray()
+        _varint(body, record.levelno)
+        _varint(body, name_id)
+        _varint(body, site_id)
+        msg, args = record.msg, record.args
+        packed = bytearray()
+        if type(msg) in _TEMPLATE_TYPES and isinstance(args or (), tuple) and _pack_args(packed, args or ()):
+            template_id = self._templates.get(msg)
+            if template_id is None:
+                template_id = self._templates[msg] = len(self._templates) + 1
+                out += _TEMPLATE
+                _varint(out, template_id)
+                _text(out, msg)
+            _varint(body, template_id)
+            body += packed
+        else:
+            # Formatted now, id 0 is followed by the message
+            _varint(body, 0)
+            _text(body, record.getMessage())
+
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = record.exc_text = (formatter or _formatter).formatException(record.exc_info)
+        if getattr(record, 'stack_info', None):
+            stack = (formatter or _formatter).formatStack(record.stack_info)
+            exc_text = exc_text + '\n' + stack if exc_text else stack
+        _text(body, exc_text or '')
+
+        out += _RECORD
+        out += _DOUBLE.pack(record.created)
+        out += body
+        return bytes(out)
+
+
+class BinaryFileHandler(BufferedRotatingFileHandler):
+    """
+    Writes records to a logfile in the binary format, instead of formatting
+    them as text. Messages are formatted when the logfile is read, with
+    ``python -m logzero.decode``, which makes logging a record cheaper and
+    the logfile a lot smaller.
+
+    Records are collected in memory and written in batches, and the
+    logfile is rotated, like with `BufferedRotatingFileHandler`. Every
+    file (also after a rollover) starts with the interned strings it uses,
+    so it can be decoded on its own. The formatter of the handler is only
+    used to render tracebacks.
+    """
+    # Record attributes written (besides the ones of the formatter), see
+    # logzero.loggers.record_attrs()
+    recordAttrs = frozenset(['pathname', 'lineno', 'funcName'])
+
+    def __init__(self, filename, mode='a', maxBytes=0, backupCount=0, delay=False,
+                 maxInterned=10000, **kwargs):
+        """
+        :arg int maxInterned: Number of logger names, call sites and message templates to remember, see `BinaryEncoder`. Defaults to 10000.
+
+        The other arguments are the same as for `BufferedRotatingFileHandler`.
+        """
+        self.encoder = BinaryEncoder(maxInterned)
+        BufferedRotatingFileHandler.__init__(self, filename, mode=mode, maxBytes=maxBytes,
+                                             backupCount=backupCount, delay=delay, **kwargs)
+
+    def _open(self):
+        stream = open(self.baseFilename, 'wb' if self.mode.startswith('w') else 'ab')
+        self.encoder.reset()
+        stream.write(MAGIC)
+        return stream
+
+    def emit(self, record):
+        try:
+            # Opened first, which resets the interned strings
+            self._file_size()
+            data = self.encoder.encode(record, self.formatter)
+            if self.maxBytes > 0 and self._size + len(data) >= self.maxBytes:
+                self.doRollover()
+                self._file_size()
+                data = self.encoder.encode(record, self.formatter)
+            self._write_message(data)
+        except Exception:
+            self.handleError(record)
+            return
+        if record.levelno >= self.flushLevel or self._buffered >= self.bufferSize:
+            self.flush()
+
+
+class _Reader(object):
+    """
+    Reads a binary logfile in large chunks.
+    """
+    def __init__(self, stream, chunkSize=1024 * 1024):
+        self.stream = stream
+        self.chunkSize = chunkSize
+        self.buffer = bytearray()
+        self.position = 0
+
+    def at_end(self):
+        return self.position >= len(self.buffer) and not self._fill(1)
+
+    def _fill(self, size):
+        while len(self.buffer) - self.position < size:
+            chunk = self.stream.read(max(size, self.chunkSize))
+            if not chunk:
+                return False
+            del self.buffer[:self.position]
+            self.position = 0
+            self.buffer += chunk
+        return True
+
+    def read(self, size):
+        if not self._fill(size):
+            raise EOFError("truncated record")
+        data = self.buffer[self.position:self.position + size]
+        self.position += size
+        return bytes(data)
+
+    def varint(self):
+        value = shift = 0
+        while True:
+            if not self._fill(1):
+                raise EOFError("truncated record")
+            byte = self.buffer[self.position]
+            self.position += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def text(self):
+        return self.read(self.varint()).decode('utf-8', 'replace')
+
+    def args(self):
+        args = []
+        for _i in range(self.varint()):
+            kind = self.read(1)
+            if kind == b'n':
+                args.append(None)
+            elif kind == b'T':
+                args.append(True)
+            elif kind == b'F':
+                args.append(False)
+            elif kind == b'i':
+                value = self.varint()
+                args.append(-((value + 1) >> 1) if value & 1 else value >> 1)
+            elif kind == b'd':
+                args.append(_DOUBLE.unpack(self.read(8))[0])
+            elif kind == b's':
+                args.append(self.text())
+            elif kind == b'b':
+                args.append(self.read(self.varint()))
+            else:
+                raise ValueError("Unknown argument type %r" % kind)
+        return tuple(args)
+
+
+def read_records(stream):
+    """
+    Yields the records in a binary logfile (opened in binary mode), with
+    their messages formatted. A record cut off at the end of the file (eg.
+    by a crash) is skipped.
+    """
+    reader = _Reader(stream)
+    names, sites, templates = {}, {}, {}
+    while not reader.at_end():
+        try:
+            kind = reader.read(1)
+            if kind == MAGIC[:1]:
+                if reader.read(len(MAGIC) - 1) != MAGIC[1:]:
+                    raise ValueError("Not a logzero binary logfile")
+                names, sites, templates = {}, {}, {}
+            elif kind == _NAME:
+                name_id = reader.varint()
+                names[name_id] = reader.text()
+            elif kind == _SITE:
+                site_id = reader.varint()
+                sites[site_id] = (reader.text(), reader.varint(), reader.text())
+            elif kind == _TEMPLATE:
+                template_id = reader.varint()
+                templates[template_id] = reader.text()
+            elif kind == _RECORD:
+                created = _DOUBLE.unpack(reader.read(8))[0]
+                levelno = reader.varint()
+                name = names.get(reader.varint(), '?')
+                pathname, lineno, funcName = sites.get(reader.varint(), ('', 0, ''))
+                template_id = reader.varint()
+                if template_id:
+                    template = templates.get(template_id, '')
+                    args = reader.args()
+                    message = _format_message(template, args)
+                else:
+                    message = reader.text()
+                exc_text = reader.text() or None
+                yield _make_record(created, levelno, name, pathname, lineno, funcName, message, exc_text)
+            else:
+                raise ValueError("Not a logzero binary logfile, unknown entry %r" % kind)
+        except EOFError:
+            return
+
+
+def _format_message(template, args):
+    if not args:
+        return template
+    try:
+        return template % args
+    except Exception:
+        return "%s %r" % (template, args)
+
+
+def _make_record(created, levelno, name, pathname, lineno, funcName, message, exc_text):
+    filename = os.path.basename(pathname)
+    return logging.makeLogRecord({
+        'name': name,
+        'msg': message,
+        'args': None,
+        'levelno': levelno,
+        'levelname': logging.getLevelName(levelno),
+        'pathname': pathname,
+        'filename': filename,
+        'module': os.path.splitext(filename)[0],
+        'lineno': lineno,
+        'funcName': funcName,
+        'created': created,
+        'msecs': (created - int(created)) * 1000,
+        'exc_text': exc_text,
+    })
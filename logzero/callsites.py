@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Caching what stays the same for every record logged from the same place.
+
+* `CallSiteCache` keeps a `CallSite` for every (pathname, lineno, msg) in a
+  bounded LRU cache. `LogFormatter` renders the attributes of the call site
+  used by its format (eg. ``%(module)s:%(lineno)d``) once per site into the
+  format, instead of once per record.
+"""
+import collections
+import threading
+import weakref
+
+# Record attributes which only depend on where the record was logged
+SITE_ATTRS = frozenset(['pathname', 'filename', 'module', 'lineno', 'funcName'])
+
+
+class CallSite(object):
+    """
+    A logging call in the code: the place and message template of the
+    records logged by it, and how many records were looked up.
+    """
+    __slots__ = ('pathname', 'filename', 'module', 'lineno', 'funcName', 'msg', 'count', 'used', '_formats')
+
+    def __init__(self, record):
+        self.pathname = record.pathname
+        self.filename = record.filename
+        self.module = record.module
+        self.lineno = record.lineno
+        self.funcName = record.funcName
+        self.msg = record.msg
+        self.count = 0
+        # Looked up since the cache last considered dropping it
+        self.used = False
+        # id(format) -> (weak reference to the format, the format with the
+        # attributes of this site rendered in). Dropped with the format, eg.
+        # when formatters are replaced.
+        self._formats = {}
+
+    def format_for(self, compiled):
+        """
+        Returns ``compiled`` (a compiled format of `LogFormatter`) with the
+        attributes of this call site rendered into its template.
+        """
+        key = id(compiled)
+        entry = self._formats.get(key)
+        if entry is not None and entry[0]() is compiled:
+            return entry[1]
+        formats = self._formats
+        specialized = compiled.specialize(self)
+        formats[key] = (weakref.ref(compiled, lambda ref: formats.pop(key, None)), specialized)
+        return specialized
+
+    def __repr__(self):
+        return "<CallSite %s:%d %r (%d)>" % (self.pathname, self.lineno, self.msg, self.count)
+
+
+class CallSiteCache(object):
+    """
+    The call sites records were logged from, by (pathname, lineno, msg).
+    When more than ``maxSize`` are collected, sites not used recently are
+    dropped, so messages built dynamically (eg. with f-strings) can't grow
+    the cache without limit.
+
+    Looking up a cached site takes no lock: instead of moving it to the end
+    of the LRU order, it is marked as used, and a used site is given a
+    second chance when it comes up for eviction.
+
+    `stats()` reports how many distinct sites were seen, `sites()` returns
+    the cached ones with the number of records logged from them.
+    """
+    def __init__(self, maxSize=10000):
+        """
+        :arg int maxSize: Number of call sites to keep. Defaults to 10000.
+        """
+        self.maxSize = maxSize
+        self.misses = 0
+        self.evictions = 0
+        self._sites = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, record):
+        """
+        Returns the `CallSite` of the record, or None if its ``msg`` can't
+        be used as a key.
+        """
+        key = (record.pathname, record.lineno, record.msg)
+        try:
+            site = self._sites.get(key)
+        except TypeError:
+            # Unhashable msg
+            return None
+        if site is None:
+            return self._add(key, record)
+        # Not locked, concurrent lookups may be counted once
+        site.count += 1
+        site.used = True
+        return site
+
+    def _add(self, key, record):
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                site = self._sites[key] = CallSite(record)
+                self.misses += 1
+                while len(self._sites) > self.maxSize:
+                    old_key, old = self._sites.popitem(last=False)
+                    if old.used:
+                        old.used = False
+                        self._sites[old_key] = old
+                    else:
+                        self.evictions += 1
+            site.count += 1
+            return site
+
+    def sites(self):
+        """
+        Returns the cached call sites, the most used first.
+        """
+        with self._lock:
+            sites = list(self._sites.values())
+        return sorted(sites, key=lambda site: -site.count)
+
+    def stats(self):
+        """
+        Returns the number of cached sites (``sites``), of sites added to the
+        cache (``misses``, also the ones added again after being dropped), and
+        of sites dropped to stay within ``maxSize`` (``evictions``).
+        """
+        return {'sites': len(self._sites), 'misses': self.misses, 'evictions': self.evictions}
+
+    def clear(self):
+        with self._lock:
+            self._sites.clear()
+
+
+# Used by the formatters created with callsites=True
+default_cache = CallSiteCache()
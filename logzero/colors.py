@@ -29,10 +29,11 @@ class AnsiCodes(object):
         # the subclasses declare class attributes which are numbers.
         # Upon instantiation we define instance attributes, which are the same
         # as the class attributes but wrapped with the ANSI escape sequence
-        for name in dir(self):
-            if not name.startswith('_'):
-                value = getattr(self, name)
-                setattr(self, name, code_to_chars(value))
+        # Only the codes are rendered, not every name dir() would list
+        for cls in reversed(type(self).__mro__):
+            for name, value in vars(cls).items():
+                if not name.startswith('_') and isinstance(value, int):
+                    setattr(self, name, code_to_chars(value))
 
 
 class AnsiCursor(object):
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Renders logfiles written by `logzero.binary.BinaryFileHandler` as text
+(in the format of `LogFormatter`, without colors) or as JSON lines.
+
+Usage::
+
+    python -m logzero.decode app.log.bin
+    python -m logzero.decode --json app.log.bin.1 app.log.bin > app.json
+"""
+import argparse
+import sys
+
+from logzero import LogFormatter
+from logzero.binary import read_records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m logzero.decode",
+                                     description="Render binary logzero logfiles as text or JSON.")
+    parser.add_argument("files", nargs="+", metavar="FILE", help="binary logfile, - for stdin")
+    parser.add_argument("--json", action="store_true", help="write JSON lines (see logzero.JsonFormatter)")
+    parser.add_argument("--format", default=LogFormatter.DEFAULT_FORMAT, help="format of the text lines")
+    parser.add_argument("--datefmt", default=None, help="format of the timestamps")
+    args = parser.parse_args(argv)
+
+    if args.json:
+        from logzero.formatters import JsonFormatter
+        formatter = JsonFormatter(datefmt=args.datefmt)
+    else:
+        formatter = LogFormatter(color=False, fmt=args.format,
+                                 datefmt=args.datefmt or LogFormatter.DEFAULT_DATE_FORMAT)
+
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    for filename in args.files:
+        stream = stdin if filename == "-" else open(filename, "rb")
+        try:
+            for record in read_records(stream):
+                line = formatter.format(record)
+                if not isinstance(line, str):
+                    # Python 2
+                    line = line.encode('utf-8')
+                sys.stdout.write(line + "\n")
+        except ValueError as e:
+            sys.stderr.write("%s: %s\n" % (filename, e))
+            return 1
+        finally:
+            if stream is not stdin:
+                stream.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+Logging filters used by logzero.
+
+* `RateLimitFilter` limits how often the same message (from the same place
+  in the code) gets through, and reports how many were suppressed.
+* `SamplingFilter` keeps a fraction of the records of every level, either
+  at random or for a fraction of the values of a key (eg. trace ids).
+* `AdaptiveLevelController` raises the minimum level while more records are
+  logged than the handlers should take, and lowers it again afterwards.
+"""
+import atexit
+import logging
+import threading
+import time
+import weakref
+import zlib
+
+# Attribute marking the summary records of RateLimitFilter
+LOGZERO_RATE_LIMIT_SUMMARY_ATTR = "_logzero_rate_limit_summary"
+
+
+class TokenBucket(object):
+    """
+    Allows ``rate`` events per second on average, and bursts of up to
+    ``capacity`` events.
+
+    Not locked: when threads race for the last token, both may get it.
+    """
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity=None, now=None):
+        self.rate = float(rate)
+        self.capacity = float(max(1, rate) if capacity is None else capacity)
+        self.tokens = self.capacity
+        self.updated = time.time() if now is None else now
+
+    def consume(self, now=None):
+        """
+        Takes a token and returns True, or returns False if there is none left.
+        """
+        if now is None:
+            now = time.time()
+        elapsed = now - self.updated
+        if elapsed < 0:
+            # Records of other threads may arrive slightly out of order
+            elapsed = 0
+        tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = max(now, self.updated)
+        if tokens >= 1:
+            self.tokens = tokens - 1
+            return True
+        self.tokens = tokens
+        return False
+
+
+class _CallSite(object):
+    __slots__ = ('bucket', 'suppressed', 'last_summary', 'funcName')
+
+    def __init__(self, bucket, now, funcName=None):
+        self.bucket = bucket
+        self.suppressed = 0
+        self.last_summary = now
+        self.funcName = funcName
+
+
+# The rate limit filters whose summaries are logged at exit
+_rate_limit_filters = weakref.WeakSet()
+_exit_lock = threading.Lock()
+_exit_registered = []
+
+
+def _flush_rate_limit_summaries():
+    for rate_limit in list(_rate_limit_filters):
+        rate_limit.close()
+
+
+def _run_summaries(filter_ref, stopped, interval):
+    # Holds the filter only while flushing, so it can be garbage collected
+    while not stopped.wait(interval):
+        rate_limit = filter_ref()
+        if rate_limit is None:
+            return
+        rate_limit._flush(time.time(), dueOnly=True)
+        del rate_limit
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most ``rate`` records per second through for every kind of record,
+    which is identified by logger, level, message template (before the
+    arguments are merged in) and the file and line of the logging call. Short
+    bursts of up to ``burst`` records pass unlimited.
+
+    The number of suppressed records is logged as
+    ``"Suppressed N similar messages: <template>"``, at most every
+    ``summaryInterval`` seconds: with the next record of the same kind, or
+    from a background thread once the interval has passed (started with the
+    first suppressed record). Summaries still pending are logged by `close()`
+    (also when the filter is replaced by ``setup_logger()``, and at exit) and
+    `flush_summaries()`. The summary goes to all handlers of the logger the
+    record was logged with, so attach the filter to a logger rather than to
+    a handler, eg. with ``setup_logger(rateLimit=..)``.
+
+    The check is a dict lookup and a token bucket update, without locks.
+    """
+    # Record attributes used, see logzero.loggers.record_attrs()
+    recordAttrs = frozenset(['pathname', 'lineno', 'funcName'])
+
+    def __init__(self, rate=10, burst=None, summaryInterval=60, maxKeys=10000):
+        """
+        :arg float rate: Records per second to let through for every kind of record. Defaults to 10.
+        :arg int burst: Number of records which may pass at once. Defaults to ``rate``.
+        :arg float summaryInterval: Minimum number of seconds between two summaries of suppressed records. Defaults to 60.
+        :arg int maxKeys: Number of kinds of records to keep track of. When exceeded, all counts start over. Defaults to 10000.
+        """
+        logging.Filter.__init__(self)
+        self.rate = rate
+        self.burst = burst
+        self.summaryInterval = summaryInterval
+        self.maxKeys = maxKeys
+        self._sites = {}
+        self._summary_lock = threading.Lock()
+        self._stopped = None
+
+    def filter(self, record):
+        if getattr(record, LOGZERO_RATE_LIMIT_SUMMARY_ATTR, False):
+            return True
+
+        key = (record.name, record.levelno, record.msg, record.pathname, record.lineno)
+        now = record.created
+        try:
+            site = self._sites.get(key)
+        except TypeError:
+            # Unhashable message, can't be limited
+            return True
+        if site is None:
+            if len(self._sites) >= self.maxKeys:
+                self._sites = {}
+            site = self._sites.setdefault(key, _CallSite(TokenBucket(self.rate, self.burst, now), now,
+                                                         record.funcName))
+
+        if site.bucket.consume(now):
+            allowed = True
+        else:
+            site.suppressed += 1
+            allowed = False
+            if self._stopped is None:
+                self._start_summaries()
+
+        if site.suppressed and now - site.last_summary >= self.summaryInterval:
+            self._log_summary(record, site, now)
+        return allowed
+
+    def _start_summaries(self):
+        with self._summary_lock:
+            if self._stopped is not None:
+                return
+            self._stopped = threading.Event()
+        thread = threading.Thread(target=_run_summaries, name="logzero-rate-limit-summaries",
+                                  args=(weakref.ref(self), self._stopped, min(self.summaryInterval, 1.0) or 0.1))
+        thread.daemon = True
+        thread.start()
+        _rate_limit_filters.add(self)
+        with _exit_lock:
+            if not _exit_registered:
+                # Registered after the handlers were created, so it runs
+                # before they are closed at exit
+                atexit.register(_flush_rate_limit_summaries)
+                _exit_registered.append(True)
+
+    def _log_summary(self, record, site, now):
+        with self._summary_lock:
+            suppressed, site.suppressed = site.suppressed, 0
+            site.last_summary = now
+        if not suppressed:
+            return
+        _logger = logging.getLogger(record.name)
+        summary = _logger.makeRecord(record.name, record.levelno, record.pathname, record.lineno,
+                                     "Suppressed %d similar messages: %s",
+                                     (suppressed, record.msg), None, func=record.funcName)
+        setattr(summary, LOGZERO_RATE_LIMIT_SUMMARY_ATTR, True)
+        _logger.handle(summary)
+
+    def flush_summaries(self):
+        """
+        Logs the summaries of all records suppressed since the last summary.
+        """
+        self._flush(time.time())
+
+    def close(self):
+        """
+        Stops the background thread and logs the summaries still pending.
+        """
+        if self._stopped is not None:
+            self._stopped.set()
+        _rate_limit_filters.discard(self)
+        self.flush_summaries()
+
+    def _flush(self, now, dueOnly=False):
+        for key, site in list(self._sites.items()):
+            if site.suppressed and not (dueOnly and now - site.last_summary < self.summaryInterval):
+                name, levelno, msg, pathname, lineno = key
+                record = logging.makeLogRecord({
+                    'name': name, 'levelno': levelno, 'levelname': logging.getLevelName(levelno), 'msg': msg,
+                    'pathname': pathname, 'lineno': lineno, 'funcName': site.funcName})
+                self._log_summary(record, site, now)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through only a fraction of the records of every level, eg. 1% of
+    debug and 10% of info records with ``{logging.DEBUG: 0.01, logging.INFO:
+    0.1}``. Records of levels which aren't listed all pass.
+
+    Without a ``key`` every record is sampled at random. With a ``key``, all
+    records with the same value of it are kept or dropped together, so the
+    sampled requests (or traces) are logged completely: records are kept if
+    a hash of the value (the same in every process) falls below the fraction.
+    The requests kept at a level are also kept at all higher levels. Records
+    without a value are sampled at random.
+
+    The number of dropped records is counted in ``dropped`` (not locked, so
+    only approximately with many threads).
+    """
+    def __init__(self, rates, key=None):
+        """
+        :arg dict rates: Fraction of records to keep (between 0 and 1) by level.
+        :arg key: Name of the record attribute to sample by (eg. passed with ``extra={..}`` or set by another filter), or a function returning the value for a record, eg. ``lambda record: trace_id.get(None)`` for a ``contextvars.ContextVar``. Defaults to None (random sampling).
+        """
+        import random
+
+        logging.Filter.__init__(self)
+        for level, rate in rates.items():
+            if not 0 <= rate <= 1:
+                raise ValueError("sampling rate of level %s must be between 0 and 1, got %r" % (level, rate))
+        self.rates = dict(rates)
+        self.key = key
+        self.dropped = 0
+        self._random = random.random
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno)
+        if rate is None or rate >= 1 or getattr(record, LOGZERO_RATE_LIMIT_SUMMARY_ATTR, False):
+            return True
+
+        value = None
+        if self.key is not None:
+            if callable(self.key):
+                value = self.key(record)
+            else:
+                value = getattr(record, self.key, None)
+        if value is None:
+            sample = self._random()
+        else:
+            sample = (zlib.crc32(str(value).encode('utf-8')) & 0xffffffff) / 4294967296.0
+
+        if sample < rate:
+            return True
+        self.dropped += 1
+        return False
+
+    @property
+    def recordAttrs(self):
+        """
+        The record attribute sampled by, see `logzero.loggers.record_attrs()`.
+        """
+        if callable(self.key):
+            return None
+        return frozenset() if self.key is None else frozenset([self.key])
+
+
+class AdaptiveLevelController(logging.Filter):
+    """
+    Drops records below a minimum level which rises while the logger is
+    overloaded, and falls back once it isn't anymore. Attach it to a logger
+    (eg. with ``setup_logger(adaptiveLevel=..)``), it then sees every record
+    the logger's level lets through.
+
+    Every ``interval`` seconds it checks the rate of records logged (including
+    the ones it drops) and how full the queues of the ``handlers`` with a
+    ``qsize()`` method and a ``queueSize`` are (eg.
+    :class:`logzero.handlers.AsyncHandler`). If either exceeds its maximum,
+    the minimum level rises by one standard level
+    (``DEBUG``, ``INFO``, ``WARNING`` ...) up to ``maxLevel``. Once neither has
+    exceeded its maximum for ``restoreAfter`` seconds, it falls by one level,
+    until no records are dropped anymore.
+
+    Every change of the level is logged as a warning, with the logger of the
+    record which triggered it. The number of dropped records is counted in
+    ``dropped``.
+    """
+    LEVELS = (logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR, logging.CRITICAL)
+    # Record attributes used (by the notices), see logzero.loggers.record_attrs()
+    recordAttrs = frozenset(['pathname', 'lineno', 'funcName'])
+
+    def __init__(self, maxRate=1000, maxQueueFill=0.5, handlers=None,
+                 maxLevel=logging.WARNING, interval=1.0, restoreAfter=10.0):
+        """
+        :arg float maxRate: Records per second above which the minimum level rises. None doesn't check the rate. Defaults to 1000.
+        :arg float maxQueueFill: Fraction of the queue of any of the ``handlers`` which, when filled, makes the minimum level rise. None doesn't check the queues. Defaults to 0.5.
+        :arg list handlers: Handlers whose queues are checked. Defaults to the handlers of the logger of the records.
+        :arg int maxLevel: The highest minimum level, records of this level and above always pass. Defaults to ``logging.WARNING``.
+        :arg float interval: Seconds between two checks. Defaults to 1.
+        :arg float restoreAfter: Seconds without overload before the minimum level falls by one level. Defaults to 10.
+        """
+        logging.Filter.__init__(self)
+        self.maxRate = maxRate
+        self.maxQueueFill = maxQueueFill
+        self.handlers = handlers
+        self.maxLevel = maxLevel
+        self.interval = interval
+        self.restoreAfter = restoreAfter
+        # Records below this level are dropped
+        self.level = logging.NOTSET
+        self.dropped = 0
+        self._count = 0
+        self._window_start = None
+        self._calm_since = None
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if getattr(record, LOGZERO_RATE_LIMIT_SUMMARY_ATTR, False):
+            return True
+
+        now = record.created
+        if self._window_start is None:
+            self._window_start = self._calm_since = now
+        elif now - self._window_start >= self.interval:
+            self._check(record, now)
+        self._count += 1
+
+        if record.levelno >= self.level:
+            return True
+        self.dropped += 1
+        return False
+
+    def overloaded(self, rate, handlers):
+        """
+        Returns whether ``rate`` records per second or the queues of the
+        handlers exceed their maximum.
+        """
+        if self.maxRate is not None and rate > self.maxRate:
+            return True
+        if self.maxQueueFill is not None:
+            for handler in handlers:
+                queueSize = getattr(handler, 'queueSize', None)
+                if queueSize and hasattr(handler, 'qsize') and handler.qsize() > self.maxQueueFill * queueSize:
+                    return True
+        return False
+
+    def _check(self, record, now):
+        with self._lock:
+            elapsed = now - self._window_start
+            if elapsed < self.interval:
+                # Another thread just checked
+                return
+            rate = self._count / elapsed
+            self._count = 0
+            self._window_start = now
+
+            level = self.level
+            handlers = self.handlers
+            if handlers is None:
+                handlers = logging.getLogger(record.name).handlers
+            if self.overloaded(rate, handlers):
+                self._calm_since = now
+                # Dropping debug records is the first step
+                higher = [lvl for lvl in self.LEVELS if max(level, logging.DEBUG) < lvl <= self.maxLevel]
+                if higher:
+                    self.level = higher[0]
+            elif level and now - self._calm_since >= self.restoreAfter:
+                self._calm_since = now
+                lower = [lvl for lvl in self.LEVELS if logging.DEBUG < lvl < level]
+                self.level = lower[-1] if lower else logging.NOTSET
+            if self.level == level:
+                return
+
+        if self.level > level:
+            msg, args = "Logging overloaded (%d records/s), dropping records below %s", (rate, logging.getLevelName(self.level))
+        elif self.level:
+            msg, args = "Logging load decreased (%d records/s), dropping records below %s", (rate, logging.getLevelName(self.level))
+        else:
+            msg, args = "Logging load decreased (%d records/s), no longer dropping records", (rate, )
+        _logger = logging.getLogger(record.name)
+        notice = _logger.makeRecord(record.name, logging.WARNING, record.pathname, record.lineno, msg,
+                                    args, None, func=record.funcName)
+        setattr(notice, LOGZERO_RATE_LIMIT_SUMMARY_ATTR, True)
+        _logger.handle(notice)
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Formatters for structured log output.
+
+* `JsonFormatter` writes every record as one line of JSON (a la 12 factor app).
+"""
+import json
+import logging
+import sys
+from json.encoder import encode_basestring
+
+if sys.version_info >= (3, ):
+    _dict_keys = dict.keys
+    text_type = str
+    string_types = (str, )
+else:
+    _dict_keys = dict.viewkeys  # noqa
+    text_type = unicode  # noqa
+    string_types = (str, unicode)  # noqa
+
+# Attributes every LogRecord has (plus the ones formatters set), everything
+# else on a record was passed with ``extra``
+RESERVED_ATTRS = frozenset(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | frozenset([
+    'message', 'asctime', 'color', 'end_color'])
+
+
+# Dict keys the json module serializes
+_KEY_TYPES = string_types + (int, float, bool, type(None))
+
+
+def _encode_value(value):
+    """
+    Encodes a single value as JSON, with fast paths for the usual types.
+    """
+    value_type = type(value)
+    if value_type is text_type or value_type is str:
+        return encode_basestring(value)
+    if value is None:
+        return 'null'
+    if value_type is bool:
+        return 'true' if value else 'false'
+    if value_type is int:
+        return int.__repr__(value)
+    if value_type is float:
+        # NaN and infinity aren't valid JSON, null like orjson writes them
+        return float.__repr__(value) if value - value == 0 else 'null'
+    try:
+        return json.dumps(value, ensure_ascii=False, default=text_type, separators=(',', ':'), allow_nan=False)
+    except (TypeError, ValueError):
+        # NaN, infinity or keys JSON doesn't have
+        return json.dumps(_jsonable(value), ensure_ascii=False, default=text_type, separators=(',', ':'))
+
+
+def _jsonable(value):
+    """
+    Returns ``value`` with NaN and infinity in it (also in nested dicts,
+    lists and tuples) replaced by None, and the dict keys which JSON
+    doesn't have (eg. tuples) serialized with ``str()``.
+    """
+    if isinstance(value, float):
+        return value if value - value == 0 else None
+    if isinstance(value, dict):
+        return dict((key if isinstance(key, _KEY_TYPES) else text_type(key), _jsonable(item))
+                    for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    return value
+
+
+def _dumps_stdlib(data):
+    return '{%s}' % ','.join([encode_basestring(key) + ':' + _encode_value(value)
+                              for key, value in data.items()])
+
+
+def _select_dumps():
+    """
+    Returns the fastest JSON encoder available.
+    """
+    try:
+        import orjson
+    except ImportError:
+        pass
+    else:
+        def dumps(data):
+            try:
+                return orjson.dumps(data, default=text_type).decode('utf-8')
+            except TypeError:
+                # eg. integers beyond 64 bit
+                return _dumps_stdlib(data)
+        return dumps
+
+    try:
+        import ujson
+    except ImportError:
+        pass
+    else:
+        def dumps(data):
+            try:
+                return ujson.dumps(data, ensure_ascii=False)
+            except (TypeError, OverflowError):
+                return _dumps_stdlib(data)
+        return dumps
+
+    return _dumps_stdlib
+
+
+def _dumps(data):
+    # The encoder is imported with the first record, not with logzero
+    global _dumps
+    _dumps = _select_dumps()
+    return _dumps(data)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats every record as a single line of JSON, eg.::
+
+        {"time":1486998120.0,"level":"INFO","logger":"logzero_default","module":"test","line":203,"message":"hello"}
+
+    The line is encoded with `orjson <https://github.com/ijl/orjson>`_ or
+    `ujson <https://github.com/ultrajson/ultrajson>`_ if installed, else with
+    a fast path around the standard library. Only the selected fields are
+    collected for encoding, the attributes of the record are never copied
+    as a whole.
+
+    Values which JSON can't represent are serialized with ``str()``.
+    """
+    DEFAULT_FIELDS = (
+        ('created', 'time'),
+        ('levelname', 'level'),
+        ('name', 'logger'),
+        ('module', 'module'),
+        ('lineno', 'line'),
+        ('message', 'message'),
+    )
+
+    def __init__(self, fields=DEFAULT_FIELDS, extra=True, datefmt=None):
+        """
+        :arg fields: Record attributes to write. A list of attribute names, of ``(attribute, key)`` tuples to rename them, or a dict mapping attributes to keys. Besides the `LogRecord attributes <https://docs.python.org/2/library/logging.html#logrecord-attributes>`_ you can use ``message`` and ``asctime`` (formatted with ``datefmt``).
+        :arg bool extra: Also write all fields passed with ``extra={..}`` to the logging call (except ones starting with ``_``). Defaults to True.
+        :arg string datefmt: Date format for ``asctime``.
+        """
+        logging.Formatter.__init__(self, datefmt=datefmt)
+        if isinstance(fields, dict):
+            fields = fields.items()
+        self._fields = tuple((field, field) if isinstance(field, string_types) else tuple(field)
+                             for field in fields)
+        self._extra = extra
+        self._reserved = RESERVED_ATTRS | frozenset(attr for attr, _key in self._fields)
+
+    def format(self, record):
+        attrs = record.__dict__
+        data = {}
+        for attr, key in self._fields:
+            if attr == 'message':
+                record.message = record.getMessage()
+                data[key] = record.message
+            elif attr == 'asctime':
+                record.asctime = self.formatTime(record, self.datefmt)
+                data[key] = record.asctime
+            else:
+                data[key] = attrs.get(attr)
+
+        if self._extra:
+            extra = _dict_keys(attrs) - self._reserved
+            for attr in sorted(extra):
+                # Underscore attributes are internal state of handlers or formatters
+                if not attr.startswith('_'):
+                    data[attr] = attrs[attr]
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        if getattr(record, 'stack_info', None):
+            data['stack'] = self.formatStack(record.stack_info)
+
+        return _dumps(data)
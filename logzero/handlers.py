@@ -0,0 +1,738 @@
+# -*- coding: utf-8 -*-
+"""
+Logging handlers used by logzero.
+
+* `AsyncHandler` moves the formatting and I/O of another handler to a
+  background thread, so that logging calls never wait for the disk.
+* `FastRotatingFileHandler` rotates logfiles without re-formatting records
+  for the size check and without blocking logging threads during rollover.
+* `BufferedRotatingFileHandler` collects records in memory and writes them
+  to the logfile in batches.
+* `ThreadBufferedFileHandler` collects records in one buffer per thread, so
+  that logging threads don't wait for each other.
+"""
+import atexit
+import collections
+import functools
+import heapq
+import locale
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import traceback
+import weakref
+from logging.handlers import RotatingFileHandler
+
+from logzero._records import merged_copy
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue  # noqa
+
+# What AsyncHandler does with a record when its queue is full
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_DROP_NEWEST = 'drop_newest'
+OVERFLOW_SAMPLE = 'sample'
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST,
+                     OVERFLOW_DROP_NEWEST, OVERFLOW_SAMPLE)
+
+# Naming schemes of the backups of FastRotatingFileHandler
+ROTATION_NUMBERED = 'numbered'
+ROTATION_TIMESTAMP = 'timestamp'
+ROTATIONS = (ROTATION_NUMBERED, ROTATION_TIMESTAMP)
+
+# Batch modes of the logzero logfile handlers (batch_mode=True is one buffer)
+BATCH_PER_THREAD = 'per_thread'
+
+# Async mode of the logzero logfile handlers which writes with
+# logzero.aio.AsyncioHandler (async_mode=True is an AsyncHandler)
+ASYNC_MODE_ASYNCIO = 'asyncio'
+
+# Tells the writer thread of an AsyncHandler to stop
+_STOP = object()
+
+# All AsyncHandlers which still have a running writer thread
+_async_handlers = weakref.WeakSet()
+
+
+class AsyncHandler(logging.Handler):
+    """
+    Hands records to a background writer thread through a bounded queue. The
+    wrapped ``handler`` formats and writes them on that thread, so a stalled
+    disk doesn't block the threads which are logging.
+
+    When the queue is full, ``overflow`` decides what happens:
+
+    * ``block``: wait until the writer has made room (nothing is lost).
+    * ``drop_oldest``: discard the oldest queued record.
+    * ``drop_newest``: discard the record being logged.
+    * ``sample``: keep only every ``sampleRate``-th record while the queue
+      is full (it replaces the oldest queued record), discard the others.
+
+    Discarded records are counted in ``dropped``. Queued records are written
+    out when the handler is closed, at the latest when the interpreter exits.
+    """
+    # Only passes records on, see logzero.loggers.record_attrs()
+    recordAttrs = frozenset()
+
+    def __init__(self, handler, queueSize=10000, overflow=OVERFLOW_BLOCK, sampleRate=100):
+        """
+        :arg Handler handler: The handler which does the actual formatting and writing.
+        :arg int queueSize: Maximum number of records waiting for the writer thread.
+        :arg string overflow: What to do when the queue is full, one of ``block``, ``drop_oldest``, ``drop_newest`` or ``sample``.
+        :arg int sampleRate: With ``overflow='sample'``, keep one out of this many records while the queue is full.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of %s, got %r" % (", ".join(OVERFLOW_POLICIES), overflow))
+        logging.Handler.__init__(self)
+        self.handler = handler
+        self.overflow = overflow
+        self.sampleRate = max(1, int(sampleRate))
+        self.queueSize = queueSize
+        self.dropped = 0
+        self._overflowed = 0
+        self._queue = queue.Queue(maxsize=queueSize)
+        self._thread = threading.Thread(target=self._run, name="logzero-async-writer")
+        self._thread.daemon = True
+        self._thread.start()
+        _async_handlers.add(self)
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the writer thread, in the wrapped handler
+        self.handler.setFormatter(fmt)
+
+    def qsize(self):
+        """
+        Returns the number of records waiting for the writer thread.
+        """
+        return self._queue.qsize()
+
+    def prepare(self, record):
+        """
+        Returns a copy of the record with the message already merged with its
+        arguments, as they may be changed by the caller before the writer
+        thread gets to the record.
+        """
+        return merged_copy(record)
+
+    def emit(self, record):
+        if self._thread is None:
+            # Closed, write synchronously instead of filling a queue nobody reads
+            self.handler.handle(record)
+            return
+        try:
+            self.enqueue(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    def enqueue(self, record):
+        """
+        Puts the record into the queue, applying the overflow policy if it is full.
+        Called with the handler lock held.
+        """
+        if self.overflow == OVERFLOW_BLOCK:
+            self._queue.put(record)
+            return
+
+        try:
+            self._queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+
+        if self.overflow == OVERFLOW_DROP_NEWEST:
+            self.dropped += 1
+            return
+
+        if self.overflow == OVERFLOW_SAMPLE:
+            self._overflowed += 1
+            if self._overflowed % self.sampleRate:
+                self.dropped += 1
+                return
+
+        # Make room by discarding the oldest records. The writer thread may
+        # empty the queue in the meantime, therefore retry until it fits.
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            else:
+                self._queue.task_done()
+                self.dropped += 1
+            try:
+                self._queue.put_nowait(record)
+                return
+            except queue.Full:
+                pass
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            try:
+                if record is _STOP:
+                    return
+                self.handler.handle(record)
+            except Exception:
+                self.handler.handleError(record)
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """
+        Blocks until all queued records have been written by the wrapped handler.
+        """
+        if self._thread is not None:
+            self._queue.join()
+        self.handler.flush()
+
+    def close(self):
+        """
+        Writes out all queued records, stops the writer thread and closes the wrapped handler.
+        """
+        self.acquire()
+        try:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(_STOP)
+                thread.join()
+                _async_handlers.discard(self)
+            self.handler.close()
+        finally:
+            self.release()
+        logging.Handler.close(self)
+
+
+class _RotationWorker(object):
+    """
+    A background thread which renames and removes rotated logfiles, so that
+    logging threads don't wait for it.
+    """
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        with self._lock:
+            # is_alive(): after a fork the thread is gone in the child process
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="logzero-rotation")
+                self._thread.daemon = True
+                self._thread.start()
+        self._queue.put(job)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job()
+            except Exception:
+                if logging.raiseExceptions:
+                    traceback.print_exc()
+            finally:
+                self._queue.task_done()
+
+    def wait(self):
+        """
+        Blocks until all submitted jobs are done.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+
+_rotation_worker = _RotationWorker()
+
+# Rotated files of ROTATION_TIMESTAMP end with eg. ".20170213-150200-123456"
+# (plus the suffix of the compression)
+_TIMESTAMP_SUFFIX_RE = re.compile(r"^\.\d{8}-\d{6}-\d{6}(\.gz|\.zst|\.lz4)?$")
+
+
+def _gzip_file(source, target, level):
+    import gzip
+    with open(source, 'rb') as src:
+        with gzip.open(target, 'wb', compresslevel=9 if level is None else level) as dst:
+            shutil.copyfileobj(src, dst)
+
+
+def _zstd_file(source, target, level):
+    import zstandard
+    compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+    with open(source, 'rb') as src:
+        with open(target, 'wb') as dst:
+            compressor.copy_stream(src, dst)
+
+
+def _lz4_file(source, target, level):
+    import lz4.frame
+    with open(source, 'rb') as src:
+        with lz4.frame.open(target, 'wb', compression_level=0 if level is None else level) as dst:
+            shutil.copyfileobj(src, dst)
+
+
+# Compression of rotated logfiles: name -> (module it needs, suffix, function)
+COMPRESSIONS = {
+    'gzip': ('gzip', '.gz', _gzip_file),
+    'zstd': ('zstandard', '.zst', _zstd_file),
+    'lz4': ('lz4.frame', '.lz4', _lz4_file),
+}
+
+# Suffixes a backup may have, so that switching the compression doesn't leave files behind
+_BACKUP_SUFFIXES = ('',) + tuple(suffix for _module, suffix, _func in COMPRESSIONS.values())
+
+
+def _check_compression(compression):
+    """
+    Raises a ValueError if the compression is unknown or its module isn't installed.
+    """
+    if compression is None:
+        return
+    if compression not in COMPRESSIONS:
+        raise ValueError("compression must be one of %s, got %r" % (", ".join(sorted(COMPRESSIONS)), compression))
+    module = COMPRESSIONS[compression][0]
+    try:
+        __import__(module)
+    except ImportError:
+        raise ValueError("compression %r needs the %r module, which is not installed" % (compression, module))
+
+
+def _compress_file(source, compression, level):
+    """
+    Compresses ``source`` next to it and removes it. Returns the new filename.
+    """
+    _module, suffix, compress = COMPRESSIONS[compression]
+    target = source + suffix
+    compress(source, target + ".tmp", level)
+    os.rename(target + ".tmp", target)
+    os.remove(source)
+    return target
+
+
+def _shift_backups(baseFilename, source, backupCount, suffix=''):
+    """
+    Renames ``app.log.N-1`` to ``app.log.N``, ..., ``app.log.1`` to
+    ``app.log.2`` and finally ``source`` to ``app.log.1<suffix>``. Every
+    index holds only one backup, whether compressed or not.
+    """
+    def remove_backup(index):
+        for backup_suffix in _BACKUP_SUFFIXES:
+            filename = "%s.%d%s" % (baseFilename, index, backup_suffix)
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    for i in range(backupCount - 1, 0, -1):
+        remove_backup(i + 1)
+        for backup_suffix in _BACKUP_SUFFIXES:
+            sfn = "%s.%d%s" % (baseFilename, i, backup_suffix)
+            if os.path.exists(sfn):
+                os.rename(sfn, "%s.%d%s" % (baseFilename, i + 1, backup_suffix))
+    remove_backup(1)
+    os.rename(source, "%s.1%s" % (baseFilename, suffix))
+
+
+def _rotate_numbered(baseFilename, source, backupCount, compression=None, compressionLevel=None):
+    suffix = ''
+    if compression:
+        source = _compress_file(source, compression, compressionLevel)
+        suffix = COMPRESSIONS[compression][1]
+    _shift_backups(baseFilename, source, backupCount, suffix)
+
+
+def _rotate_timestamp(baseFilename, source, backupCount, compression=None, compressionLevel=None):
+    if compression:
+        _compress_file(source, compression, compressionLevel)
+    _remove_old_backups(baseFilename, backupCount)
+
+
+def _remove_old_backups(baseFilename, backupCount):
+    """
+    Removes all but the ``backupCount`` newest timestamped backups.
+    """
+    directory, prefix = os.path.split(baseFilename)
+    backups = sorted(name for name in os.listdir(directory or ".")
+                     if name.startswith(prefix) and _TIMESTAMP_SUFFIX_RE.match(name[len(prefix):]))
+    for name in backups[:-backupCount]:
+        os.remove(os.path.join(directory, name))
+
+
+def _is_ascii(text):
+    try:
+        return text.isascii()
+    except AttributeError:
+        # Before Python 3.7
+        return False
+
+
+class FastRotatingFileHandler(RotatingFileHandler):
+    """
+    A `RotatingFileHandler` which
+
+    * keeps track of the file size in memory, instead of formatting every
+      record a second time and seeking to the end of the file for the
+      rollover check,
+    * doesn't block logging threads while the backups are renamed.
+
+    With ``rotation='numbered'`` the backups are named like the ones of
+    `RotatingFileHandler` (``app.log.1`` is the newest). On rollover the
+    logfile is moved aside with a single rename, and the ``app.log.N``
+    cascade runs in a background thread (or right away with
+    ``backgroundRotation=False``).
+
+    With ``rotation='timestamp'`` the logfile is renamed to
+    ``app.log.<YYYYmmdd-HHMMSS-micros>`` and never renamed again, only the
+    removal of backups beyond ``backupCount`` happens in the background.
+
+    With ``compression`` set, backups are compressed in the background thread
+    before they get their final name (eg. ``app.log.1.gz``). ``backupCount``
+    counts the compressed files, and uncompressed backups from earlier runs
+    are shifted and removed like compressed ones.
+    """
+    def __init__(self, filename, mode='a', maxBytes=0, backupCount=0,
+                 encoding=None, delay=False, rotation=ROTATION_NUMBERED,
+                 backgroundRotation=True, compression=None,
+                 compressionLevel=None):
+        """
+        :arg string rotation: Naming scheme of the backups, ``numbered`` (default) or ``timestamp``.
+        :arg bool backgroundRotation: Shift numbered backups in a background thread. Always True with ``compression``. Defaults to True.
+        :arg string compression: Compress backups with ``gzip``, ``zstd`` (needs the ``zstandard`` package) or ``lz4`` (needs the ``lz4`` package). Defaults to None.
+        :arg int compressionLevel: Compression level, defaults to the default level of the compression.
+
+        The other arguments are the same as for `RotatingFileHandler`.
+        """
+        if rotation not in ROTATIONS:
+            raise ValueError("rotation must be one of %s, got %r" % (", ".join(ROTATIONS), rotation))
+        _check_compression(compression)
+        RotatingFileHandler.__init__(self, filename, mode=mode,
+                                     maxBytes=maxBytes,
+                                     backupCount=backupCount,
+                                     encoding=encoding, delay=delay)
+        self.rotation = rotation
+        self.backgroundRotation = backgroundRotation or bool(compression)
+        self.compression = compression
+        self.compressionLevel = compressionLevel
+        # Bytes written since the file was opened (plus its initial size)
+        self._size = None
+
+    def emit(self, record):
+        try:
+            self._write_formatted(self.format(record) + getattr(self, 'terminator', '\n'))
+        except Exception:
+            self.handleError(record)
+
+    def _write_formatted(self, msg):
+        """
+        Writes an already formatted message, rotating the file before if needed.
+        """
+        if self.maxBytes > 0 and self._file_size() + self._encoded_size(msg) >= self.maxBytes:
+            self.doRollover()
+            self._file_size()
+        self._write_message(msg)
+
+    def _encoded_size(self, msg):
+        """
+        Returns the number of bytes ``msg`` takes up in the logfile.
+        """
+        if isinstance(msg, bytes) or _is_ascii(msg):
+            return len(msg)
+        return len(msg.encode(self.encoding or locale.getpreferredencoding(False), 'replace'))
+
+    def _file_size(self):
+        if self._size is None:
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.seek(0, 2)
+            self._size = self.stream.tell()
+        return self._size
+
+    def _write_message(self, msg):
+        """
+        Writes an already formatted message (including the terminator).
+        """
+        if self.stream is None:
+            self.stream = self._open()
+        self.stream.write(msg)
+        self.flush()
+        if self._size is not None:
+            self._size += self._encoded_size(msg)
+
+    def shouldRollover(self, record):
+        msg = self.format(record) + getattr(self, 'terminator', '\n')
+        return self.maxBytes > 0 and self._file_size() + self._encoded_size(msg) >= self.maxBytes
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        self._size = None
+
+        if self.backupCount > 0 and os.path.exists(self.baseFilename):
+            if self.rotation == ROTATION_TIMESTAMP:
+                backup = self._timestamp_filename()
+                os.rename(self.baseFilename, backup)
+                _rotation_worker.submit(functools.partial(
+                    _rotate_timestamp, self.baseFilename, backup, self.backupCount,
+                    self.compression, self.compressionLevel))
+            elif self.backgroundRotation:
+                pending = self._rename_unique(self.baseFilename + ".rotating")
+                _rotation_worker.submit(functools.partial(
+                    _rotate_numbered, self.baseFilename, pending, self.backupCount,
+                    self.compression, self.compressionLevel))
+            else:
+                _shift_backups(self.baseFilename, self.baseFilename, self.backupCount)
+
+        if not self.delay:
+            self.stream = self._open()
+
+    def _timestamp_filename(self):
+        now = int(time.time() * 1e6)
+        while True:
+            filename = "%s.%s-%06d" % (self.baseFilename,
+                                       time.strftime("%Y%m%d-%H%M%S", time.localtime(now // 1000000)),
+                                       now % 1000000)
+            if not os.path.exists(filename):
+                return filename
+            now += 1
+
+    def _rename_unique(self, filename):
+        """
+        Renames the logfile to ``filename`` (with a counter appended if it exists).
+        """
+        target, counter = filename, 0
+        while os.path.exists(target):
+            counter += 1
+            target = "%s.%d" % (filename, counter)
+        os.rename(self.baseFilename, target)
+        return target
+
+    def close(self):
+        """
+        Closes the logfile and waits for pending renames of backups.
+        """
+        RotatingFileHandler.close(self)
+        _rotation_worker.wait()
+
+
+class BufferedRotatingFileHandler(FastRotatingFileHandler):
+    """
+    A `FastRotatingFileHandler` which collects formatted records in memory and
+    writes them to the file with a single ``write`` + ``flush``. The buffer is
+    written out when
+
+    * it holds ``bufferSize`` characters or more,
+    * its oldest record has waited ``flushInterval`` seconds (checked by a
+      background thread, so records don't linger when logging goes quiet),
+    * a record with level ``flushLevel`` or higher is logged,
+    * the file is about to be rotated, the handler is flushed or closed.
+
+    Rotation works like in `RotatingFileHandler` (``maxBytes`` and
+    ``backupCount``), buffered records count towards the file size.
+    """
+    def __init__(self, filename, mode='a', maxBytes=0, backupCount=0,
+                 encoding=None, delay=False, bufferSize=64 * 1024,
+                 flushInterval=1.0, flushLevel=logging.ERROR, **kwargs):
+        """
+        :arg int bufferSize: Write the buffer once it holds this many characters. Defaults to 64 KiB.
+        :arg float flushInterval: Maximum number of seconds a record waits in the buffer. Set to `None` to only flush on size and level. Defaults to 1.0.
+        :arg int flushLevel: Records of this level or higher are written immediately. Defaults to ``logging.ERROR``.
+
+        The other arguments are the same as for `FastRotatingFileHandler`.
+        """
+        FastRotatingFileHandler.__init__(self, filename, mode=mode,
+                                         maxBytes=maxBytes,
+                                         backupCount=backupCount,
+                                         encoding=encoding, delay=delay,
+                                         **kwargs)
+        self.bufferSize = bufferSize
+        self.flushInterval = flushInterval
+        self.flushLevel = flushLevel
+        self._buffer = []
+        self._buffered = 0
+        self._deadline = None
+        self._flusher = None
+        self._stop = threading.Event()
+        if flushInterval:
+            self._flusher = threading.Thread(target=self._run_flusher,
+                                             name="logzero-buffer-flusher")
+            self._flusher.daemon = True
+            self._flusher.start()
+
+    def emit(self, record):
+        FastRotatingFileHandler.emit(self, record)
+        if record.levelno >= self.flushLevel or self._buffered >= self.bufferSize:
+            self.flush()
+
+    def _write_message(self, msg):
+        self._buffer.append(msg)
+        self._buffered += len(msg)
+        if self._size is not None:
+            self._size += self._encoded_size(msg)
+        if self._deadline is None and self.flushInterval:
+            self._deadline = time.time() + self.flushInterval
+
+    def _write_buffer(self):
+        if not self._buffer:
+            return
+        if self.stream is None:
+            self.stream = self._open()
+        # Bytes, for handlers writing a binary format
+        empty = b'' if isinstance(self._buffer[0], bytes) else ''
+        self.stream.write(empty.join(self._buffer))
+        self._buffer = []
+        self._buffered = 0
+        self._deadline = None
+
+    def doRollover(self):
+        self._write_buffer()
+        FastRotatingFileHandler.doRollover(self)
+
+    def flush(self):
+        """
+        Writes the buffered records to the logfile.
+        """
+        self.acquire()
+        try:
+            self._write_buffer()
+            if self.stream and hasattr(self.stream, "flush"):
+                self.stream.flush()
+        finally:
+            self.release()
+
+    def _run_flusher(self):
+        while not self._stop.wait(min(self.flushInterval, 1.0)):
+            deadline = self._deadline
+            if deadline is not None and time.time() >= deadline:
+                self.flush()
+
+    def close(self):
+        """
+        Writes the buffered records, stops the flusher thread and closes the logfile.
+        """
+        self._stop.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        self.acquire()
+        try:
+            self._write_buffer()
+        finally:
+            self.release()
+        FastRotatingFileHandler.close(self)
+
+
+class ThreadBufferedFileHandler(BufferedRotatingFileHandler):
+    """
+    A `BufferedRotatingFileHandler` for many threads logging at once. Logging
+    threads don't take the handler lock: each formats its records and appends
+    them to its own buffer. The flusher thread regularly merges the buffers of
+    all threads by the time of the records and writes them to the file.
+
+    The records of each thread are written in the order they were logged.
+    Records of different threads are in timestamp order within every flush,
+    a record logged just before a flush may come after newer records of other
+    threads flushed with it.
+
+    A thread's buffer is written out when it holds ``threadBufferSize``
+    records, when a record with level ``flushLevel`` or higher is logged,
+    every ``flushInterval`` seconds and when the handler is flushed or closed.
+    """
+    def __init__(self, filename, mode='a', maxBytes=0, backupCount=0,
+                 encoding=None, delay=False, threadBufferSize=1000,
+                 flushInterval=0.5, **kwargs):
+        """
+        :arg int threadBufferSize: Write the buffers once a thread has buffered this many records. Defaults to 1000.
+        :arg float flushInterval: Seconds between two writes of the buffers by the flusher thread. Defaults to 0.5.
+
+        The other arguments are the same as for `BufferedRotatingFileHandler`.
+        """
+        if not flushInterval:
+            raise ValueError("flushInterval must be set, got %r" % (flushInterval, ))
+        self.threadBufferSize = threadBufferSize
+        self._local = threading.local()
+        # (thread, deque of (created, message)) of every thread which logged
+        self._thread_buffers = []
+        self._thread_buffers_lock = threading.Lock()
+        BufferedRotatingFileHandler.__init__(self, filename, mode=mode,
+                                             maxBytes=maxBytes,
+                                             backupCount=backupCount,
+                                             encoding=encoding, delay=delay,
+                                             flushInterval=flushInterval,
+                                             **kwargs)
+
+    def handle(self, record):
+        # Like Handler.handle, but without taking the handler lock
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record):
+        try:
+            msg = self.format(record) + getattr(self, 'terminator', '\n')
+            try:
+                thread_buffer = self._local.buffer
+            except AttributeError:
+                thread_buffer = self._local.buffer = collections.deque()
+                with self._thread_buffers_lock:
+                    self._thread_buffers.append((threading.current_thread(), thread_buffer))
+            # deque.append is atomic
+            thread_buffer.append((record.created, msg))
+        except Exception:
+            self.handleError(record)
+            return
+        if record.levelno >= self.flushLevel or len(thread_buffer) >= self.threadBufferSize:
+            self.flush()
+
+    def flush(self):
+        """
+        Merges the buffers of all threads and writes them to the logfile.
+        """
+        self.acquire()
+        try:
+            with self._thread_buffers_lock:
+                thread_buffers = list(self._thread_buffers)
+            batches = []
+            for thread, thread_buffer in thread_buffers:
+                count = len(thread_buffer)
+                if count:
+                    batches.append([thread_buffer.popleft() for _ in range(count)])
+                elif not thread.is_alive():
+                    with self._thread_buffers_lock:
+                        self._thread_buffers.remove((thread, thread_buffer))
+
+            # merge() keeps the order of the records of each thread
+            for _created, msg in heapq.merge(*batches):
+                self._write_formatted(msg)
+        finally:
+            self.release()
+        BufferedRotatingFileHandler.flush(self)
+
+    def _run_flusher(self):
+        while not self._stop.wait(self.flushInterval):
+            self.flush()
+
+    def close(self):
+        """
+        Writes the buffers of all threads, stops the flusher thread and closes the logfile.
+        """
+        self._stop.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        self.flush()
+        BufferedRotatingFileHandler.close(self)
+
+
+def _close_async_handlers():
+    for handler in list(_async_handlers):
+        handler.close()
+
+
+# Finish renaming backups on exit. Registered first, so it runs after the
+# async handlers are closed (which may cause a last rollover).
+atexit.register(_rotation_worker.wait)
+
+# Flush queued records on exit, also of handlers not attached to any logger anymore
+atexit.register(_close_async_handlers)
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+Loggers which only fill in the record attributes somebody uses.
+
+* `FastLogger` skips looking up the caller of a logging call (a walk of the
+  stack), and the thread and process of the record, when none of the
+  filters, handlers and formatters the record reaches use them.
+
+Handlers and filters tell which record attributes they use with a
+``recordAttrs`` attribute, see `record_attrs()`.
+"""
+import io
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+
+from logzero.callsites import SITE_ATTRS
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    # Python 2
+    from collections import Mapping
+
+# Record attributes which FastLogger leaves out when they aren't used
+THREAD_ATTRS = frozenset(['thread', 'threadName'])
+PROCESS_ATTRS = frozenset(['process', 'processName'])
+OPTIONAL_ATTRS = SITE_ATTRS | THREAD_ATTRS | PROCESS_ATTRS | frozenset(['taskName'])
+
+_NO_ATTRS = frozenset()
+
+# The attributes of the records of this Python version. Records are only
+# created by FastLogger if it knows all of them.
+_RECORD_ATTRS = frozenset(logging.LogRecord('', logging.INFO, '', 0, '', (), None).__dict__)
+_FAST_RECORDS = _RECORD_ATTRS <= OPTIONAL_ATTRS | frozenset([
+    'name', 'msg', 'args', 'levelname', 'levelno', 'exc_info', 'exc_text', 'stack_info',
+    'created', 'msecs', 'relativeCreated'])
+
+_FIELD_PATTERNS = {
+    '%': re.compile(r'%\((\w+)\)'),
+    '{': re.compile(r'\{(\w+)'),
+    '$': re.compile(r'\$\{?(\w+)'),
+}
+
+# Frames of these files are skipped when looking for the caller
+_INTERNAL_FILES = frozenset(os.path.normcase(os.path.splitext(filename)[0])
+                            for filename in (logging.__file__, __file__))
+# co_filename -> whether it is one of _INTERNAL_FILES
+_internal_filenames = {}
+
+_UNKNOWN_CALLER = ("(unknown file)", 0, "(unknown function)")
+
+# pathname -> (filename, module)
+_path_names = {}
+
+
+def format_attrs(fmt, style='%'):
+    """
+    Returns the record attributes in the format string ``fmt`` of a
+    formatter, eg. ``lineno`` and ``message`` for ``"%(lineno)d %(message)s"``.
+    """
+    return frozenset(_FIELD_PATTERNS[style].findall(fmt or ''))
+
+
+def _formatter_attrs(formatter):
+    if formatter is None:
+        # logging formats records without a formatter with "%(message)s"
+        return _NO_ATTRS
+    if type(formatter) is logging.Formatter:
+        style = getattr(formatter, '_style', None)
+        if style is not None:
+            style = {logging.StrFormatStyle: '{', logging.StringTemplateStyle: '$'}.get(type(style), '%')
+        return format_attrs(formatter._fmt, style or '%')
+    return getattr(formatter, 'recordAttrs', None)
+
+
+def _filter_attrs(record_filter):
+    if type(record_filter) is logging.Filter:
+        return _NO_ATTRS
+    return getattr(record_filter, 'recordAttrs', None)
+
+
+def _formatting_handlers():
+    handlers = (logging.StreamHandler, logging.NullHandler)
+    stdlib_handlers = sys.modules.get('logging.handlers')
+    if stdlib_handlers is not None:
+        handlers += (stdlib_handlers.SysLogHandler, )
+    return handlers
+
+
+def _handler_attrs(handler):
+    attrs = getattr(handler, 'recordAttrs', None)
+    if attrs is None:
+        if not isinstance(handler, _formatting_handlers()):
+            return None
+        attrs = _NO_ATTRS
+    used = [attrs, _formatter_attrs(handler.formatter)]
+    used.extend(_filter_attrs(record_filter) for record_filter in handler.filters)
+    # Wrapped by AsyncHandler, SpoolHandler, ...
+    wrapped = getattr(handler, 'handler', None)
+    if isinstance(wrapped, logging.Handler):
+        used.append(_handler_attrs(wrapped))
+    if None in used:
+        return None
+    return frozenset().union(*used)
+
+
+def record_attrs(logger):
+    """
+    Returns the record attributes used by the filters, handlers and
+    formatters which the records of ``logger`` reach, or None if one of them
+    may use any attribute.
+
+    Known are `logging.Formatter`, `logging.Filter`, logging's stream, file
+    and syslog handlers (which use the attributes of their formatter), and
+    the handlers, filters and formatters with a ``recordAttrs`` attribute:
+    the attributes they use (besides the ones of their formatter, and their
+    wrapped ``handler``), or None if they may use any.
+    """
+    used = []
+    current = logger
+    while current:
+        used.extend(_filter_attrs(record_filter) for record_filter in current.filters)
+        used.extend(_handler_attrs(handler) for handler in current.handlers)
+        if not current.propagate:
+            break
+        current = current.parent
+    if None in used:
+        return None
+    return frozenset().union(*used)
+
+
+def _record_factory():
+    get_factory = getattr(logging, 'getLogRecordFactory', None)
+    return logging.LogRecord if get_factory is None else get_factory()
+
+
+def _caller(stack_info=False, stacklevel=1):
+    """
+    Returns the file, line and function of the logging call, and the stack
+    rendered like `logging.Logger.findCaller` does.
+    """
+    frame = sys._getframe(1)
+    while frame is not None and _is_internal(frame):
+        frame = frame.f_back
+    while frame is not None and stacklevel > 1:
+        frame = frame.f_back
+        if frame is not None and not _is_internal(frame):
+            stacklevel -= 1
+    if frame is None:
+        return _UNKNOWN_CALLER + (None, )
+    code = frame.f_code
+    sinfo = None
+    if stack_info:
+        stack = io.StringIO() if sys.version_info >= (3, ) else io.BytesIO()
+        stack.write("Stack (most recent call last):\n")
+        traceback.print_stack(frame, file=stack)
+        sinfo = stack.getvalue().rstrip("\n")
+    return code.co_filename, frame.f_lineno, code.co_name, sinfo
+
+
+def _is_internal(frame):
+    filename = frame.f_code.co_filename
+    internal = _internal_filenames.get(filename)
+    if internal is None:
+        internal = _internal_filenames[filename] = \
+            os.path.normcase(os.path.splitext(filename)[0]) in _INTERNAL_FILES
+    return internal
+
+
+def _path_names_of(pathname):
+    try:
+        return _path_names[pathname]
+    except KeyError:
+        pass
+    except TypeError:
+        # Unhashable pathname
+        return pathname, "Unknown module"
+    try:
+        filename = os.path.basename(pathname)
+        names = (filename, os.path.splitext(filename)[0])
+    except (TypeError, ValueError, AttributeError):
+        names = (pathname, "Unknown module")
+    if len(_path_names) >= 10000:
+        _path_names.clear()
+    _path_names[pathname] = names
+    return names
+
+
+def _start_time():
+    # Nanoseconds since Python 3.13
+    start = logging._startTime
+    return start / 1e9 if start > 1e12 else start
+
+
+def make_record(name, level, pathname, lineno, msg, args, exc_info, func=None, sinfo=None, attrs=None):
+    """
+    Creates a `logging.LogRecord` like logging does, but fills in the thread
+    and process attributes only if they are in ``attrs`` (the others are
+    None). The file and module names are computed once per ``pathname``.
+    """
+    created = time.time()
+    if args and len(args) == 1 and isinstance(args[0], Mapping) and args[0]:
+        args = args[0]
+    filename, module = _path_names_of(pathname)
+    d = {
+        'name': name,
+        'msg': msg,
+        'args': args,
+        'levelname': logging.getLevelName(level),
+        'levelno': level,
+        'pathname': pathname,
+        'filename': filename,
+        'module': module,
+        'exc_info': exc_info,
+        'exc_text': None,
+        'lineno': lineno,
+        'funcName': func,
+        'created': created,
+        'msecs': int((created - int(created)) * 1000) + 0.0,
+        'relativeCreated': (created - _start_time()) * 1000,
+        'thread': None,
+        'threadName': None,
+        'process': None,
+        'processName': None,
+    }
+    if 'stack_info' in _RECORD_ATTRS:
+        d['stack_info'] = sinfo
+    if 'taskName' in _RECORD_ATTRS:
+        d['taskName'] = None
+    if attrs:
+        _add_optional_attrs(d, attrs)
+    record = logging.LogRecord.__new__(logging.LogRecord)
+    record.__dict__ = d
+    return record
+
+
+def _add_optional_attrs(d, attrs):
+    if logging.logThreads and not THREAD_ATTRS.isdisjoint(attrs):
+        d['thread'] = threading.current_thread().ident
+        d['threadName'] = threading.current_thread().name
+    if logging.logProcesses and 'process' in attrs:
+        d['process'] = os.getpid()
+    if logging.logMultiprocessing and 'processName' in attrs:
+        d['processName'] = 'MainProcess'
+        multiprocessing = sys.modules.get('multiprocessing')
+        if multiprocessing is not None:
+            try:
+                d['processName'] = multiprocessing.current_process().name
+            except Exception:
+                pass
+    if 'taskName' in attrs and 'taskName' in d and getattr(logging, 'logAsyncioTasks', True):
+        asyncio = sys.modules.get('asyncio')
+        if asyncio is not None:
+            try:
+                d['taskName'] = asyncio.current_task().get_name()
+            except Exception:
+                pass
+
+
+class FastLogger(logging.Logger):
+    """
+    A logger which creates its records with only the attributes the
+    filters, handlers and formatters they reach use (see `record_attrs()`):
+    without a format like ``%(module)s:%(lineno)d`` it doesn't look up the
+    caller of the logging call, which is the most expensive part of creating
+    a record, and without ``%(thread)d`` etc. it doesn't fill in the thread
+    and process. The attributes left out are None, the caller is
+    ``(unknown file)``, like logging does with ``logging._srcfile = None``
+    and ``logging.logThreads = False``.
+
+    If any of them may use any attribute (eg. a `JsonFormatter`, or a
+    filter or handler of another library), or another record factory is
+    set with ``logging.setLogRecordFactory()``, records are created like
+    logging does.
+
+    Create it with ``setup_logger(fastRecords=True)``, or for all loggers
+    created later with ``logging.setLoggerClass(FastLogger)``.
+    """
+    # (the filters, handlers and formatters, record_attrs() of them)
+    _record_attrs = (None, None)
+
+    def used_attrs(self):
+        """
+        Returns `record_attrs()` of this logger, cached until its filters,
+        handlers or formatters change.
+        """
+        key = []
+        current = self
+        while current:
+            key.append(tuple(current.filters))
+            for handler in current.handlers:
+                formatter = handler.formatter
+                key.append((handler, formatter, getattr(formatter, '_fmt', None), tuple(handler.filters)))
+            if not current.propagate:
+                break
+            current = current.parent
+        cached_key, attrs = self._record_attrs
+        if key != cached_key:
+            attrs = record_attrs(self)
+            self._record_attrs = (key, attrs)
+        return attrs
+
+    def findCaller(self, stack_info=False, stacklevel=1):
+        attrs = self.used_attrs()
+        if stack_info or attrs is None or not SITE_ATTRS.isdisjoint(attrs):
+            caller = _caller(stack_info, stacklevel)
+        else:
+            caller = _UNKNOWN_CALLER + (None, )
+        # Python 2 doesn't have stack_info
+        return caller if sys.version_info >= (3, ) else caller[:3]
+
+    def makeRecord(self, name, level, fn, lno, msg, args, exc_info, func=None, extra=None, sinfo=None):
+        if logging._srcfile:
+            # Brought up to date by findCaller(), just before
+            attrs = self._record_attrs[1]
+        else:
+            attrs = self.used_attrs()
+        if attrs is None or not _FAST_RECORDS or _record_factory() is not logging.LogRecord:
+            if sys.version_info >= (3, ):
+                return logging.Logger.makeRecord(self, name, level, fn, lno, msg, args, exc_info, func, extra, sinfo)
+            return logging.Logger.makeRecord(self, name, level, fn, lno, msg, args, exc_info, func, extra)
+
+        record = make_record(name, level, fn, lno, msg, args, exc_info, func, sinfo, attrs)
+        if extra is not None:
+            for key in extra:
+                if key in ('message', 'asctime') or key in record.__dict__:
+                    raise KeyError("Attempt to overwrite %r in LogRecord" % key)
+                record.__dict__[key] = extra[key]
+        return record
+
+
+def use_fast_logger(logger, enabled=True):
+    """
+    Turns ``logger`` into a `FastLogger`, or with ``enabled=False`` back into
+    a `logging.Logger`. Loggers of other classes are left alone.
+    """
+    if enabled and type(logger) is logging.Logger:
+        logger.__class__ = FastLogger
+    elif not enabled and type(logger) is FastLogger:
+        logger.__class__ = logging.Logger
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+Logging from many processes to the same logfile.
+
+* `MultiprocessHandler` lets a single process write (and rotate) the logfile,
+  all other processes send their records to it over a Unix socket.
+"""
+import functools
+import hashlib
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import weakref
+from logging.handlers import RotatingFileHandler
+from multiprocessing.connection import Client, Connection
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from logzero._records import record_from_bytes, record_to_bytes
+
+# The handlers of this process, see _after_fork_in_child()
+_handlers = weakref.WeakSet()
+
+
+def socket_address(filename):
+    """
+    Returns the address of the Unix socket of the process writing ``filename``.
+    It lives in the temp directory, as socket paths are limited to about 100
+    characters.
+    """
+    key = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()[:20]
+    return os.path.join(tempfile.gettempdir(), "logzero-%s.sock" % key)
+
+
+class MultiprocessHandler(logging.Handler):
+    """
+    Writes the logfile from only one process, so that processes don't
+    interleave partial lines or race each other rotating the file.
+
+    Every process logging to the same ``filename`` creates this handler. The
+    first one becomes the writer: it owns the file handler (created with
+    ``createHandler``) and a thread which accepts connections from the other
+    processes on a Unix socket. The others send their records to it as JSON
+    (the message merged with its arguments, tracebacks already rendered), the
+    writer formats them. If the writer exits, the next process which logs
+    takes over. A lock file next to the socket makes sure there is only one
+    writer at a time.
+
+    Processes forked from the writer (or from another process) connect to it
+    the first time they log. To let a parent process (eg. the gunicorn
+    master) own the logfile, create the handler before forking.
+
+    Needs Unix domain sockets, ie. doesn't work on Windows.
+    """
+    # Only passes records on, see logzero.loggers.record_attrs()
+    recordAttrs = frozenset()
+
+    def __init__(self, filename, mode='a', maxBytes=0, backupCount=0,
+                 encoding=None, address=None, createHandler=None,
+                 connectTimeout=5.0):
+        """
+        :arg string filename: The logfile.
+        :arg string mode: Mode to open the logfile with. Defaults to ``a``.
+        :arg int maxBytes: Size of the logfile when rollover should occur. Defaults to 0, rollover never occurs.
+        :arg int backupCount: Number of backups to keep. Defaults to 0, rollover never occurs.
+        :arg string encoding: Encoding of the logfile.
+        :arg string address: Path of the Unix socket. Defaults to one derived from ``filename``, see `socket_address(..)`.
+        :arg createHandler: Function returning the handler which writes the logfile in the writer process. Defaults to a ``RotatingFileHandler`` with the arguments above.
+        :arg float connectTimeout: Seconds to try connecting to the writer while another process is just becoming it. Defaults to 5.
+        """
+        if fcntl is None or not hasattr(socket, 'AF_UNIX'):
+            raise NotImplementedError("MultiprocessHandler needs Unix domain sockets")
+        logging.Handler.__init__(self)
+        self.baseFilename = os.path.abspath(filename)
+        self.address = address or socket_address(filename)
+        self.connectTimeout = connectTimeout
+        if createHandler is None:
+            createHandler = functools.partial(RotatingFileHandler, self.baseFilename, mode=mode,
+                                              maxBytes=maxBytes, backupCount=backupCount,
+                                              encoding=encoding)
+        self._create_handler = createHandler
+        # The file handler, in the writer process only
+        self.handler = None
+        self._writer = None
+        self._conn = None
+        self._closed = False
+        self._pid = os.getpid()
+        self._connect()
+        _handlers.add(self)
+
+    @property
+    def is_writer(self):
+        """
+        Whether this process writes the logfile.
+        """
+        return self._writer is not None
+
+    def setFormatter(self, fmt):
+        # Records are formatted by the file handler of the writer
+        logging.Handler.setFormatter(self, fmt)
+        if self.handler is not None:
+            self.handler.setFormatter(fmt)
+
+    def emit(self, record):
+        if self._closed:
+            return
+        try:
+            if self._pid != os.getpid():
+                self._after_fork()
+            if self._writer is None and self._conn is None:
+                self._connect()
+
+            if self._writer is not None:
+                self.handler.handle(record)
+                return
+
+            data = record_to_bytes(record)
+            try:
+                self._conn.send_bytes(data)
+            except (EOFError, IOError, OSError):
+                # The writer has exited, connect to (or become) the next one
+                self._conn.close()
+                self._conn = None
+                self._connect()
+                if self._writer is not None:
+                    self.handler.handle(record)
+                else:
+                    self._conn.send_bytes(data)
+        except Exception:
+            self.handleError(record)
+
+    def _connect(self):
+        """
+        Connects to the writer, or becomes the writer if there is none.
+        """
+        deadline = time.time() + self.connectTimeout
+        while True:
+            try:
+                self._conn = Client(self.address, family='AF_UNIX')
+                return
+            except (IOError, OSError):
+                pass
+            if self._become_writer():
+                return
+            # Another process holds the lock, but isn't listening yet
+            if time.time() > deadline:
+                raise IOError("Can't connect to the process writing %s at %s" % (self.baseFilename, self.address))
+            time.sleep(0.01)
+
+    def _become_writer(self):
+        lock_file = open(self.address + ".lock", "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            lock_file.close()
+            return False
+
+        try:
+            # Left behind by a writer which was killed
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            listener.bind(self.address)
+            listener.listen(64)
+            handler = self._create_handler()
+        except Exception:
+            lock_file.close()
+            raise
+        if self.formatter is not None:
+            handler.setFormatter(self.formatter)
+        self.handler = handler
+        self._writer = _LogWriter(listener, lock_file, handler)
+        return True
+
+    def _after_fork(self):
+        # The connection to the writer (or the writer itself, whose threads
+        # don't run in this process) belongs to the parent process. Close
+        # the copies of their file descriptors, the parent keeps using them:
+        # the lock file stays locked, and readers of the writer don't see
+        # the end of a connection, as long as a copy is open.
+        self._pid = os.getpid()
+        if self._conn is not None:
+            self._conn.close()
+        if self._writer is not None:
+            self._writer.close_inherited()
+        self._conn = None
+        self._writer = None
+        self.handler = None
+
+    def close(self):
+        """
+        Closes the connection to the writer. In the writer process, stops
+        accepting connections, writes the records which other processes have
+        already sent and closes the logfile.
+        """
+        self.acquire()
+        try:
+            self._closed = True
+            if self._pid == os.getpid():
+                if self._writer is not None:
+                    self._writer.close()
+                    self._writer = None
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+        finally:
+            self.release()
+        logging.Handler.close(self)
+
+
+class _LogWriter(object):
+    """
+    Accepts connections from other processes on the listening socket, and
+    hands the records they send to the file handler, in one thread per
+    connection.
+    """
+    def __init__(self, listener, lock_file, handler):
+        self.listener = listener
+        self.address = listener.getsockname()
+        self.lock_file = lock_file
+        self.handler = handler
+        self._stop = threading.Event()
+        self._readers = []
+        # The connections being read, closed by their reader
+        self._conns = set()
+        self._thread = threading.Thread(target=self._accept, name="logzero-multiprocess-writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _accept(self):
+        # Once stopped, keep accepting until no connection is waiting
+        self.listener.settimeout(0.1)
+        while True:
+            try:
+                sock = self.listener.accept()[0]
+            except socket.timeout:
+                if self._stop.is_set():
+                    return
+                continue
+            except (IOError, OSError):
+                if self._stop.is_set():
+                    return
+                time.sleep(0.1)
+                continue
+            sock.setblocking(True)
+            conn = Connection(os.dup(sock.fileno()))
+            sock.close()
+            self._conns.add(conn)
+            reader = threading.Thread(target=self._read, args=(conn, ), name="logzero-multiprocess-reader")
+            reader.daemon = True
+            reader.start()
+            self._readers.append(reader)
+
+    def _read(self, conn):
+        try:
+            while True:
+                # Once stopped, keep reading until the connection is quiet
+                if not conn.poll(0.1):
+                    if self._stop.is_set():
+                        return
+                    continue
+                data = conn.recv_bytes()
+                try:
+                    record = record_from_bytes(data)
+                except ValueError:
+                    continue
+                self.handler.handle(record)
+        except (EOFError, IOError, OSError):
+            pass
+        finally:
+            self._conns.discard(conn)
+            conn.close()
+
+    def close_inherited(self):
+        """
+        Closes the file descriptors of the writer in a process forked from
+        it, without stopping the writer of the parent process.
+        """
+        for conn in list(self._conns):
+            conn.close()
+        self._conns.clear()
+        self.listener.close()
+        self.lock_file.close()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        for reader in self._readers:
+            reader.join()
+        self.listener.close()
+        try:
+            os.unlink(self.address)
+        except OSError:
+            pass
+        self.handler.close()
+        # Lets the next writer take over
+        self.lock_file.close()
+
+
+def _after_fork_in_child():
+    for handler in list(_handlers):
+        if handler._pid != os.getpid():
+            handler._after_fork()
+
+
+# Before Python 3.7, handlers only notice the fork when they are next used
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+"""
+Shipping log records to syslog servers and remote log collectors.
+
+* `ShippingHandler` sends records as RFC 5424 syslog messages over a
+  persistent TCP, Unix socket or UDP connection, in batches from a
+  background thread, and reconnects when the connection breaks.
+"""
+import collections
+import errno
+import logging
+import os
+import select
+import socket
+import sys
+import threading
+import time
+
+from logzero.handlers import _async_handlers
+
+TRANSPORT_TCP = 'tcp'
+TRANSPORT_UDP = 'udp'
+TRANSPORT_UNIX = 'unix'
+TRANSPORTS = (TRANSPORT_TCP, TRANSPORT_UDP, TRANSPORT_UNIX)
+
+# How messages are delimited on stream connections (RFC 6587)
+FRAMING_OCTET_COUNTING = 'octet_counting'
+FRAMING_NEWLINE = 'newline'
+FRAMINGS = (FRAMING_OCTET_COUNTING, FRAMING_NEWLINE)
+
+# Same as SysLogHandler.LOG_USER
+LOG_USER = 1
+
+DEFAULT_PORT = 514
+DEFAULT_UNIX_ADDRESS = '/dev/log'
+
+# Errors sending a datagram which sending it again won't fix
+_DATAGRAM_ERRORS = frozenset([errno.EMSGSIZE])
+
+
+def syslog_severity(levelno):
+    """
+    Returns the syslog severity of a log level.
+    """
+    if levelno >= logging.CRITICAL:
+        return 2
+    if levelno >= logging.ERROR:
+        return 3
+    if levelno >= logging.WARNING:
+        return 4
+    if levelno >= logging.INFO:
+        return 6
+    return 7
+
+
+def _header_field(value, maxLength):
+    # Printable ASCII without spaces, "-" for none (RFC 5424 section 6)
+    value = ''.join(c for c in str(value) if '!' <= c <= '~')[:maxLength]
+    return value or '-'
+
+
+class ShippingHandler(logging.Handler):
+    """
+    Sends records as RFC 5424 syslog messages to a syslog server or log
+    collector, without making the logging threads wait for the network.
+
+    Records are formatted on the logging thread and put into an in-memory
+    spool. A background thread keeps one connection open and sends what
+    has piled up in the spool in one write, so the number of writes drops
+    as the rate of records grows. On stream connections (TCP and Unix
+    stream sockets) messages are framed by octet counting (or newlines,
+    with ``framing='newline'``). Over UDP and Unix datagram sockets (like
+    ``/dev/log``) every message is a datagram of its own.
+
+    When the connection breaks, the thread reconnects, waiting longer
+    after every failed attempt (up to ``maxReconnectDelay``). Meanwhile
+    the spool holds up to ``spoolSize`` records, after that the oldest are
+    discarded and counted in ``dropped``. A batch which was being sent when
+    the connection broke is sent again, so the receiver may see a few
+    records twice. Messages which can't be sent as a datagram, because they
+    are too large, are discarded too.
+
+    ``sent``, ``batches`` and ``dropped`` count the records sent, the
+    writes they were sent in, and the records discarded (also those logged
+    after the handler was closed).
+    """
+    # Record attributes used (besides the ones of the formatter), see
+    # logzero.loggers.record_attrs()
+    recordAttrs = frozenset(['process'])
+
+    def __init__(self, address=None, transport=TRANSPORT_TCP, facility=LOG_USER,
+                 framing=FRAMING_OCTET_COUNTING, appName=None, hostname=None,
+                 spoolSize=10000, batchSize=1000, maxBatchBytes=1 << 20,
+                 timeout=5.0, reconnectDelay=0.1, maxReconnectDelay=10.0):
+        """
+        :arg address: ``(host, port)``, or the path of the Unix socket. Defaults to ``('localhost', 514)``, or ``/dev/log`` with ``transport='unix'``.
+        :arg string transport: ``tcp``, ``udp`` or ``unix``. Defaults to ``tcp``.
+        :arg int facility: Syslog facility, eg. ``SysLogHandler.LOG_LOCAL0``. Defaults to ``LOG_USER``.
+        :arg string framing: ``octet_counting`` or ``newline``, for stream connections. Defaults to ``octet_counting``, which allows multi-line messages.
+        :arg string appName: The APP-NAME of the messages. Defaults to the name of the script.
+        :arg string hostname: The HOSTNAME of the messages. Defaults to ``socket.gethostname()``.
+        :arg int spoolSize: Maximum number of records waiting to be sent. Defaults to 10000.
+        :arg int batchSize: Maximum number of records sent in one write. Defaults to 1000.
+        :arg int maxBatchBytes: Maximum size of one write. Defaults to 1 MiB.
+        :arg float timeout: Seconds to wait for connecting or sending before reconnecting, and for `flush()` and `close()`. Defaults to 5.
+        :arg float reconnectDelay: Seconds to wait before reconnecting the first time, doubled after every failed attempt. Defaults to 0.1.
+        :arg float maxReconnectDelay: Longest wait between reconnection attempts. Defaults to 10.
+        """
+        if transport not in TRANSPORTS:
+            raise ValueError("transport must be one of %s, got %r" % (", ".join(TRANSPORTS), transport))
+        if framing not in FRAMINGS:
+            raise ValueError("framing must be one of %s, got %r" % (", ".join(FRAMINGS), framing))
+        logging.Handler.__init__(self)
+        if address is None:
+            address = DEFAULT_UNIX_ADDRESS if transport == TRANSPORT_UNIX else ('localhost', DEFAULT_PORT)
+        self.address = address
+        self.transport = transport
+        self.facility = facility
+        self.framing = framing
+        if appName is None:
+            appName = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None
+        self.appName = _header_field(appName or '-', 48)
+        self.hostname = _header_field(hostname or socket.gethostname(), 255)
+        self.spoolSize = spoolSize
+        self.batchSize = batchSize
+        self.maxBatchBytes = maxBatchBytes
+        self.timeout = timeout
+        self.reconnectDelay = reconnectDelay
+        self.maxReconnectDelay = maxReconnectDelay
+        self.sent = 0
+        self.batches = 0
+        self.dropped = 0
+        # The encoded messages, not framed yet
+        self._spool = collections.deque()
+        self._sending = 0
+        self._cond = threading.Condition()
+        self._closing = False
+        # Waiting before reconnecting, not woken up by new records
+        self._backoff = False
+        self._deadline = None
+        self._sock = None
+        self._stream = False
+        self._timestamp = (None, None)
+        self._thread = threading.Thread(target=self._run, name="logzero-shipping")
+        self._thread.daemon = True
+        self._thread.start()
+        _async_handlers.add(self)
+
+    def emit(self, record):
+        try:
+            data = self.encode(record)
+        except Exception:
+            self.handleError(record)
+            return
+        with self._cond:
+            if self._closing:
+                self.dropped += 1
+                return
+            if len(self._spool) >= self.spoolSize:
+                self._spool.popleft()
+                self.dropped += 1
+            self._spool.append(data)
+            if not self._backoff:
+                self._cond.notify()
+
+    def encode(self, record):
+        """
+        Returns the RFC 5424 message of the record as bytes: a header with
+        the priority, timestamp, hostname, app name and process id, followed
+        by the formatted record.
+        """
+        msg = self.format(record)
+        if not isinstance(msg, bytes):
+            msg = msg.encode('utf-8', 'replace')
+        header = "<%d>1 %s %s %s %s - - " % (
+            self.facility * 8 + syslog_severity(record.levelno), self._format_time(record.created),
+            self.hostname, self.appName, record.process or '-')
+        return header.encode('ascii') + msg
+
+    def _format_time(self, created):
+        # Rendering the date and time once per second is enough
+        second = int(created)
+        last_second, prefix = self._timestamp
+        if second != last_second:
+            prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+            self._timestamp = (second, prefix)
+        return "%s.%06dZ" % (prefix, (created - second) * 1000000)
+
+    def _frame(self, data):
+        if self.framing == FRAMING_NEWLINE:
+            return data + b"\n"
+        return str(len(data)).encode('ascii') + b" " + data
+
+    def _run(self):
+        delay = self.reconnectDelay
+        while True:
+            with self._cond:
+                while not self._spool and not self._closing:
+                    self._cond.wait()
+                if not self._spool:
+                    return
+
+            try:
+                if self._sock is not None and self._stream and self._peer_closed():
+                    self._disconnect()
+                if self._sock is None:
+                    self._connect()
+            except (IOError, OSError):
+                self._disconnect()
+                if not self._wait(delay):
+                    return
+                delay = min(delay * 2, self.maxReconnectDelay)
+                continue
+            delay = self.reconnectDelay
+
+            with self._cond:
+                batch = self._take_batch()
+            unsent = self._send(batch)
+            with self._cond:
+                self._sending = 0
+                if unsent:
+                    # Send them again after reconnecting, before the newer records
+                    self._spool.extendleft(reversed(unsent))
+                    while len(self._spool) > self.spoolSize:
+                        self._spool.popleft()
+                        self.dropped += 1
+                self._cond.notify_all()
+            if unsent:
+                self._disconnect()
+                if not self._wait(delay):
+                    return
+
+    def _take_batch(self):
+        batch = []
+        size = 0
+        spool = self._spool
+        while spool and len(batch) < self.batchSize:
+            if batch and size + len(spool[0]) > self.maxBatchBytes:
+                break
+            data = spool.popleft()
+            batch.append(data)
+            size += len(data)
+        self._sending = len(batch)
+        return batch
+
+    def _send(self, batch):
+        """
+        Sends the batch, returns the messages which couldn't be sent.
+        """
+        try:
+            if self._stream:
+                self._sock.sendall(b"".join([self._frame(data) for data in batch]))
+                self.sent += len(batch)
+                self.batches += 1
+                return []
+            for i, data in enumerate(batch):
+                try:
+                    self._sock.send(data)
+                except (IOError, OSError) as e:
+                    if e.errno not in _DATAGRAM_ERRORS:
+                        return batch[i:]
+                    # Eg. too large, discard it rather than block the others
+                    with self._cond:
+                        self.dropped += 1
+                    continue
+                self.sent += 1
+                self.batches += 1
+            return []
+        except (IOError, OSError):
+            return batch
+
+    def _wait(self, delay):
+        """
+        Waits ``delay`` seconds before reconnecting (less if the handler is
+        closed meanwhile). Returns False if the handler is being closed and
+        its time is up, after discarding the spooled records.
+        """
+        end = time.time() + delay
+        with self._cond:
+            self._backoff = True
+            try:
+                while True:
+                    until = end
+                    if self._closing:
+                        if self._deadline <= time.time():
+                            self.dropped += len(self._spool)
+                            self._spool.clear()
+                            self._cond.notify_all()
+                            return False
+                        until = min(end, self._deadline)
+                    remaining = until - time.time()
+                    if remaining <= 0:
+                        return True
+                    # Woken up by flush() and close() too
+                    self._cond.wait(remaining)
+            finally:
+                self._backoff = False
+
+    def _connect(self):
+        if self.transport == TRANSPORT_UNIX:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.address)
+            except (IOError, OSError) as e:
+                sock.close()
+                if e.errno != errno.EPROTOTYPE:
+                    raise
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(self.timeout)
+                try:
+                    sock.connect(self.address)
+                except (IOError, OSError):
+                    sock.close()
+                    raise
+        else:
+            socktype = socket.SOCK_STREAM if self.transport == TRANSPORT_TCP else socket.SOCK_DGRAM
+            host, port = self.address
+            sock = None
+            error = None
+            for family, _socktype, proto, _name, address in socket.getaddrinfo(host, port, 0, socktype):
+                try:
+                    sock = socket.socket(family, socktype, proto)
+                    sock.settimeout(self.timeout)
+                    sock.connect(address)
+                    break
+                except (IOError, OSError) as e:
+                    error = e
+                    if sock is not None:
+                        sock.close()
+                        sock = None
+            if sock is None:
+                raise error or IOError("Can't resolve %s" % host)
+        self._sock = sock
+        self._stream = sock.type == socket.SOCK_STREAM
+
+    def _peer_closed(self):
+        # A closed connection is only noticed by the second write after it
+        # was closed, the first write would be lost
+        try:
+            if not select.select([self._sock], [], [], 0)[0]:
+                return False
+            return not self._sock.recv(1, socket.MSG_PEEK)
+        except (IOError, OSError, select.error):
+            return True
+
+    def _disconnect(self):
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.close()
+            except (IOError, OSError):
+                pass
+
+    def flush(self):
+        """
+        Waits until the spooled records are sent, at most ``timeout`` seconds.
+        """
+        deadline = time.time() + self.timeout
+        with self._cond:
+            while (self._spool or self._sending) and self._thread is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return
+                self._cond.wait(remaining)
+
+    def close(self):
+        """
+        Sends the spooled records and closes the connection. If the
+        receiver is unreachable, the records still spooled after
+        ``timeout`` seconds are discarded.
+        """
+        self.acquire()
+        try:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                with self._cond:
+                    self._closing = True
+                    self._deadline = time.time() + self.timeout
+                    self._cond.notify_all()
+                thread.join()
+                self._disconnect()
+                _async_handlers.discard(self)
+        finally:
+            self.release()
+        logging.Handler.close(self)
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Spooling log records to disk while the logfile or syslog server is slow or
+down.
+
+* `RingFile` is an append-only ring of byte strings in a memory-mapped
+  file, which remembers how far it was read across restarts.
+* `SpoolHandler` puts records into a `RingFile`, and a background thread
+  delivers them in order to another handler.
+"""
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from logzero._records import record_from_bytes, record_to_bytes
+from logzero.handlers import _async_handlers
+
+# Magic, capacity, read position, write position
+_HEADER = struct.Struct('<8sQQQ')
+_MAGIC = b'LZSPOOL1'
+_LENGTH = struct.Struct('<I')
+# Marks the rest of the ring up to its end as unused
+_SKIP = 0xffffffff
+
+
+class RingFile(object):
+    """
+    An append-only ring of byte strings (eg. encoded log records) in a
+    memory-mapped file of fixed size. Appending copies the data into the
+    mapping, which the operating system writes to disk sequentially in
+    the background.
+
+    The read and write positions are kept in the header of the file, so
+    after a restart (or a crash of the process) reading continues where
+    it stopped. When the ring is full, the oldest entries are discarded to
+    make room and counted in ``dropped``.
+
+    Only one process can use the file at a time.
+    """
+    def __init__(self, filename, size=64 * 1024 * 1024):
+        """
+        :arg string filename: The spool file. Created if it doesn't exist, an existing one keeps its size.
+        :arg int size: Bytes the ring can hold. Defaults to 64 MiB.
+        """
+        self.filename = filename
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._file = open(filename, 'a+b')
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except (IOError, OSError):
+                    raise IOError("The spool file %s is used by another process" % filename)
+            self._file.seek(0)
+            header = self._file.read(_HEADER.size)
+            if len(header) == _HEADER.size and header[:len(_MAGIC)] == _MAGIC:
+                _magic, size, head, tail = _HEADER.unpack(header)
+                if not head <= tail <= head + size:
+                    head = tail = 0
+            else:
+                head = tail = 0
+                self._file.truncate(0)
+            if os.fstat(self._file.fileno()).st_size != _HEADER.size + size:
+                self._file.truncate(_HEADER.size + size)
+            self._map = mmap.mmap(self._file.fileno(), _HEADER.size + size)
+        except Exception:
+            self._file.close()
+            raise
+        self.size = size
+        self._head = head
+        self._tail = tail
+        self._store()
+
+    def __len__(self):
+        """
+        The number of bytes in use, including the framing.
+        """
+        return self._tail - self._head
+
+    def _store(self):
+        _HEADER.pack_into(self._map, 0, _MAGIC, self.size, self._head, self._tail)
+
+    def append(self, data):
+        """
+        Appends ``data``, discarding the oldest entries if there isn't
+        enough room. Returns False if ``data`` is larger than the ring.
+        """
+        needed = _LENGTH.size + len(data)
+        if needed > self.size:
+            self.dropped += 1
+            return False
+        with self._lock:
+            offset = self._tail % self.size
+            # Entries aren't split at the end of the ring
+            padding = self.size - offset if self.size - offset < needed else 0
+            while self._tail + padding + needed - self._head > self.size:
+                if self._head >= self._tail:
+                    # Empty, start over at the beginning
+                    self._tail += padding
+                    self._head = self._tail
+                    padding = offset = 0
+                    break
+                entry, self._head = self._next(self._head)
+                if entry is not None:
+                    self.dropped += 1
+            if padding:
+                if padding >= _LENGTH.size:
+                    _LENGTH.pack_into(self._map, _HEADER.size + offset, _SKIP)
+                offset = 0
+            start = _HEADER.size + offset
+            _LENGTH.pack_into(self._map, start, len(data))
+            self._map[start + _LENGTH.size:start + needed] = data
+            # Only now the entry becomes visible, also after a crash
+            self._tail += padding + needed
+            self._store()
+        return True
+
+    def _next(self, position):
+        """
+        Returns the entry at ``position`` (None for the end of the ring)
+        and the position of the next one.
+        """
+        offset = position % self.size
+        if self.size - offset >= _LENGTH.size:
+            length = _LENGTH.unpack_from(self._map, _HEADER.size + offset)[0]
+            if length != _SKIP:
+                if length > self.size - offset - _LENGTH.size:
+                    # Garbage, give up on what was written
+                    return None, self._tail
+                start = _HEADER.size + offset + _LENGTH.size
+                return self._map[start:start + length], position + _LENGTH.size + length
+        return None, position + self.size - offset
+
+    def read(self, maxCount=1000):
+        """
+        Returns up to ``maxCount`` of the oldest entries, as (entry,
+        position) pairs. They stay in the ring until the position of the
+        last one processed is passed to `commit(..)`.
+        """
+        entries = []
+        with self._lock:
+            position = self._head
+            while position < self._tail and len(entries) < maxCount:
+                data, position = self._next(position)
+                if data is not None:
+                    entries.append((data, position))
+        return entries
+
+    def commit(self, position):
+        """
+        Removes the entries up to ``position`` from the ring.
+        """
+        with self._lock:
+            # Unless they were discarded to make room in the meantime
+            if position > self._head:
+                self._head = position
+                self._store()
+
+    def flush(self):
+        """
+        Writes the changes to disk.
+        """
+        self._map.flush()
+
+    def close(self):
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+
+
+class SpoolHandler(logging.Handler):
+    """
+    Makes the threads which are logging independent of a slow or
+    unreachable logfile or syslog server: records are put into a `RingFile`
+    on disk, and a background thread delivers them in order to the wrapped
+    ``handler``, which formats and writes them.
+
+    The records are encoded as JSON, with the message merged with its
+    arguments and the traceback rendered. Memory use doesn't grow with the
+    number of spooled records, the spool file has a fixed size. When it is
+    full, the oldest records are discarded and counted in ``dropped``.
+
+    When the handler is closed (or the process exits), the spooled records
+    are delivered for at most ``timeout`` seconds. The ones which haven't
+    been delivered by then, because the wrapped handler is stalled, stay in
+    the spool file and are delivered first by the next `SpoolHandler`
+    using it.
+    """
+    # Only passes records on, see logzero.loggers.record_attrs()
+    recordAttrs = frozenset()
+
+    def __init__(self, handler, filename, size=64 * 1024 * 1024, batchSize=1000, timeout=5.0):
+        """
+        :arg Handler handler: The handler which formats and writes the records.
+        :arg string filename: The spool file.
+        :arg int size: Size of the spool file. Defaults to 64 MiB.
+        :arg int batchSize: Maximum number of records delivered before the read position in the spool file is updated (or the handler is closed). Defaults to 1000.
+        :arg float timeout: Seconds `close()` keeps delivering the spooled records. Defaults to 5.
+        """
+        logging.Handler.__init__(self)
+        self.handler = handler
+        self.batchSize = batchSize
+        self.timeout = timeout
+        self.ring = RingFile(filename, size)
+        self._wakeup = threading.Event()
+        self._idle = threading.Condition()
+        # Set by close(), until when records are delivered
+        self._deadline = None
+        # Delivers the records left from last time
+        self._wakeup.set()
+        self._thread = threading.Thread(target=self._run, name="logzero-spool")
+        self._thread.daemon = True
+        self._thread.start()
+        _async_handlers.add(self)
+
+    @property
+    def dropped(self):
+        return self.ring.dropped
+
+    def setFormatter(self, fmt):
+        # Records are formatted by the wrapped handler
+        self.handler.setFormatter(fmt)
+
+    def emit(self, record):
+        if self._thread is None:
+            # Closed, write synchronously
+            self.handler.handle(record)
+            return
+        try:
+            self.ring.append(record_to_bytes(record))
+            self._wakeup.set()
+        except Exception:
+            self.handleError(record)
+
+    def _expired(self):
+        return self._deadline is not None and time.time() >= self._deadline
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            closing = self._deadline is not None
+            while not self._expired():
+                entries = self.ring.read(self.batchSize)
+                if not entries:
+                    break
+                position = None
+                for data, position in entries:
+                    try:
+                        self.handler.handle(record_from_bytes(bytes(data)))
+                    except ValueError:
+                        pass
+                    if self._expired():
+                        break
+                self.ring.commit(position)
+            with self._idle:
+                self._idle.notify_all()
+            if closing:
+                return
+
+    def flush(self):
+        """
+        Blocks until the spooled records are delivered, and flushes the
+        wrapped handler.
+        """
+        with self._idle:
+            while len(self.ring) and self._thread is not None and self._deadline is None:
+                self._wakeup.set()
+                self._idle.wait(0.1)
+        self.handler.flush()
+
+    def close(self):
+        """
+        Delivers the spooled records, closes the spool file and the wrapped
+        handler. After ``timeout`` seconds, stops once the record being
+        delivered is delivered, the others stay in the spool file.
+        """
+        self.acquire()
+        try:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._deadline = time.time() + self.timeout
+                self._wakeup.set()
+                thread.join()
+                self.ring.close()
+                _async_handlers.discard(self)
+                self.handler.close()
+        finally:
+            self.release()
+        logging.Handler.close(self)
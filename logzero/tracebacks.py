@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Rendering of tracebacks, cached by where in the code they were raised.
+
+* `TracebackCache` renders the frames of a traceback once for every
+  exception type and chain of code locations, only the exception messages
+  are rendered per record. In compact mode, repeated tracebacks are
+  shortened to their first and last frame.
+"""
+import collections
+import threading
+import time
+import traceback
+import zlib
+
+# The lines which traceback.print_exception puts between chained exceptions
+CAUSE_MESSAGE = "\nThe above exception was the direct cause of the following exception:\n\n"
+CONTEXT_MESSAGE = "\nDuring handling of the above exception, another exception occurred:\n\n"
+
+try:
+    # Rendered as a tree of their exceptions, left to the traceback module
+    _BaseExceptionGroup = BaseExceptionGroup  # noqa: F821
+except NameError:
+    _BaseExceptionGroup = ()
+
+
+class TracebackCache(object):
+    """
+    Renders tracebacks like ``logging.Formatter.formatException``, but the
+    frames (with their source lines) are rendered only the first time an
+    exception type is raised through a chain of code locations. Repeated
+    exceptions only pay for walking the traceback and rendering their
+    message.
+
+    With ``compact``, a traceback is rendered in full only once per
+    ``window`` seconds, and in between shortened to its first and last frame
+    and the exception. Both start with ``Traceback id <id>``, a hash of the
+    exception type and code locations which is the same in every process,
+    to find the full traceback of a shortened one.
+
+    The source lines are cached along with the frames, so a changed source
+    file shows up in new tracebacks only.
+    """
+    def __init__(self, maxSize=1000, compact=False, window=60):
+        """
+        :arg int maxSize: Number of tracebacks to keep, the least recently used are dropped first. Defaults to 1000.
+        :arg bool compact: Shorten repeated tracebacks. Defaults to False.
+        :arg float window: In ``compact`` mode, render every traceback in full once per this many seconds. Defaults to 60.
+        """
+        self.maxSize = maxSize
+        self.compact = compact
+        self.window = window
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def format(self, exc_info, now=None):
+        """
+        Returns the rendered traceback of ``exc_info``, without a trailing
+        newline.
+        """
+        chain = _exception_chain(exc_info[1], exc_info[2])
+        if chain is None:
+            text = ''.join(traceback.format_exception(*exc_info))
+            return text[:-1] if text.endswith('\n') else text
+
+        key = tuple((type(value), link, _frames_key(tb)) for value, tb, link in chain)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+        if entry is None:
+            entry = _Traceback(chain)
+            with self._lock:
+                self._entries[key] = entry
+                while len(self._entries) > self.maxSize:
+                    self._entries.popitem(last=False)
+
+        if self.compact:
+            if now is None:
+                now = time.time()
+            # Not locked: when threads race, both may render in full
+            full = entry.logged_at is None or now - entry.logged_at >= self.window
+            if full:
+                entry.logged_at = now
+            else:
+                value = chain[-1][0]
+                lines = ["Traceback id %s (repeated, %d frames, the full traceback is logged every %g seconds):\n" % (
+                    entry.digest, entry.frame_count, self.window)]
+                lines.extend(entry.first_frame)
+                if entry.frame_count > 2:
+                    lines.append("  ...\n")
+                if entry.frame_count > 1:
+                    lines.extend(entry.last_frame)
+                lines.extend(traceback.format_exception_only(type(value), value))
+                return ''.join(lines).rstrip('\n')
+
+        lines = ["Traceback id %s:\n" % entry.digest] if self.compact else []
+        for (value, _tb, link), frames in zip(chain, entry.frames):
+            lines.append(frames)
+            lines.extend(traceback.format_exception_only(type(value), value))
+            if link is not None:
+                lines.append(link)
+        text = ''.join(lines)
+        return text[:-1] if text.endswith('\n') else text
+
+
+class _Traceback(object):
+    """
+    The rendered frames of a chain of exceptions.
+    """
+    __slots__ = ('frames', 'digest', 'frame_count', 'first_frame', 'last_frame', 'logged_at')
+
+    def __init__(self, chain):
+        self.frames = []
+        locations = []
+        extracted = []
+        for value, tb, _link in chain:
+            extracted = traceback.extract_tb(tb) if tb is not None else []
+            if extracted:
+                self.frames.append("Traceback (most recent call last):\n" + ''.join(traceback.format_list(extracted)))
+            else:
+                self.frames.append('')
+            locations.append((type(value).__module__, type(value).__name__,
+                              tuple((frame[0], frame[2], frame[1]) for frame in extracted)))
+        self.digest = '%08x' % (zlib.crc32(repr(locations).encode('utf-8')) & 0xffffffff)
+        # Of the last exception, which is the one being logged
+        self.frame_count = len(extracted)
+        self.first_frame = traceback.format_list(extracted[:1])
+        self.last_frame = traceback.format_list(extracted[-1:])
+        self.logged_at = None
+
+
+def _frames_key(tb):
+    """
+    The code locations a traceback passes through. The instruction offset
+    stands for the line (and column) of every frame.
+    """
+    frames = []
+    while tb is not None:
+        frames.append((tb.tb_frame.f_code, tb.tb_lasti))
+        tb = tb.tb_next
+    return tuple(frames)
+
+
+def _exception_chain(value, tb):
+    """
+    Returns the chained exceptions in the order ``traceback.print_exception``
+    prints them, as (exception, traceback, message leading to the next one),
+    or None if the exception can't be rendered by `TracebackCache`.
+    """
+    chain = []
+    seen = set()
+    link = None
+    while True:
+        if not isinstance(value, BaseException) or isinstance(value, _BaseExceptionGroup):
+            return None
+        seen.add(id(value))
+        chain.append((value, tb, link))
+        cause = getattr(value, '__cause__', None)
+        context = getattr(value, '__context__', None)
+        suppressed = getattr(value, '__suppress_context__', False)
+        if cause is not None and id(cause) not in seen:
+            value, link = cause, CAUSE_MESSAGE
+        elif context is not None and id(context) not in seen and not suppressed:
+            value, link = context, CONTEXT_MESSAGE
+        else:
+            break
+        tb = value.__traceback__
+    chain.reverse()
+    return chain
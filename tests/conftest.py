@@ -0,0 +1,24 @@
+import logging
+import sys
+
+import pytest
+
+collect_ignore = []
+if sys.version_info < (3, 7):
+    # async syntax and asyncio.run()
+    collect_ignore.append("test_aio.py")
+
+
+@pytest.fixture
+def make_logger():
+    """
+    Returns a function which sets up the logger ``name`` to log everything
+    to ``handler`` only.
+    """
+    def make_logger(name, handler):
+        logger = logging.getLogger(name)
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        logger.handlers = [handler]
+        return logger
+    return make_logger
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_aio
+----------------------------------
+
+Tests for `logzero.aio`.
+"""
+import asyncio
+import logging
+import re
+import threading
+import time
+
+import logzero
+from logzero import aio
+from logzero.aio import AsyncioHandler
+
+
+class SlowHandler(logging.Handler):
+    def __init__(self, delay=0):
+        logging.Handler.__init__(self)
+        self.delay = delay
+        self.messages = []
+        self.threads = set()
+        self.closed = False
+
+    def emit(self, record):
+        time.sleep(self.delay)
+        self.threads.add(threading.current_thread())
+        self.messages.append(record.getMessage())
+
+    def close(self):
+        self.closed = True
+        logging.Handler.close(self)
+
+
+def test_emit_does_not_block_loop(make_logger):
+    slow = SlowHandler(delay=0.01)
+    handler = AsyncioHandler(slow)
+    logger = make_logger("test_aio_emit", handler)
+
+    async def main():
+        start = time.time()
+        for i in range(20):
+            logger.info("record %d", i)
+        elapsed = time.time() - start
+        assert slow.messages == []
+        await handler.aflush()
+        assert slow.messages == ["record %d" % i for i in range(20)]
+        await handler.aclose()
+        return elapsed
+
+    assert asyncio.run(main()) < 0.1
+    assert threading.current_thread() not in slow.threads
+    assert slow.closed
+
+    # Once closed, records are written directly
+    logger.info("after close")
+    assert slow.messages[-1] == "after close"
+
+
+def test_records_from_other_threads(make_logger):
+    slow = SlowHandler()
+    handler = AsyncioHandler(slow)
+    logger = make_logger("test_aio_threads", handler)
+
+    async def main():
+        logger.info("on the loop")
+        thread = threading.Thread(target=logger.info, args=("from a thread", ))
+        thread.start()
+        await asyncio.get_event_loop().run_in_executor(None, thread.join)
+        await aio.flush(logger)
+
+    asyncio.run(main())
+    assert slow.messages == ["on the loop", "from a thread"]
+    handler.close()
+
+
+def test_records_written_after_loop_ends(make_logger):
+    slow = SlowHandler(delay=0.005)
+    handler = AsyncioHandler(slow)
+    logger = make_logger("test_aio_loop_ends", handler)
+
+    async def main():
+        for i in range(10):
+            logger.info("record %d", i)
+
+    asyncio.run(main())
+    # Without a loop, after the queued records
+    logger.info("record 10")
+    handler.close()
+    assert slow.messages == ["record %d" % i for i in range(11)]
+
+    # A new loop after the first one ended
+    handler = AsyncioHandler(slow)
+    logger = make_logger("test_aio_loop_ends", handler)
+    asyncio.run(main())
+    asyncio.run(main())
+    handler.close()
+    assert len(slow.messages) == 31
+
+
+def test_overflow(make_logger):
+    slow = SlowHandler()
+    handler = AsyncioHandler(slow, queueSize=5, overflow="drop_newest")
+    logger = make_logger("test_aio_overflow", handler)
+
+    async def main():
+        for i in range(8):
+            logger.info("record %d", i)
+        queued = handler.qsize()
+        await aio.aclose(logger)
+        return queued
+
+    assert asyncio.run(main()) == 5
+    assert slow.messages == ["record %d" % i for i in range(5)]
+    assert handler.dropped == 3
+
+    # Blocking writes the queue out on the loop instead
+    slow = SlowHandler()
+    handler = AsyncioHandler(slow, queueSize=5)
+    logger = make_logger("test_aio_overflow", handler)
+    assert asyncio.run(main()) == 2
+    assert slow.messages == ["record %d" % i for i in range(8)]
+    assert handler.dropped == 0
+
+
+def test_logfile_asyncio_mode(tmpdir, make_logger):
+    logfile = str(tmpdir.join("test.log"))
+    logger = logzero.setup_logger(name="test_aio_logfile", logfile=logfile, disableStderrLogger=True,
+                                  formatter=logging.Formatter("%(message)s"), async_mode="asyncio")
+    assert isinstance(logger.handlers[0], AsyncioHandler)
+
+    async def main():
+        logger.info("hello")
+        await aio.flush(logger)
+        with open(logfile) as f:
+            assert f.read() == "hello\n"
+        await aio.aclose(logger)
+
+    asyncio.run(main())
+    logzero.setup_logger(name="test_aio_logfile", disableStderrLogger=True)
+
+
+def test_log_function_call_loop_time(make_logger):
+    handler = SlowHandler()
+    logger = make_logger("test_aio_log_function_call", handler)
+
+    @aio.log_function_call(logger_to_use=logger, timing=True, logResult=True)
+    async def fetch(delay):
+        await asyncio.sleep(delay)
+        time.sleep(0.01)
+        return delay
+
+    @aio.log_function_call(logger_to_use=logger)
+    def add(a, b):
+        return a + b
+
+    assert asyncio.run(fetch(0.05)) == 0.05
+    assert add(1, 2) == 3
+    match = re.match(r"fetch\(0.05\) -> 0.05 \[([\d.]+) ms, on loop ([\d.]+) ms\]$", handler.messages[0])
+    assert match, handler.messages
+    wall, loop = float(match.group(1)), float(match.group(2))
+    assert wall >= 60 and 10 <= loop < 50
+    assert handler.messages[1] == "add(1, 2)"
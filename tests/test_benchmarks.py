@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_benchmarks
+----------------------------------
+
+Smoke test of the microbenchmarks in `benchmarks/run.py`.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+RUNNER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "run.py")
+
+
+@pytest.mark.skipif(sys.version_info < (3, 4), reason="the benchmarks need tracemalloc")
+def test_benchmarks_run(tmpdir):
+    output = str(tmpdir.join("results.json"))
+    subprocess.check_call([sys.executable, RUNNER, "--number", "10", "--repeat", "1", "--concurrency",
+                           "--output", output], stdout=subprocess.PIPE)
+    with open(output) as f:
+        data = json.load(f)
+
+    results = data["results"]
+    for name in ("format", "format_color", "format_exception", "disabled_level", "log_function_call",
+                 "setup_logger", "file", "file_rotating"):
+        assert results[name]["records_per_sec"] > 0
+        assert results[name]["alloc_peak_bytes"] >= 0
+    assert sorted(data["concurrency"]) == ["batch", "fast_rotating", "per_thread", "rotating"]
+    assert data["concurrency"]["per_thread"]["64"] > 0
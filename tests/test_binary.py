@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_binary
+----------------------------------
+
+Tests for `logzero.binary` and `logzero.decode`.
+"""
+import glob
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+
+import logzero
+from logzero.binary import MAGIC, BinaryEncoder, BinaryFileHandler, read_records
+
+
+class Point(object):
+    def __str__(self):
+        return "(1, 2)"
+
+
+def _log_records(logger):
+    logger.info("request %s took %d ms (%.1f%%)", u"/caf\xe9", 42, 99.5)
+    logger.debug("values %r %s %s %s %d", b"raw", None, True, False, -300)
+    logger.warning("point %s", Point())
+    logger.info("no args, 100%")
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("failed")
+
+
+def test_round_trip(tmpdir, make_logger):
+    logfile = str(tmpdir.join("test.bin"))
+    handler = BinaryFileHandler(logfile)
+    logger = make_logger("test_binary", handler)
+    _log_records(logger)
+    handler.close()
+
+    with open(logfile, "rb") as f:
+        assert f.read(4) == MAGIC
+        f.seek(0)
+        records = list(read_records(f))
+    assert [record.getMessage() for record in records] == [
+        u"request /caf\xe9 took 42 ms (99.5%)",
+        "values b'raw' None True False -300" if sys.version_info >= (3, ) else "values 'raw' None True False -300",
+        "point (1, 2)",
+        "no args, 100%",
+        "failed",
+    ]
+    assert [record.levelname for record in records] == ["INFO", "DEBUG", "WARNING", "INFO", "ERROR"]
+    assert records[0].name == "test_binary"
+    assert records[0].module == "test_binary"
+    assert records[0].funcName == "_log_records"
+    assert records[1].lineno == records[0].lineno + 1
+    assert records[4].exc_text.startswith("Traceback")
+    assert records[4].exc_text.endswith("ValueError: boom")
+
+
+def test_interned_strings_written_once():
+    encoder = BinaryEncoder()
+    record = logging.LogRecord("app", logging.INFO, "app.py", 10, "request %s took %d ms", ("/index", 42), None)
+    first = encoder.encode(record)
+    second = encoder.encode(record)
+    assert b"request %s" in first
+    assert b"request %s" not in second
+    assert len(second) < len(first) / 2
+
+    # Starts over once too many are collected
+    encoder = BinaryEncoder(maxInterned=2)
+    for i in range(3):
+        data = encoder.encode(logging.LogRecord("app", logging.INFO, "app.py", 10, "message %d" % i, (), None))
+    assert data.startswith(MAGIC)
+    assert [r.getMessage() for r in read_records(io.BytesIO(data))] == ["message 2"]
+
+
+def test_truncated_file(tmpdir, make_logger):
+    logfile = str(tmpdir.join("test.bin"))
+    handler = BinaryFileHandler(logfile)
+    logger = make_logger("test_binary_truncated", handler)
+    logger.info("first")
+    logger.info("second")
+    handler.close()
+    with open(logfile, "rb") as f:
+        data = f.read()
+    assert [r.getMessage() for r in read_records(io.BytesIO(data[:-3]))] == ["first"]
+
+
+def test_rotation(tmpdir, make_logger):
+    logfile = str(tmpdir.join("test.bin"))
+    handler = BinaryFileHandler(logfile, maxBytes=200, backupCount=10, bufferSize=0)
+    logger = make_logger("test_binary_rotation", handler)
+    for i in range(50):
+        logger.info("record %d", i)
+    handler.close()
+
+    messages = []
+    for filename in sorted(glob.glob(logfile + "*"), key=lambda fn: -int(fn.rsplit(".", 1)[1]) if fn[-1].isdigit() else 0):
+        with open(filename, "rb") as f:
+            # Every file can be decoded on its own
+            messages.extend(r.getMessage() for r in read_records(f))
+        assert os.path.getsize(filename) <= 200
+    assert messages == ["record %d" % i for i in range(50)]
+
+
+def test_decode_cli(tmpdir, make_logger):
+    logfile = str(tmpdir.join("test.bin"))
+    logzero.setup_logger(name="test_binary_cli", logfile=logfile, disableStderrLogger=True, binary=True)
+    logger = logging.getLogger("test_binary_cli")
+    assert isinstance(logger.handlers[0], BinaryFileHandler)
+    _log_records(logger)
+    logzero.setup_logger(name="test_binary_cli", disableStderrLogger=True)
+
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(logzero.__file__))),
+               PYTHONIOENCODING="utf-8")
+    output = subprocess.check_output([sys.executable, "-m", "logzero.decode", logfile], env=env).decode("utf-8")
+    lines = output.splitlines()
+    assert lines[0].startswith("[I ")
+    assert lines[0].endswith(u" test_binary:%d] request /caf\xe9 took 42 ms (99.5%%)" % (
+        _log_records.__code__.co_firstlineno + 1))
+    assert "    Traceback (most recent call last):" in lines
+    assert lines[-1] == "    ValueError: boom"
+
+    output = subprocess.check_output([sys.executable, "-m", "logzero.decode", "--json", logfile], env=env)
+    records = [json.loads(line) for line in output.decode("utf-8").splitlines()]
+    assert records[2]["message"] == "point (1, 2)"
+    assert records[2]["level"] == "WARNING"
+    assert records[4]["exception"].endswith("ValueError: boom")
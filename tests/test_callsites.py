@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_callsites
+----------------------------------
+
+Tests for `logzero.callsites`.
+"""
+import logging
+
+import logzero
+from logzero.callsites import CallSiteCache
+
+
+def _record(msg="request %s took %d ms", args=("/index", 42), pathname="/app/100%/app.py", lineno=42):
+    return logging.LogRecord("app", logging.INFO, pathname, lineno, msg, args, None)
+
+
+def test_output_unchanged(monkeypatch):
+    monkeypatch.setenv("LOGZERO_FORCE_COLOR", "1")
+    fmts = [logzero.LogFormatter.DEFAULT_FORMAT, "%(pathname)s %(funcName)s:%(lineno)5d %(message)s",
+            "%(levelname)s %(message)s"]
+    for fmt in fmts:
+        for color in (False, True):
+            expected = logzero.LogFormatter(fmt=fmt, color=color, stream=None)
+            cache = CallSiteCache()
+            cached = [logzero.LogFormatter(fmt=fmt, color=color, callsites=cache),
+                      logzero.LogFormatter(fmt=fmt, color=color, callsites=cache, stage=logzero.FormatStage())]
+            for record in (_record(), _record(lineno=43), _record(msg="100%% done", args=()), _record()):
+                for formatter in cached:
+                    assert formatter.format(record) == expected.format(record)
+
+
+def test_stats_and_eviction():
+    cache = CallSiteCache(maxSize=2)
+    formatter = logzero.LogFormatter(color=False, callsites=cache)
+    for i in range(3):
+        formatter.format(_record())
+    formatter.format(_record(lineno=43))
+    assert cache.stats() == {'sites': 2, 'misses': 2, 'evictions': 0}
+    assert [(site.lineno, site.count) for site in cache.sites()] == [(42, 3), (43, 1)]
+
+    # Sites used since they were added get a second chance
+    formatter.format(_record(lineno=44))
+    assert cache.stats() == {'sites': 2, 'misses': 3, 'evictions': 1}
+    assert sorted(site.lineno for site in cache.sites()) == [42, 44]
+
+    # Dynamic messages don't grow the cache
+    for i in range(100):
+        formatter.format(_record(msg="request %d" % i, args=()))
+    assert cache.stats()['sites'] == 2
+
+    # Unhashable messages aren't cached
+    assert cache.lookup(_record(msg=["not", "hashable"], args=())) is None
+
+
+def test_off_by_default():
+    assert logzero.LogFormatter().callsites is None
+    assert logzero.LogFormatter(callsites=True).callsites is logzero._default_callsites
+
+
+def test_formats_dropped_with_formatter():
+    cache = CallSiteCache()
+    for i in range(10):
+        logzero.LogFormatter(color=False, callsites=cache).format(_record())
+    site, = cache.sites()
+    assert site.count == 10
+    assert len(site._formats) <= 1
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_filters
+----------------------------------
+
+Tests for `logzero.filters`.
+"""
+import logging
+import time
+
+import logzero
+from logzero.filters import AdaptiveLevelController, RateLimitFilter, SamplingFilter, TokenBucket
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def _rate_limited_logger(name, rateLimit=None, **kwargs):
+    handler = ListHandler()
+    logger = logzero.setup_logger(name=name, disableStderrLogger=True, rateLimit=rateLimit, **kwargs)
+    logger.addHandler(handler)
+    return logger, handler
+
+
+def test_token_bucket():
+    bucket = TokenBucket(2, capacity=3)
+    now = bucket.updated
+    assert [bucket.consume(now) for _ in range(4)] == [True, True, True, False]
+    # refills with 2 tokens per second
+    assert bucket.consume(now + 0.5)
+    assert not bucket.consume(now + 0.5)
+    assert [bucket.consume(now + 10) for _ in range(4)] == [True, True, True, False]
+
+
+def test_rate_limit_per_call_site():
+    logger, handler = _rate_limited_logger("test_rate_limit_call_site", RateLimitFilter(rate=0.001, burst=2))
+    for i in range(10):
+        logger.error("loop %d", i)
+    for i in range(10):
+        logger.error("other %d", i)
+    logger.warning("loop %d", 0)
+    assert handler.messages == ["loop 0", "loop 1", "other 0", "other 1", "loop 0"]
+
+
+def test_rate_limit_summary():
+    rate_limit = RateLimitFilter(rate=0.001, burst=1, summaryInterval=0)
+    logger, handler = _rate_limited_logger("test_rate_limit_summary", rate_limit)
+
+    def log_errors(count):
+        for i in range(count):
+            logger.error("error %d", i)
+
+    log_errors(2)
+    assert handler.messages == ["error 0", "Suppressed 1 similar messages: error %d"]
+
+    rate_limit.summaryInterval = 3600
+    log_errors(5)
+    assert len(handler.messages) == 2
+    rate_limit.flush_summaries()
+    assert handler.messages[-1] == "Suppressed 5 similar messages: error %d"
+    rate_limit.flush_summaries()
+    assert len(handler.messages) == 3
+
+
+def test_rate_limit_summary_after_burst():
+    rate_limit = RateLimitFilter(rate=0.001, burst=1, summaryInterval=0.2)
+    logger, handler = _rate_limited_logger("test_rate_limit_summary_after_burst", rate_limit)
+    for i in range(5):
+        logger.error("error %d", i)
+    assert handler.messages == ["error 0"]
+
+    # Nothing else is logged, the summary comes from the background thread
+    deadline = time.time() + 5
+    while len(handler.messages) < 2 and time.time() < deadline:
+        time.sleep(0.05)
+    assert handler.messages == ["error 0", "Suppressed 4 similar messages: error %d"]
+
+
+def test_rate_limit_summary_on_close():
+    logger, handler = _rate_limited_logger("test_rate_limit_summary_on_close", 0.001)
+    for i in range(3):
+        logger.info("info %d", i)
+    # Replacing the filter logs what the old one suppressed
+    logzero.setup_logger(name="test_rate_limit_summary_on_close", disableStderrLogger=True)
+    assert handler.messages == ["info 0", "Suppressed 2 similar messages: info %d"]
+
+
+def test_rate_limit_reconfigure():
+    logger, handler = _rate_limited_logger("test_rate_limit_reconfigure", 1)
+    assert len(logger.filters) == 1
+    logzero.setup_logger(name="test_rate_limit_reconfigure", disableStderrLogger=True, rateLimit=5)
+    assert len(logger.filters) == 1
+    assert logger.filters[0].rate == 5
+
+    logzero.setup_logger(name="test_rate_limit_reconfigure", disableStderrLogger=True)
+    assert logger.filters == []
+
+
+def test_rate_limit_default_logger():
+    logzero.reset_default_logger()
+    handler = ListHandler()
+    logzero.logger.addHandler(handler)
+    try:
+        rate_limit = logzero.ratelimit(RateLimitFilter(rate=0.001, burst=1))
+        assert logzero.logger.filters == [rate_limit]
+        for _ in range(3):
+            logzero.logger.info("default")
+        assert handler.messages == ["default"]
+    finally:
+        logzero.logger.removeHandler(handler)
+        logzero.reset_default_logger()
+    assert logzero.logger.filters == []
+
+
+def test_rate_limit_unhashable_message():
+    logger, handler = _rate_limited_logger("test_rate_limit_unhashable", RateLimitFilter(rate=0.001, burst=1))
+    for _ in range(3):
+        logger.info(["unhashable"])
+    assert len(handler.messages) == 3
+
+
+def test_sampling_per_level():
+    logger, handler = _rate_limited_logger("test_sampling", sampling={logging.DEBUG: 0, logging.INFO: 0.5})
+    for i in range(1000):
+        logger.debug("debug %d", i)
+        logger.info("info %d", i)
+        logger.warning("warning %d", i)
+    assert not [msg for msg in handler.messages if msg.startswith("debug")]
+    assert 350 < len([msg for msg in handler.messages if msg.startswith("info")]) < 650
+    assert len([msg for msg in handler.messages if msg.startswith("warning")]) == 1000
+
+
+def test_sampling_by_key():
+    """
+    All records of a trace are kept or dropped together, the same way at every level
+    """
+    sampling = SamplingFilter({logging.DEBUG: 0.1, logging.INFO: 0.3}, key="trace_id")
+    logger, handler = _rate_limited_logger("test_sampling_key", sampling=sampling, rateLimit=1000)
+    for trace in range(200):
+        for level in (logging.DEBUG, logging.INFO, logging.INFO):
+            logger.log(level, "%d %s", trace, logging.getLevelName(level), extra={"trace_id": trace})
+
+    kept = {}
+    for msg in handler.messages:
+        trace, level = msg.split()
+        kept.setdefault(level, []).append(int(trace))
+    assert 5 < len(kept["DEBUG"]) < 40
+    assert all(kept["INFO"].count(trace) == 2 for trace in kept["INFO"])
+    assert set(kept["DEBUG"]) <= set(kept["INFO"])
+    assert sampling.dropped == 600 - len(handler.messages)
+
+    # Internal filters run in a fixed order, and are replaced one by one
+    assert [type(f) for f in logger.filters] == [SamplingFilter, RateLimitFilter]
+    logzero.setup_logger(name="test_sampling_key", disableStderrLogger=True, adaptiveLevel=100)
+    assert [type(f) for f in logger.filters] == [AdaptiveLevelController]
+
+
+def _log(logger, level, created):
+    record = logger.makeRecord(logger.name, level, __file__, 1, "level %d", (level, ), None)
+    record.created = created
+    logger.handle(record)
+
+
+def test_adaptive_level():
+    controller = AdaptiveLevelController(maxRate=10, interval=1, restoreAfter=5)
+    logger, handler = _rate_limited_logger("test_adaptive_level", adaptiveLevel=controller)
+
+    # 20 records/s: debug, then info records are dropped
+    for second in range(3):
+        for i in range(20):
+            _log(logger, logging.DEBUG if i % 2 else logging.INFO, 1000 + second + i / 20.0)
+    assert controller.level == logging.WARNING
+    assert "Logging overloaded (20 records/s), dropping records below INFO" in handler.messages
+    assert "Logging overloaded (20 records/s), dropping records below WARNING" in handler.messages
+    del handler.messages[:]
+    _log(logger, logging.INFO, 1003.5)
+    _log(logger, logging.WARNING, 1003.5)
+    assert handler.messages == ["level 30"]
+
+    # Calm for 5 seconds, one level at a time
+    for second in range(4, 16):
+        _log(logger, logging.INFO, 1000 + second)
+    assert "Logging load decreased (1 records/s), dropping records below INFO" in handler.messages
+    assert "Logging load decreased (1 records/s), no longer dropping records" in handler.messages
+    assert controller.level == logging.NOTSET
+    assert controller.dropped > 0
+
+
+def test_adaptive_level_queue_fill():
+    class QueueHandler(ListHandler):
+        queueSize = 10
+        depth = 0
+
+        def qsize(self):
+            return self.depth
+
+    logger, handler = _rate_limited_logger("test_adaptive_queue", adaptiveLevel=AdaptiveLevelController(maxRate=None))
+    queue_handler = QueueHandler()
+    logger.addHandler(queue_handler)
+    _log(logger, logging.DEBUG, 1000)
+    queue_handler.depth = 6
+    _log(logger, logging.DEBUG, 1001)
+    _log(logger, logging.DEBUG, 1001)
+    assert queue_handler.messages == ["level 10", "Logging overloaded (1 records/s), dropping records below INFO"]
+
+
+def test_loglevel_sampling():
+    logzero.loglevel(logging.DEBUG, sampling={logging.DEBUG: 0}, adaptiveLevel=1000)
+    try:
+        assert sorted(type(f).__name__ for f in logzero.logger.filters) == ["AdaptiveLevelController", "SamplingFilter"]
+        # Left alone unless passed
+        logzero.loglevel(logging.INFO)
+        assert sorted(type(f).__name__ for f in logzero.logger.filters) == ["AdaptiveLevelController", "SamplingFilter"]
+    finally:
+        logzero.loglevel(logging.DEBUG, sampling=None, adaptiveLevel=None)
+    assert logzero.logger.filters == []
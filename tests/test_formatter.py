@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_formatter
+----------------------------------
+
+Tests for the `logzero.LogFormatter` formatting modes.
+"""
+import copy
+import io
+import logging
+import sys
+import time
+
+import pytest
+import logzero
+
+
+def _make_record(msg="hello %s", args=("world",), level=logging.INFO, exc_info=None, **extra):
+    record = logging.LogRecord("test_formatter", level, __file__, 42, msg, args, exc_info)
+    record.__dict__.update(extra)
+    return record
+
+
+def _exc_info():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        return sys.exc_info()
+
+
+FORMATS = [
+    logzero.LogFormatter.DEFAULT_FORMAT,
+    '%(color)s[%(levelname)s][%(funcName)s|%(lineno)s] -> %(message)s%(end_color)s',
+    '%(asctime)s %% %(name)-20s %(levelno)03d %(relativeCreated).1f %(message)r',
+    'only a literal',
+    '%(message)s\nsecond line',
+]
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+@pytest.mark.parametrize("color", ["0", "1"])
+def test_compiled_output_matches_default(fmt, color, monkeypatch):
+    """
+    The compiled mode should render exactly the same text as the default mode
+    """
+    monkeypatch.setenv("LOGZERO_FORCE_COLOR", color)
+    default = logzero.LogFormatter(fmt=fmt)
+    compiled = logzero.LogFormatter(fmt=fmt, compiled=True)
+    assert compiled._compiled is not None
+
+    records = [_make_record(level=level) for level in
+               (logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR, logging.CRITICAL)]
+    records.append(_make_record(msg="line1\nline2", args=()))
+    records.append(_make_record(exc_info=_exc_info()))
+
+    for record in records:
+        assert compiled.format(copy.copy(record)) == default.format(copy.copy(record))
+
+
+def test_compiled_falls_back_for_unsupported_formats():
+    """
+    Formats using placeholders without a mapping key can't be compiled
+    """
+    formatter = logzero.LogFormatter(fmt='%s', compiled=True)
+    assert formatter._compiled is None
+    assert formatter.format(_make_record()).startswith("{")
+
+
+def test_compiled_missing_attribute_raises():
+    """
+    Missing record attributes should fail like in the default mode
+    """
+    formatter = logzero.LogFormatter(fmt='%(doesnotexist)s', compiled=True)
+    with pytest.raises(KeyError):
+        formatter.format(_make_record())
+
+
+@pytest.mark.parametrize("datefmt", [logzero.LogFormatter.DEFAULT_DATE_FORMAT, None, "%Y-%m-%dT%H:%M:%S%z %Z"])
+def test_format_time_cache(datefmt):
+    """
+    Cached timestamps should match logging.Formatter.formatTime, including msecs
+    """
+    formatter = logzero.LogFormatter(datefmt=datefmt)
+    reference = logging.Formatter(datefmt=datefmt)
+    for created in (1500000000.0, 1500000000.25, 1500000000.999, 1500000001.5, 1500000000.5):
+        record = _make_record()
+        record.created = created
+        record.msecs = (created - int(created)) * 1000
+        assert formatter.formatTime(record, datefmt) == reference.formatTime(record, datefmt)
+
+
+@pytest.mark.skipif(not hasattr(time, "tzset"), reason="time.tzset() is not available")
+def test_format_time_cache_timezone_change(monkeypatch):
+    """
+    Changing the timezone (and crossing DST transitions) should not serve stale timestamps
+    """
+    formatter = logzero.LogFormatter(datefmt="%H:%M:%S %Z")
+    record = _make_record()
+    try:
+        monkeypatch.setenv("TZ", "UTC")
+        time.tzset()
+        assert formatter.formatTime(record, formatter.datefmt).endswith("UTC")
+
+        monkeypatch.setenv("TZ", "Europe/Berlin")
+        time.tzset()
+        # 2021-03-28 00:59:59 UTC is the last second before CEST starts
+        record.created = 1616893199.0
+        assert formatter.formatTime(record, formatter.datefmt) == "01:59:59 CET"
+        record.created = 1616893200.0
+        assert formatter.formatTime(record, formatter.datefmt) == "03:00:00 CEST"
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+
+class FakeTerminal(object):
+    def __init__(self, fd, tty=True):
+        self.fd = fd
+        self.tty = tty
+
+    def isatty(self):
+        return self.tty
+
+    def fileno(self):
+        return self.fd
+
+
+def test_color_detection_per_stream(monkeypatch):
+    """
+    Color support is detected for the formatter's stream on first use, and cached per terminal
+    """
+    monkeypatch.delenv("LOGZERO_FORCE_COLOR", raising=False)
+    monkeypatch.setattr(logzero, "_terminal_colors", {})
+    detected = []
+
+    def terminal_supports_color(fd):
+        detected.append(fd)
+        return fd == 1
+    monkeypatch.setattr(logzero, "_terminal_supports_color", terminal_supports_color)
+
+    formatters = [logzero.LogFormatter(stream=FakeTerminal(1)) for _ in range(3)]
+    no_tty = logzero.LogFormatter(stream=FakeTerminal(1, tty=False))
+    other = logzero.LogFormatter(stream=FakeTerminal(2))
+    assert detected == []
+
+    record = _make_record(level=logging.INFO)
+    colored = logzero.LogFormatter.DEFAULT_COLORS[logging.INFO]
+    for formatter in formatters:
+        assert formatter.format(copy.copy(record)).startswith(colored)
+    assert not no_tty.format(copy.copy(record)).startswith(colored)
+    assert not other.format(copy.copy(record)).startswith(colored)
+    assert detected == [1, 2]
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_colorless_format_leaves_record_alone(compiled):
+    """
+    Without colors, the color placeholders are removed from the format instead of set on every record
+    """
+    formatter = logzero.LogFormatter(color=False, compiled=compiled)
+    record = _make_record(level=logging.ERROR)
+    assert formatter.format(record).startswith("[E ")
+    assert not hasattr(record, "color") and not hasattr(record, "end_color")
+
+    # Other uses of the attributes, and escaped placeholders, still render
+    formatter = logzero.LogFormatter(color=False, compiled=compiled, fmt="%(color)r%%(color)s%(message)s%(end_color)s")
+    record = _make_record()
+    assert formatter.format(record) == "''%(color)shello world"
+    assert record.color == record.end_color == ""
+
+    # A format replaced after the first record is used as well
+    formatter._fmt = "%(color)s%(levelname)s%(end_color)s"
+    assert formatter.format(_make_record()) == "INFO"
+
+
+def test_colored_format_sets_level_codes(monkeypatch):
+    monkeypatch.setenv("LOGZERO_FORCE_COLOR", "1")
+    formatter = logzero.LogFormatter(fmt="%(color)s%(message)s%(end_color)s")
+    reset = logzero.ForegroundColors.RESET + logzero.BackgroundColors.RESET
+    assert formatter.format(_make_record(level=logging.WARNING)) == (
+        logzero.LogFormatter.DEFAULT_COLORS[logging.WARNING] + "hello world" + reset)
+    # Levels without a color aren't wrapped
+    assert formatter.format(_make_record(level=logging.CRITICAL)) == "hello world"
+
+
+@pytest.mark.parametrize("fmt", FORMATS + ['%(color)r %(message)s'])
+@pytest.mark.parametrize("compiled", [False, True])
+def test_stage_output_matches_default(fmt, compiled, monkeypatch):
+    """
+    Formatters sharing a stage render the same text as on their own
+    """
+    monkeypatch.setenv("LOGZERO_FORCE_COLOR", "1")
+    stage = logzero.FormatStage()
+    staged = [logzero.LogFormatter(fmt=fmt, compiled=compiled, stage=stage),
+              logzero.LogFormatter(fmt=fmt, compiled=compiled, stage=stage, color=False)]
+    default = [logzero.LogFormatter(fmt=fmt), logzero.LogFormatter(fmt=fmt, color=False)]
+
+    records = [_make_record(level=level) for level in (logging.DEBUG, logging.INFO, logging.CRITICAL)]
+    records.append(_make_record(msg="line1\nline2", args=()))
+    records.append(_make_record(exc_info=_exc_info()))
+    for record in records:
+        for staged_formatter, default_formatter in zip(staged, default):
+            assert staged_formatter.format(record) == default_formatter.format(copy.copy(record))
+
+
+class CountingMessage(object):
+    def __init__(self):
+        self.count = 0
+
+    def __str__(self):
+        self.count += 1
+        return "counted"
+
+
+def test_setup_logger_renders_records_once(tmpdir):
+    logfile = str(tmpdir.join("test.log"))
+    log = logzero.setup_logger(name="test_format_stage", logfile=logfile)
+    message = CountingMessage()
+    log.info(message)
+    assert message.count == 1
+
+    logzero.setup_logger(name="test_format_stage", disableStderrLogger=True)
+    with open(logfile) as f:
+        assert f.read().count("counted") == 1
+
+    # The stage is shared with logfile handlers added later
+    logzero.logfile(logfile)
+    try:
+        stages = set(handler.formatter.stage for handler in logzero.logger.handlers
+                     if hasattr(handler, logzero.LOGZERO_INTERNAL_LOGGER_ATTR))
+        assert len(stages) == 1 and None not in stages
+    finally:
+        logzero.logfile(None)
+
+
+class RedactingFilter(logging.Filter):
+    def filter(self, record):
+        record.msg = record.msg.replace("secret", "***")
+        return True
+
+
+def test_stage_renders_changed_record_again(tmpdir):
+    logfile = str(tmpdir.join("test.log"))
+    log = logzero.setup_logger(name="test_format_stage_redact", logfile=logfile)
+    stderr_handler, file_handler = log.handlers
+    stderr_handler.stream = io.StringIO() if sys.version_info >= (3, ) else io.BytesIO()
+    file_handler.addFilter(RedactingFilter())
+    log.info("password secret")
+    logzero.setup_logger(name="test_format_stage_redact", disableStderrLogger=True)
+
+    # Formatted for stderr first, then changed by the filter of the file handler
+    assert stderr_handler.stream.getvalue().endswith("password secret\n")
+    with open(logfile) as f:
+        assert f.read().endswith("password ***\n")
@@ -0,0 +1,449 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_handlers
+----------------------------------
+
+Tests for `logzero.handlers`.
+"""
+import gzip
+import logging
+import os
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+import pytest
+import logzero
+from logzero.handlers import AsyncHandler, BufferedRotatingFileHandler, FastRotatingFileHandler
+from logzero.handlers import ThreadBufferedFileHandler, _rotation_worker
+
+
+class StalledHandler(logging.Handler):
+    """Collects messages, but only once `resume` is set"""
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.resume = threading.Event()
+        self.messages = []
+
+    def emit(self, record):
+        self.resume.wait()
+        self.messages.append(record.getMessage())
+
+
+def _stalled_async_handler(overflow, **kwargs):
+    target = StalledHandler()
+    handler = AsyncHandler(target, queueSize=2, overflow=overflow, **kwargs)
+    logger = logging.getLogger("test_handlers_%s" % overflow)
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.handlers = [handler]
+
+    # The writer thread takes the first record and stalls on it
+    logger.info("first")
+    while not handler._queue.empty():
+        time.sleep(0.001)
+    return logger, handler, target
+
+
+@pytest.mark.parametrize("overflow,expected", [
+    ("drop_newest", ["first", "msg0", "msg1"]),
+    ("drop_oldest", ["first", "msg3", "msg4"]),
+])
+def test_async_handler_overflow(overflow, expected):
+    """
+    A full queue should drop the newest or the oldest records and count them
+    """
+    logger, handler, target = _stalled_async_handler(overflow)
+    for i in range(5):
+        logger.info("msg%d", i)
+    assert handler.dropped == 3
+
+    target.resume.set()
+    handler.close()
+    assert target.messages == expected
+
+
+def test_async_handler_overflow_sample():
+    """
+    A full queue should keep every n-th record when sampling
+    """
+    logger, handler, target = _stalled_async_handler("sample", sampleRate=3)
+    for i in range(8):
+        logger.info("msg%d", i)
+    # msg0 and msg1 fill the queue, 2 of the remaining 6 are kept
+    assert handler.dropped == 6
+
+    target.resume.set()
+    handler.close()
+    assert target.messages == ["first", "msg4", "msg7"]
+
+
+def test_async_handler_invalid_overflow():
+    with pytest.raises(ValueError):
+        AsyncHandler(logging.NullHandler(), overflow="nope")
+
+
+def test_async_handler_renders_arguments_early():
+    """
+    Mutating the arguments after the logging call should not change the message
+    """
+    logger, handler, target = _stalled_async_handler("block")
+    args = ["before"]
+    logger.info("%s", args)
+    args[0] = "after"
+
+    target.resume.set()
+    handler.close()
+    assert target.messages == ["first", "['before']"]
+
+
+def test_api_logfile_async_mode(tmpdir):
+    """
+    logzero.logfile(.., async_mode=True) should write all records in order
+    """
+    logzero.reset_default_logger()
+    logfile = str(tmpdir.join("async.log"))
+    logzero.logfile(logfile, async_mode=True, disableStderrLogger=True)
+    handler = [h for h in logzero.logger.handlers if isinstance(h, AsyncHandler)][0]
+    for i in range(100):
+        logzero.logger.info("async %d", i)
+
+    # Reconfiguring closes the async handler, which writes out the queue
+    logzero.logfile(None)
+    assert handler._thread is None
+    with open(logfile) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 100
+    assert lines[-1].endswith("] async 99")
+
+
+def test_setup_logger_async_mode(tmpdir):
+    """
+    setup_logger(.., async_mode=True) should be reconfigurable like the synchronous mode
+    """
+    logfile = str(tmpdir.join("async.log"))
+    logger = logzero.setup_logger(name="test_setup_logger_async_mode", logfile=logfile,
+                                  async_mode=True, disableStderrLogger=True)
+    logger.info("info1")
+    logger = logzero.setup_logger(name="test_setup_logger_async_mode", logfile=logfile,
+                                  level=logging.WARNING, disableStderrLogger=True)
+    logger.info("info2")
+    logger.warning("warning1")
+    assert not any(isinstance(h, AsyncHandler) for h in logger.handlers)
+
+    with open(logfile) as f:
+        content = f.read()
+    assert "] info1" in content
+    assert "] info2" not in content
+    assert "] warning1" in content
+
+
+def _read(filename):
+    with open(filename) as f:
+        return f.read()
+
+
+def _log_to(handler, name, messages, level=logging.INFO):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.handlers = [handler]
+    for msg in messages:
+        logger.log(level, msg)
+    return logger
+
+
+def test_buffered_handler_flushes_on_level_and_size(tmpdir):
+    """
+    Records should stay in memory until the buffer is full or an error is logged
+    """
+    logfile = str(tmpdir.join("buffered.log"))
+    handler = BufferedRotatingFileHandler(logfile, bufferSize=100, flushInterval=None)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger = _log_to(handler, "test_buffered_level", ["info1", "info2"])
+    assert _read(logfile) == ""
+
+    logger.error("error1")
+    assert _read(logfile) == "info1\ninfo2\nerror1\n"
+
+    logger.info("x" * 100)
+    assert _read(logfile).endswith("x" * 100 + "\n")
+
+    logger.info("info3")
+    handler.close()
+    assert _read(logfile).endswith("info3\n")
+
+
+def test_buffered_handler_flushes_on_interval(tmpdir):
+    """
+    The flusher thread should write records which waited longer than flushInterval
+    """
+    logfile = str(tmpdir.join("buffered.log"))
+    handler = BufferedRotatingFileHandler(logfile, flushInterval=0.01)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    _log_to(handler, "test_buffered_interval", ["info1"])
+
+    for _ in range(500):
+        if _read(logfile):
+            break
+        time.sleep(0.01)
+    assert _read(logfile) == "info1\n"
+    handler.close()
+
+
+def test_buffered_handler_batches_writes(tmpdir):
+    """
+    Many records should end up in a single write to the file
+    """
+    logfile = str(tmpdir.join("buffered.log"))
+    handler = BufferedRotatingFileHandler(logfile, flushInterval=None)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    writes = []
+    real_write = handler.stream.write
+    handler.stream = type("CountingStream", (object,), {
+        "write": lambda self, data: writes.append(data) or real_write(data),
+        "flush": lambda self: None,
+    })()
+
+    _log_to(handler, "test_buffered_batches", ["info%d" % i for i in range(1000)])
+    handler.flush()
+    assert len(writes) == 1
+    assert writes[0].count("\n") == 1000
+
+
+def test_thread_buffered_handler_merges_threads(tmpdir):
+    """
+    Records of all threads should be written, each thread's in order, merged by time within a flush
+    """
+    logfile = str(tmpdir.join("threads.log"))
+    handler = ThreadBufferedFileHandler(logfile, maxBytes=5000, backupCount=100, threadBufferSize=50)
+    handler.setFormatter(logging.Formatter("%(threadName)s %(message)s"))
+    logger = _log_to(handler, "test_thread_buffered", [])
+
+    def log_lines():
+        for i in range(300):
+            logger.info("%d", i)
+    threads = [threading.Thread(target=log_lines, name="t%d" % i) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    handler.close()
+
+    backups = len(os.listdir(str(tmpdir))) - 1
+    assert backups > 1
+    # Oldest backup first
+    files = ["%s.%d" % (logfile, i) for i in range(backups, 0, -1)] + [logfile]
+    lines = "".join(_read(filename) for filename in files).splitlines()
+    assert len(lines) == 8 * 300
+    for thread in threads:
+        assert [line.split()[1] for line in lines if line.split()[0] == thread.name] == [str(i) for i in range(300)]
+
+
+def test_thread_buffered_handler_timestamp_order(tmpdir):
+    logfile = str(tmpdir.join("threads.log"))
+    handler = ThreadBufferedFileHandler(logfile, flushInterval=3600)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+
+    def emit(created, msg):
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, msg, None, None)
+        record.created = created
+        handler.handle(record)
+
+    emit(3, "main 3")
+    thread = threading.Thread(target=lambda: [emit(1, "other 1"), emit(4, "other 4")])
+    thread.start()
+    thread.join()
+    emit(2, "main 2")
+    assert _read(logfile) == ""
+    handler.flush()
+    # Each thread's records stay in order, they are merged by time
+    assert _read(logfile).splitlines() == ["other 1", "main 3", "main 2", "other 4"]
+    handler.close()
+
+
+@pytest.mark.parametrize("handler_class,kwargs", [
+    (BufferedRotatingFileHandler, {}),
+    (ThreadBufferedFileHandler, {}),
+    (FastRotatingFileHandler, {}),
+    (FastRotatingFileHandler, {"backgroundRotation": False}),
+])
+def test_rotation_matches_rotating_file_handler(tmpdir, handler_class, kwargs):
+    """
+    Rotation should produce the same files as the standard RotatingFileHandler
+    """
+    messages = ["message %d %s" % (i, "x" * (i % 7)) for i in range(200)]
+    results = []
+    for handler_class, kwargs in ((RotatingFileHandler, {}), (handler_class, kwargs)):
+        directory = tmpdir.mkdir(handler_class.__name__ + str(len(results)))
+        logfile = str(directory.join("rotating.log"))
+        handler = handler_class(logfile, maxBytes=300, backupCount=3, **kwargs)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _log_to(handler, "test_buffered_rotation", messages)
+        handler.close()
+        results.append(dict((name, _read(os.path.join(str(directory), name)))
+                            for name in os.listdir(str(directory))))
+
+    assert sorted(results[0]) == ["rotating.log", "rotating.log.1", "rotating.log.2", "rotating.log.3"]
+    assert results[0] == results[1]
+
+
+def test_fast_rotating_handler_formats_once(tmpdir):
+    """
+    The rollover check should not format the record a second time
+    """
+    class CountingFormatter(logging.Formatter):
+        calls = 0
+
+        def format(self, record):
+            CountingFormatter.calls += 1
+            return logging.Formatter.format(self, record)
+
+    handler = FastRotatingFileHandler(str(tmpdir.join("fast.log")), maxBytes=100, backupCount=2)
+    handler.setFormatter(CountingFormatter("%(message)s"))
+    _log_to(handler, "test_fast_rotating_formats_once", ["message %d" % i for i in range(50)])
+    handler.close()
+    assert CountingFormatter.calls == 50
+
+
+@pytest.mark.parametrize("handler_class", [FastRotatingFileHandler, BufferedRotatingFileHandler])
+def test_rotation_counts_bytes(tmpdir, handler_class):
+    """
+    maxBytes limits the size of the logfile in bytes, also for non-ASCII text
+    """
+    logfile = str(tmpdir.join("cjk.log"))
+    handler = handler_class(logfile, maxBytes=1000, backupCount=3, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    _log_to(handler, "test_rotation_counts_bytes", [u"\u65e5\u672c\u8a9e %03d" % i for i in range(300)])
+    handler.close()
+
+    assert os.path.exists(logfile + ".1")
+    for name in os.listdir(str(tmpdir)):
+        assert os.path.getsize(str(tmpdir.join(name))) <= 1000
+
+
+def test_fast_rotating_handler_timestamp_rotation(tmpdir):
+    """
+    Timestamped backups should be kept in order and limited to backupCount
+    """
+    logfile = str(tmpdir.join("timestamp.log"))
+    handler = FastRotatingFileHandler(logfile, maxBytes=30, backupCount=3, rotation="timestamp")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    _log_to(handler, "test_fast_rotating_timestamp", ["message %02d" % i for i in range(20)])
+    handler.close()
+
+    backups = sorted(name for name in os.listdir(str(tmpdir)) if name != "timestamp.log")
+    assert len(backups) == 3
+    assert all(name.startswith("timestamp.log.") for name in backups)
+    contents = [_read(str(tmpdir.join(name))) for name in backups] + [_read(logfile)]
+    assert "".join(contents) == "".join("message %02d\n" % i for i in range(12, 20))
+
+
+def test_fast_rotating_handler_invalid_rotation(tmpdir):
+    with pytest.raises(ValueError):
+        FastRotatingFileHandler(str(tmpdir.join("x.log")), rotation="nope")
+
+
+def _read_gzip(filename):
+    with gzip.open(filename, "rt") as f:
+        return f.read()
+
+
+def test_fast_rotating_handler_gzip_compression(tmpdir):
+    """
+    Numbered backups should be compressed, and uncompressed leftovers count towards backupCount
+    """
+    logfile = str(tmpdir.join("compressed.log"))
+    # An uncompressed backup of an earlier run without compression
+    with open(logfile + ".1", "w") as f:
+        f.write("old backup\n")
+
+    handler = FastRotatingFileHandler(logfile, maxBytes=30, backupCount=3,
+                                      compression="gzip", compressionLevel=1)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    _log_to(handler, "test_fast_rotating_gzip", ["message %02d" % i for i in range(4)])
+    handler.close()
+
+    assert sorted(os.listdir(str(tmpdir))) == [
+        "compressed.log", "compressed.log.1.gz", "compressed.log.2"]
+    assert _read_gzip(logfile + ".1.gz") == "message 00\nmessage 01\n"
+    assert _read(logfile + ".2") == "old backup\n"
+
+    handler = FastRotatingFileHandler(logfile, maxBytes=30, backupCount=3, compression="gzip")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    _log_to(handler, "test_fast_rotating_gzip", ["message %02d" % i for i in range(4, 10)])
+    handler.close()
+
+    assert sorted(os.listdir(str(tmpdir))) == [
+        "compressed.log", "compressed.log.1.gz", "compressed.log.2.gz", "compressed.log.3.gz"]
+    assert _read_gzip(logfile + ".3.gz") == "message 02\nmessage 03\n"
+    assert _read(logfile) == "message 08\nmessage 09\n"
+
+
+def test_fast_rotating_handler_timestamp_compression(tmpdir):
+    """
+    Compressed timestamped backups should be limited to backupCount
+    """
+    logfile = str(tmpdir.join("timestamp.log"))
+    handler = FastRotatingFileHandler(logfile, maxBytes=30, backupCount=2,
+                                      rotation="timestamp", compression="gzip")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    _log_to(handler, "test_fast_rotating_timestamp_gzip", ["message %02d" % i for i in range(10)])
+    handler.close()
+
+    backups = sorted(name for name in os.listdir(str(tmpdir)) if name != "timestamp.log")
+    assert len(backups) == 2
+    assert all(name.endswith(".gz") for name in backups)
+    assert _read_gzip(str(tmpdir.join(backups[-1]))) == "message 06\nmessage 07\n"
+
+
+def test_fast_rotating_handler_invalid_compression(tmpdir):
+    with pytest.raises(ValueError):
+        FastRotatingFileHandler(str(tmpdir.join("x.log")), compression="rar")
+
+
+def test_api_logfile_rotation(tmpdir):
+    """
+    logzero.logfile(.., rotation="numbered") should rotate like the default handler
+    """
+    logzero.reset_default_logger()
+    logfile = str(tmpdir.join("rotating.log"))
+    logzero.logfile(logfile, maxBytes=10, backupCount=3, rotation="numbered")
+    logzero.logger.info("info2")
+    logzero.logger.info("info3")
+    logzero.logfile(None)
+    # The backups are shifted in the background
+    _rotation_worker.wait()
+
+    assert "] info3" in _read(logfile)
+    assert "] info2" in _read(logfile + ".1")
+
+
+def test_api_logfile_batch_mode_per_thread(tmpdir):
+    logzero.reset_default_logger()
+    logfile = str(tmpdir.join("batch.log"))
+    logzero.logfile(logfile, batch_mode="per_thread", disableStderrLogger=True)
+    assert any(isinstance(handler, ThreadBufferedFileHandler) for handler in logzero.logger.handlers)
+    logzero.logger.info("info1")
+    logzero.logfile(None)
+    assert "] info1" in _read(logfile)
+
+
+def test_api_logfile_batch_mode(tmpdir):
+    """
+    logzero.logfile(.., batch_mode=True) should write all records when reconfigured
+    """
+    logzero.reset_default_logger()
+    logfile = str(tmpdir.join("batch.log"))
+    logzero.logfile(logfile, batch_mode=True, disableStderrLogger=True)
+    logzero.logger.info("info1")
+    assert _read(logfile) == ""
+    logzero.logger.error("error1")
+    logzero.logger.info("info2")
+
+    logzero.logfile(None)
+    content = _read(logfile)
+    assert "] info1" in content
+    assert "] error1" in content
+    assert "] info2" in content
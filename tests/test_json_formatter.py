@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_json_formatter
+----------------------------------
+
+Tests for `logzero.JsonFormatter`.
+"""
+import json
+import logging
+import sys
+
+import pytest
+import logzero
+from logzero import formatters
+
+
+def _make_record(msg="hello %s", args=("world",), exc_info=None, extra=None):
+    logger = logging.getLogger("test_json_formatter")
+    return logger.makeRecord(logger.name, logging.INFO, __file__, 42, msg, args, exc_info, extra=extra)
+
+
+@pytest.fixture(params=["default", "stdlib"])
+def dumps(request, monkeypatch):
+    """Run the tests with the fastest available encoder and the stdlib fallback"""
+    if request.param == "stdlib":
+        monkeypatch.setattr(formatters, "_dumps", formatters._dumps_stdlib)
+
+
+def test_json_default_fields(dumps):
+    record = _make_record()
+    data = json.loads(logzero.JsonFormatter().format(record))
+    assert data == {
+        "time": record.created,
+        "level": "INFO",
+        "logger": "test_json_formatter",
+        "module": "test_json_formatter",
+        "line": 42,
+        "message": "hello world",
+    }
+
+
+def test_json_select_and_rename_fields(dumps):
+    formatter = logzero.JsonFormatter(fields=["levelname", ("message", "msg"), "asctime"],
+                                      extra=False, datefmt="%Y")
+    data = json.loads(formatter.format(_make_record(extra={"user": "alice"})))
+    assert sorted(data) == ["asctime", "levelname", "msg"]
+    assert data["msg"] == "hello world"
+    assert len(data["asctime"]) == 4
+
+
+def test_json_extra_fields(dumps):
+    class Custom(object):
+        def __str__(self):
+            return "custom"
+
+    extra = {"user": "älice", "count": 3, "ratio": 0.5, "ok": True, "none": None,
+             "tags": ["a", "b"], "obj": Custom(), "big": 2 ** 70}
+    data = json.loads(logzero.JsonFormatter().format(_make_record(extra=extra)))
+    for key in ("user", "count", "ratio", "ok", "none", "tags", "big"):
+        assert data[key] == extra[key]
+    assert data["obj"] == "custom"
+
+
+def test_json_non_finite_floats(dumps):
+    extra = {"nan": float("nan"), "inf": float("inf"), "nested": {"values": [1.5, float("-inf")]}}
+    line = logzero.JsonFormatter().format(_make_record(extra=extra))
+    # Strict parsers reject NaN and Infinity
+    data = json.loads(line, parse_constant=lambda constant: pytest.fail("invalid JSON: %s" % constant))
+    assert data["nan"] is None
+    assert data["inf"] is None
+    assert data["nested"] == {"values": [1.5, None]}
+
+
+def test_json_non_string_keys(dumps):
+    extra = {"foo": {(1, 2): 3, 4: [{(5, ): float("nan")}]}}
+    data = json.loads(logzero.JsonFormatter().format(_make_record(extra=extra)))
+    assert data["foo"] == {"(1, 2)": 3, "4": [{"(5,)": None}]}
+
+
+def test_json_exception(dumps):
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = _make_record(exc_info=sys.exc_info())
+    line = logzero.JsonFormatter().format(record)
+    assert "\n" not in line
+    data = json.loads(line)
+    assert data["exception"].startswith("Traceback")
+    assert data["exception"].endswith("ValueError: boom")
+
+
+def test_json_formatter_with_setup_logger(tmpdir):
+    logfile = str(tmpdir.join("json.log"))
+    logger = logzero.setup_logger(name="test_json_setup_logger", logfile=logfile,
+                                  formatter=logzero.JsonFormatter(), disableStderrLogger=True)
+    logger.info("info %d", 1, extra={"request_id": "abc"})
+    with open(logfile) as f:
+        data = json.loads(f.read())
+    assert data["message"] == "info 1"
+    assert data["request_id"] == "abc"
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_log_function_call
+----------------------------------
+
+Tests for `logzero.log_function_call`.
+"""
+import asyncio
+import logging
+
+import pytest
+import logzero
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+    @property
+    def messages(self):
+        return [record.getMessage() for record in self.records]
+
+
+@pytest.fixture
+def handler():
+    handler = ListHandler()
+    logger = logging.getLogger("test_log_function_call")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.handlers = [handler]
+    return handler
+
+
+def _logger():
+    return logging.getLogger("test_log_function_call")
+
+
+def test_log_function_call_with_options(handler):
+    @logzero.log_function_call(logger_to_use=_logger(), level=logging.INFO, logResult=True)
+    def add(a, b=0):
+        """add doc"""
+        return a + b
+
+    assert add.__name__ == "add"
+    assert add.__doc__ == "add doc"
+    assert add(1, b=2) == 3
+    assert handler.messages == ["add(1, b=2) -> 3"]
+    assert handler.records[0].levelno == logging.INFO
+
+
+def test_log_function_call_timing_and_exceptions(handler):
+    @logzero.log_function_call(logger_to_use=_logger(), timing=True, logExceptions=True)
+    def fail(message):
+        raise ValueError(message)
+
+    with pytest.raises(ValueError):
+        fail("boom")
+    message, = handler.messages
+    assert message.startswith("fail(boom) raised ValueError('boom') [")
+    assert " ms, cpu " in message
+
+
+def test_log_function_call_truncates(handler):
+    @logzero.log_function_call(logger_to_use=_logger(), logResult=True, maxRepr=5)
+    def identity(value):
+        return value
+
+    identity("x" * 100)
+    assert handler.messages == ["identity(xxxxx...) -> 'xxxx..."]
+
+
+def test_log_function_call_sampling(handler):
+    @logzero.log_function_call(logger_to_use=_logger(), sampleRate=10)
+    def sampled(i):
+        return i
+
+    assert [sampled(i) for i in range(30)] == list(range(30))
+    assert handler.messages == ["sampled(0)", "sampled(10)", "sampled(20)"]
+
+
+def test_log_function_call_max_per_second(handler):
+    @logzero.log_function_call(logger_to_use=_logger(), maxPerSecond=2)
+    def limited(i):
+        return i
+
+    for i in range(10):
+        limited(i)
+    # Two per second, the loop may cross a second boundary
+    assert 2 <= len(handler.messages) <= 4
+
+
+def test_log_function_call_disabled_level(handler):
+    @logzero.log_function_call(logger_to_use=_logger(), level=logging.DEBUG, timing=True)
+    def quiet():
+        return 1
+
+    _logger().setLevel(logging.INFO)
+    assert quiet() == 1
+    assert handler.messages == []
+
+
+def test_log_function_call_coroutine(handler):
+    @logzero.log_function_call(logger_to_use=_logger(), timing=True, logResult=True)
+    async def coro(value):
+        await asyncio.sleep(0.01)
+        return value
+
+    assert asyncio.run(coro(5)) == 5
+    message, = handler.messages
+    assert message.startswith("coro(5) -> 5 [")
+    assert float(message.split("[")[1].split(" ms")[0]) >= 10
+    assert "cpu" not in message
+
+
+def test_log_function_call_generator(handler):
+    @logzero.log_function_call(logger_to_use=_logger(), logResult=True)
+    def gen(n):
+        for i in range(n):
+            received = yield i
+            if received:
+                yield received
+        return "done"
+
+    iterator = gen(3)
+    assert handler.messages == []
+    assert next(iterator) == 0
+    assert iterator.send("sent") == "sent"
+    assert list(iterator) == [1, 2]
+    assert handler.messages == ["gen(3) -> 'done'"]
+
+
+def test_log_function_call_async_generator(handler):
+    @logzero.log_function_call(logger_to_use=_logger(), timing=True)
+    async def agen(n):
+        for i in range(n):
+            yield i
+
+    async def consume():
+        return [i async for i in agen(3)]
+
+    assert asyncio.run(consume()) == [0, 1, 2]
+    message, = handler.messages
+    assert message.startswith("agen(3) [")
+
+
+def test_log_function_call_requires_function():
+    with pytest.raises(TypeError):
+        logzero.log_function_call(_logger())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_loggers
+----------------------------------
+
+Tests for `logzero.loggers`.
+"""
+import io
+import logging
+import sys
+
+import logzero
+from logzero.filters import RateLimitFilter, SamplingFilter
+from logzero.formatters import JsonFormatter
+from logzero.loggers import FastLogger, record_attrs
+
+
+class RecordHandler(logging.StreamHandler):
+    def __init__(self, fmt):
+        logging.StreamHandler.__init__(self, io.StringIO() if sys.version_info >= (3, ) else io.BytesIO())
+        self.setFormatter(logzero.LogFormatter(color=False, fmt=fmt))
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def _fast_logger(name, fmt):
+    handler = RecordHandler(fmt)
+    logger = logzero.setup_logger(name=name, disableStderrLogger=True, fastRecords=True)
+    logger.addHandler(handler)
+    return logger, handler
+
+
+def _log(logger):
+    logger.info("hello %s", "world")
+
+
+def test_skips_caller_and_thread():
+    logger, handler = _fast_logger("test_fast_logger", "%(levelname)s %(message)s")
+    assert isinstance(logger, FastLogger)
+    _log(logger)
+    record = handler.records[-1]
+    assert record.getMessage() == "hello world"
+    assert (record.pathname, record.lineno, record.funcName) == ("(unknown file)", 0, "(unknown function)")
+    assert record.thread is None and record.process is None
+    assert handler.format(record) == "INFO hello world"
+
+    # Looked up as soon as a format uses them
+    handler.setFormatter(logzero.LogFormatter(color=False, fmt="%(module)s:%(lineno)d %(threadName)s %(message)s"))
+    _log(logger)
+    record = handler.records[-1]
+    assert (record.module, record.lineno, record.funcName) == ("test_loggers", _log.__code__.co_firstlineno + 1, "_log")
+    assert record.threadName == "MainThread"
+    assert record.process is None
+
+    logger.info("extra", extra={"user": "alice"}, stack_info=sys.version_info >= (3, ))
+    assert handler.records[-1].user == "alice"
+
+    # Left alone unless fastRecords is passed
+    logzero.setup_logger(name="test_fast_logger", disableStderrLogger=True)
+    assert type(logger) is FastLogger
+    logzero.setup_logger(name="test_fast_logger", disableStderrLogger=True, fastRecords=False)
+    assert type(logger) is logging.Logger
+
+
+def test_same_records_as_logging():
+    logger, handler = _fast_logger("test_fast_logger_json", "%(message)s")
+    logger.addHandler(RecordHandler("%(message)s"))
+    logger.handlers[-1].setFormatter(JsonFormatter())
+    # Any attribute may be used, created like logging does
+    _log(logger)
+    record = handler.records[-1]
+    assert record.funcName == "_log"
+    assert record.thread is not None and record.process is not None
+
+    expected = logging.LogRecord("app", logging.INFO, "/app/app.py", 10, "hello %s", ("world", ), None, "main")
+    record = logging.getLogger("test_fast_logger").makeRecord(
+        "app", logging.INFO, "/app/app.py", 10, "hello %s", ("world", ), None, "main")
+    assert sorted(record.__dict__) == sorted(expected.__dict__)
+    for attr in ("name", "msg", "args", "levelname", "levelno", "pathname", "filename", "module", "lineno", "funcName"):
+        assert getattr(record, attr) == getattr(expected, attr)
+
+
+def test_record_attrs():
+    logger = logging.getLogger("test_record_attrs")
+    logger.propagate = False
+    logger.handlers = [RecordHandler("%(levelname)s %(thread)d %(message)s")]
+    assert record_attrs(logger) == frozenset(["levelname", "thread", "message"])
+
+    logger.addFilter(RateLimitFilter())
+    assert "lineno" in record_attrs(logger)
+    logger.filters = [SamplingFilter({logging.INFO: 0.5}, key="trace_id")]
+    assert "trace_id" in record_attrs(logger)
+
+    # Unknown filters and handlers may use anything
+    logger.filters = [lambda record: True]
+    assert record_attrs(logger) is None
+    logger.filters = []
+    logger.handlers.append(logging.Handler())
+    assert record_attrs(logger) is None
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_multiprocess
+----------------------------------
+
+Tests for `logzero.multiprocess`.
+"""
+import glob
+import logging
+import multiprocessing
+import os
+import sys
+
+import pytest
+import logzero
+
+pytestmark = pytest.mark.skipif(os.name == "nt" or sys.version_info < (3, 4), reason="needs fork and Unix sockets")
+
+from logzero.multiprocess import MultiprocessHandler  # noqa: E402
+
+
+def _read_lines(logfile):
+    lines = []
+    for fn in glob.glob(logfile + "*"):
+        with open(fn) as f:
+            lines.extend(f.read().splitlines())
+    return lines
+
+
+def test_writer_and_client(tmpdir, make_logger):
+    logfile = str(tmpdir.join("test.log"))
+    address = str(tmpdir.join("test.sock"))
+    writer = MultiprocessHandler(logfile, address=address)
+    client = MultiprocessHandler(logfile, address=address)
+    assert writer.is_writer
+    assert not client.is_writer
+    writer.setFormatter(logging.Formatter("%(levelname)s %(name)s %(message)s"))
+
+    logger = make_logger("test_multiprocess_client", client)
+    logger.info("hello %s", "world")
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("failed")
+    client.close()
+    writer.close()
+
+    with open(logfile) as f:
+        content = f.read()
+    assert content.startswith("INFO test_multiprocess_client hello world\nERROR test_multiprocess_client failed\n")
+    assert "ValueError: boom" in content
+    assert not os.path.exists(address)
+
+
+def test_client_takes_over(tmpdir, make_logger):
+    logfile = str(tmpdir.join("test.log"))
+    address = str(tmpdir.join("test.sock"))
+    writer = MultiprocessHandler(logfile, address=address)
+    client = MultiprocessHandler(logfile, address=address)
+    client.setFormatter(logging.Formatter("%(message)s"))
+    writer.setFormatter(logging.Formatter("%(message)s"))
+
+    logger = make_logger("test_multiprocess_takeover", client)
+    logger.info("first")
+    writer.close()
+    logger.info("second")
+    assert client.is_writer
+    client.close()
+
+    assert _read_lines(logfile) == ["first", "second"]
+
+
+def _wait_for(event):
+    event.wait(10)
+
+
+def test_takeover_while_forked_child_runs(tmpdir, make_logger):
+    """
+    A process forked from the writer doesn't keep the writer's lock after the writer closes
+    """
+    logfile = str(tmpdir.join("test.log"))
+    address = str(tmpdir.join("test.sock"))
+    writer = MultiprocessHandler(logfile, address=address)
+    writer.setFormatter(logging.Formatter("%(message)s"))
+    logger = make_logger("test_multiprocess_forked_takeover", writer)
+    logger.info("first")
+
+    context = multiprocessing.get_context("fork")
+    done = context.Event()
+    child = context.Process(target=_wait_for, args=(done, ))
+    child.start()
+    try:
+        writer.close()
+        handler = MultiprocessHandler(logfile, address=address, connectTimeout=0.5)
+        assert handler.is_writer
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.handlers = [handler]
+        logger.info("second")
+        handler.close()
+    finally:
+        done.set()
+        child.join()
+    assert child.exitcode == 0
+    assert _read_lines(logfile) == ["first", "second"]
+
+
+def _log_lines(logfile, index, count, setup):
+    if setup:
+        logzero.setup_logger(name="test_multiprocess", logfile=logfile, disableStderrLogger=True,
+                             formatter=logging.Formatter("%(message)s"), maxBytes=3000, backupCount=1000,
+                             multiprocess=True)
+    logger = logging.getLogger("test_multiprocess")
+    for i in range(count):
+        logger.info("process %d line %d %s", index, i, "x" * 20)
+    # Removes and closes the handler, as processes exit without logging.shutdown()
+    logzero.setup_logger(name="test_multiprocess", disableStderrLogger=True)
+
+
+@pytest.mark.parametrize("parent_writes", [True, False])
+def test_processes_share_logfile(tmpdir, parent_writes, make_logger):
+    """
+    Records of all processes end up in the logfile and its backups exactly once and never interleaved
+    """
+    logfile = str(tmpdir.join("test.log"))
+    if parent_writes:
+        logzero.setup_logger(name="test_multiprocess", logfile=logfile, disableStderrLogger=True,
+                             formatter=logging.Formatter("%(message)s"), maxBytes=3000, backupCount=1000,
+                             multiprocess=True)
+
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_log_lines, args=(logfile, index, 200, not parent_writes))
+                 for index in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    logzero.setup_logger(name="test_multiprocess", disableStderrLogger=True)
+
+    lines = _read_lines(logfile)
+    expected = ["process %d line %d %s" % (index, i, "x" * 20) for index in range(4) for i in range(200)]
+    assert sorted(lines) == sorted(expected)
+    assert len(glob.glob(logfile + ".*")) > 1
@@ -189,5 +189,80 @@ def test_api_logfile_custom_loglevel():
         temp.close()
 
 
+def test_api_lazy():
+    """
+    logzero.lazy(..) should only be evaluated once, and only if the message is formatted
+    """
+    logzero.reset_default_logger()
+    temp = tempfile.NamedTemporaryFile()
+    calls = []
+
+    def expensive(value):
+        calls.append(value)
+        return value * 2
+
+    try:
+        logzero.logfile(temp.name)
+        logzero.loglevel(logging.INFO)
+        logzero.logger.debug("debug %s", logzero.lazy(expensive, 1))
+        assert calls == []
+
+        # Formatted by the stderr and the file handler, but computed once
+        logzero.logger.info("info %s %r", logzero.lazy(expensive, 2), logzero.lazy(expensive, "x"))
+        assert calls == [2, "x"]
+
+        with open(temp.name) as f:
+            content = f.read()
+            assert "] info 4 'xx'" in content
+            assert "debug" not in content
+
+    finally:
+        temp.close()
+
+
+def test_api_lazy_numbers():
+    """
+    logzero.lazy(..) should also work with numeric conversions like %d and %x
+    """
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, "%d %05.1f %x %s",
+                               (logzero.lazy(len, "abc"), logzero.lazy(float, "2.5"),
+                                logzero.lazy(int, "255"), logzero.lazy(len, "")), None)
+    assert record.getMessage() == "3 002.5 ff 0"
+
+
+def test_log_function_call_disabled_debug():
+    """
+    log_function_call should not stringify the arguments if DEBUG is disabled
+    """
+    class Arg(object):
+        str_calls = 0
+
+        def __str__(self):
+            Arg.str_calls += 1
+            return "arg"
+
+    @logzero.log_function_call
+    def example(*args, **kwargs):
+        return "result"
+
+    logzero.reset_default_logger()
+    temp = tempfile.NamedTemporaryFile()
+    try:
+        logzero.logfile(temp.name)
+        logzero.loglevel(logging.INFO)
+        assert example(Arg(), key=Arg()) == "result"
+        assert Arg.str_calls == 0
+
+        logzero.loglevel(logging.DEBUG)
+        assert example(Arg(), key=Arg()) == "result"
+        assert Arg.str_calls == 2
+
+        with open(temp.name) as f:
+            assert "] example(arg, key=arg)" in f.read()
+
+    finally:
+        temp.close()
+
+
 if __name__ == '__main__':
     pytest.main(['-q', __file__])
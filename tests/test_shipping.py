@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_shipping
+----------------------------------
+
+Tests for `logzero.shipping`.
+"""
+import logging
+import os
+import re
+import socket
+import threading
+import time
+
+import pytest
+import logzero
+from logzero.shipping import ShippingHandler, syslog_severity
+
+
+class Collector(object):
+    """
+    A log collector which accepts connections on a local TCP port and
+    collects what is sent to it. Until it is started, connections to the
+    port are refused.
+    """
+    def __init__(self, start=True):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.address = self.listener.getsockname()
+        self.data = b""
+        self._conns = []
+        self._lock = threading.Lock()
+        if start:
+            self.start()
+
+    def start(self):
+        self.listener.listen(5)
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self.listener.accept()[0]
+            except (IOError, OSError):
+                return
+            self._conns.append(conn)
+            reader = threading.Thread(target=self._read, args=(conn, ))
+            reader.daemon = True
+            reader.start()
+
+    def _read(self, conn):
+        while True:
+            try:
+                chunk = conn.recv(65536)
+            except (IOError, OSError):
+                return
+            if not chunk:
+                return
+            with self._lock:
+                self.data += chunk
+
+    def messages(self):
+        """
+        Splits the data into the octet counted messages.
+        """
+        messages = []
+        data = self.data
+        while data:
+            length, data = data.split(b" ", 1)
+            messages.append(data[:int(length)].decode("utf-8"))
+            data = data[int(length):]
+        return messages
+
+    def disconnect(self):
+        conns, self._conns = self._conns, []
+        for conn in conns:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except (IOError, OSError):
+                pass
+            conn.close()
+
+    def close(self):
+        self.disconnect()
+        self.listener.close()
+
+
+def test_syslog_severity():
+    assert [syslog_severity(level) for level in (logging.DEBUG, logging.INFO, logging.WARNING,
+                                                 logging.ERROR, logging.CRITICAL)] == [7, 6, 4, 3, 2]
+
+
+def test_tcp_octet_counting(make_logger):
+    collector = Collector()
+    handler = ShippingHandler(collector.address, facility=16, appName="my app", hostname="host1")
+    logger = make_logger("test_shipping_tcp", handler)
+    logger.info("hello %s", "world")
+    logger.error(u"two\nlines \u2713")
+    handler.flush()
+    handler.close()
+    time.sleep(0.05)
+    collector.close()
+
+    messages = collector.messages()
+    assert len(messages) == 2
+    header = r"<%d>1 \d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{6}Z host1 myapp " + str(os.getpid()) + " - - "
+    assert re.match(header % (16 * 8 + 6) + "hello world$", messages[0])
+    assert re.match(header % (16 * 8 + 3) + u"two\nlines \u2713$", messages[1])
+    assert handler.sent == 2
+
+
+def test_udp(make_logger):
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(5)
+    handler = ShippingHandler(receiver.getsockname(), transport="udp")
+    logger = make_logger("test_shipping_udp", handler)
+    logger.warning("first")
+    logger.warning("second")
+    handler.close()
+
+    # One datagram per message, not framed
+    assert receiver.recv(65536).endswith(b" - - first")
+    assert receiver.recv(65536).endswith(b" - - second")
+    receiver.close()
+
+
+def test_udp_oversized_message(make_logger):
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(5)
+    handler = ShippingHandler(receiver.getsockname(), transport="udp")
+    logger = make_logger("test_shipping_udp_oversized", handler)
+    logger.warning("x" * 70000)
+    logger.warning("after")
+    handler.flush()
+    handler.close()
+
+    data = receiver.recv(65536).decode("utf-8")
+    receiver.close()
+    assert data.endswith(" after")
+    assert (handler.sent, handler.dropped) == (1, 1)
+
+
+def test_spool_and_reconnect(make_logger):
+    collector = Collector(start=False)
+    handler = ShippingHandler(collector.address, spoolSize=50, batchSize=20,
+                              reconnectDelay=0.01, maxReconnectDelay=0.05)
+    logger = make_logger("test_shipping_reconnect", handler)
+    for i in range(60):
+        logger.info("record %d", i)
+    # Nobody listens yet, the oldest records are discarded
+    assert handler.dropped == 10
+    assert handler.sent == 0
+
+    collector.start()
+    handler.flush()
+    assert handler.sent == 50
+    # Sent in large writes
+    assert handler.batches == 3
+    deadline = time.time() + 5
+    while collector.data.count(b" - - record") < 50 and time.time() < deadline:
+        time.sleep(0.01)
+
+    # The collector drops the connection
+    collector.disconnect()
+    collector.data = b""
+    time.sleep(0.05)
+    for i in range(60, 65):
+        logger.info("record %d", i)
+        time.sleep(0.01)
+    handler.flush()
+    handler.close()
+    time.sleep(0.05)
+    collector.close()
+    assert [message.split(" - - ")[1] for message in collector.messages()] == ["record %d" % i for i in range(60, 65)]
+
+
+def test_reconnect_backoff_while_logging(make_logger):
+    collector = Collector(start=False)
+    handler = ShippingHandler(collector.address, timeout=0.1, reconnectDelay=0.1, maxReconnectDelay=0.4)
+    attempts = []
+    connect = handler._connect
+
+    def counting_connect():
+        attempts.append(time.time())
+        connect()
+    handler._connect = counting_connect
+    logger = make_logger("test_shipping_backoff", handler)
+
+    # Logging all the time doesn't cut the waits short
+    end = time.time() + 1
+    while time.time() < end:
+        logger.info("record")
+        time.sleep(0.001)
+    # 0.1 + 0.2 + 0.4 + 0.4 ... seconds apart
+    assert 2 <= len(attempts) <= 5
+    handler.close()
+    collector.close()
+
+
+def test_close_gives_up_when_unreachable(make_logger):
+    collector = Collector(start=False)
+    handler = ShippingHandler(collector.address, timeout=0.1, reconnectDelay=0.01)
+    logger = make_logger("test_shipping_unreachable", handler)
+    logger.info("lost")
+    start = time.time()
+    handler.close()
+    assert time.time() - start < 1
+    assert handler.dropped == 1
+
+    logger.info("after close")
+    assert handler.dropped == 2
+    collector.close()
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        ShippingHandler(transport="http")
+    with pytest.raises(ValueError):
+        ShippingHandler(framing="json")
+
+
+def test_syslog_transport():
+    collector = Collector()
+    logger = logging.getLogger("test_shipping_syslog")
+    handler = logzero.syslog(logger, address=collector.address, transport="tcp")
+    assert isinstance(handler, ShippingHandler)
+    logger.warning("to the collector")
+    handler.close()
+    time.sleep(0.05)
+    collector.close()
+    assert collector.messages()[0].endswith(" - - to the collector")
+    logger.removeHandler(handler)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_spool
+----------------------------------
+
+Tests for `logzero.spool`.
+"""
+import logging
+import os
+import threading
+
+import pytest
+import logzero
+from logzero.spool import RingFile, SpoolHandler
+
+
+class StalledHandler(logging.Handler):
+    """
+    A sink which doesn't write anything until it is released.
+    """
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.released = threading.Event()
+        self.messages = []
+
+    def emit(self, record):
+        self.released.wait()
+        self.messages.append(record.getMessage())
+
+
+def test_ring_file(tmpdir):
+    filename = str(tmpdir.join("spool"))
+    ring = RingFile(filename, size=100)
+    for i in range(3):
+        assert ring.append(b"entry %d" % i)
+    entries = ring.read(2)
+    assert [entry for entry, _position in entries] == [b"entry 0", b"entry 1"]
+    # Not committed, read again after a restart
+    ring.close()
+
+    ring = RingFile(filename, size=1000)
+    assert ring.size == 100
+    entries = ring.read()
+    assert [entry for entry, _position in entries] == [b"entry 0", b"entry 1", b"entry 2"]
+    ring.commit(entries[0][1])
+    assert ring.read()[0][0] == b"entry 1"
+    ring.commit(entries[-1][1])
+    assert len(ring) == 0
+    assert ring.read() == []
+    ring.close()
+
+
+def test_ring_file_wraps_around_and_drops_oldest(tmpdir):
+    ring = RingFile(str(tmpdir.join("spool")), size=64)
+    # 4 bytes length and 10 bytes data each, 4 fit into the ring
+    for i in range(6):
+        ring.append(b"entry %04d" % i)
+    assert ring.dropped == 2
+    entries = ring.read()
+    assert [entry for entry, _position in entries] == [b"entry %04d" % i for i in range(2, 6)]
+    ring.commit(entries[-1][1])
+
+    # Many times around the ring
+    for i in range(6, 100):
+        ring.append(b"entry %04d" % i)
+        entries = ring.read()
+        assert [entry for entry, _position in entries] == [b"entry %04d" % i]
+        ring.commit(entries[-1][1])
+    assert ring.dropped == 2
+    assert not ring.append(b"x" * 100)
+    ring.close()
+
+
+@pytest.mark.skipif(os.name == "nt", reason="needs fcntl")
+def test_ring_file_used_by_one_process(tmpdir):
+    filename = str(tmpdir.join("spool"))
+    ring = RingFile(filename)
+    with pytest.raises(IOError):
+        RingFile(filename)
+    ring.close()
+
+
+def test_spool_handler_delivers_after_restart(tmpdir, make_logger):
+    filename = str(tmpdir.join("spool"))
+    sink = StalledHandler()
+    handler = SpoolHandler(sink, filename, timeout=0.1)
+    logger = make_logger("test_spool_restart", handler)
+
+    # The sink is stalled, logging doesn't wait for it
+    for i in range(10):
+        logger.info("record %d", i)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("failed")
+    # Still stalled after the timeout, stops after the record being delivered
+    threading.Timer(0.3, sink.released.set).start()
+    handler.close()
+    assert len(sink.messages) <= 1
+
+    sink = StalledHandler()
+    sink.released.set()
+    sink.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+    formatted = []
+    sink.emit = lambda record: formatted.append(sink.format(record))
+    handler = SpoolHandler(sink, filename)
+    logger = make_logger("test_spool_restart", handler)
+    logger.warning("after restart")
+    handler.flush()
+    handler.close()
+    assert len(formatted) in (11, 12)
+    assert formatted[-3] == "INFO record 9"
+    assert formatted[-2].startswith("ERROR failed\nTraceback")
+    assert formatted[-2].endswith("ValueError: boom")
+    assert formatted[-1] == "WARNING after restart"
+
+
+def test_logfile_spool(tmpdir, make_logger):
+    logfile = str(tmpdir.join("test.log"))
+    spool = str(tmpdir.join("test.spool"))
+    logger = logzero.setup_logger(name="test_spool_logfile", logfile=logfile, disableStderrLogger=True,
+                                  formatter=logging.Formatter("%(message)s"), spool=spool)
+    assert isinstance(logger.handlers[0], SpoolHandler)
+    logger.info("hello")
+    logger.handlers[0].flush()
+    with open(logfile) as f:
+        assert f.read() == "hello\n"
+    logzero.setup_logger(name="test_spool_logfile", disableStderrLogger=True)
+
+
+def test_close_delivers_spooled_records(tmpdir, make_logger):
+    logfile = str(tmpdir.join("test.log"))
+    spool = str(tmpdir.join("test.spool"))
+    logger = logzero.setup_logger(name="test_spool_close", logfile=logfile, disableStderrLogger=True,
+                                  formatter=logging.Formatter("%(message)s"), spool=spool)
+    for i in range(5000):
+        logger.info("record %d", i)
+    logger.handlers[0].close()
+    with open(logfile) as f:
+        assert f.read().splitlines() == ["record %d" % i for i in range(5000)]
+    ring = RingFile(spool)
+    assert len(ring) == 0
+    ring.close()
+    logzero.setup_logger(name="test_spool_close", disableStderrLogger=True)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_startup
+----------------------------------
+
+Import time of `logzero`, measured with ``python -X importtime``.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 7), reason="-X importtime needs Python 3.7+")
+
+# Imported on demand only
+HEAVY_MODULES = ["logging.handlers", "curses", "socket", "pickle", "json", "orjson", "ujson",
+                 "logzero.handlers", "logzero.formatters"]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _importtime(code="import logzero", lazy=False):
+    """
+    Runs ``code`` in a new interpreter, returns {module: cumulative microseconds} and its stdout
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.pop("LOGZERO_LAZY", None)
+    if lazy:
+        env["LOGZERO_LAZY"] = "1"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _self, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                modules[name.strip()] = int(cumulative)
+    return modules, proc.stdout
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_import_time(lazy):
+    modules, _ = _importtime(lazy=lazy)
+    assert "logzero" in modules
+    assert [name for name in HEAVY_MODULES if name in modules] == []
+    # Shown with `pytest -s`
+    print("import logzero (lazy=%s): %.1f ms, of which logging %.1f ms" % (
+        lazy, modules["logzero"] / 1000.0, modules.get("logging", 0) / 1000.0))
+
+
+def test_lazy_default_logger():
+    code = "\n".join([
+        "import logging, logzero",
+        "default = logging.getLogger(logzero.LOGZERO_DEFAULT_LOGGER)",
+        "print(len(default.handlers))",
+        "logzero.logger.info('first use')",
+        "print(len(default.handlers), logzero.logger is default)",
+    ])
+    _modules, stdout = _importtime(code, lazy=True)
+    assert stdout.split() == ["0", "1", "True"]
+
+
+def test_logfile_imports_handlers_on_demand():
+    modules, _ = _importtime("import logzero, tempfile, os; logzero.logfile(os.path.join(tempfile.mkdtemp(), 'a.log'))")
+    assert "logging.handlers" in modules
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_tracebacks
+----------------------------------
+
+Tests for `logzero.tracebacks`.
+"""
+import logging
+import sys
+
+import pytest
+import logzero
+from logzero import tracebacks
+from logzero.tracebacks import TracebackCache
+
+
+def _fail(n=0):
+    if n:
+        _fail(n - 1)
+    raise ValueError("boom %d" % n)
+
+
+def _chained(cause):
+    try:
+        _fail()
+    except ValueError as e:
+        error = KeyError("chained")
+        if cause:
+            error.__cause__ = e
+        raise error
+
+
+def _exc_info(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        return sys.exc_info()
+
+
+def test_output_matches_logging():
+    cases = [_exc_info(_fail), _exc_info(_fail, 3), (ValueError, ValueError("no traceback"), None)]
+    if sys.version_info >= (3, ):
+        cases.extend([_exc_info(_chained, True), _exc_info(_chained, False)])
+    cache = TracebackCache()
+    formatter = logging.Formatter()
+    for exc_info in cases:
+        for _ in range(2):
+            assert cache.format(exc_info) == formatter.formatException(exc_info)
+
+
+def test_frames_rendered_once(monkeypatch):
+    cache = TracebackCache(maxSize=2)
+    extracted = []
+    extract_tb = tracebacks.traceback.extract_tb
+    monkeypatch.setattr(tracebacks.traceback, "extract_tb", lambda tb: extracted.append(tb) or extract_tb(tb))
+
+    first = cache.format(_exc_info(_fail, 1))
+    assert "boom 0" in first
+    assert len(extracted) == 1
+    # Same code path, the message is rendered per exception
+    assert cache.format(_exc_info(_fail, 1)) == first
+    assert len(extracted) == 1
+
+    # The least recently used tracebacks are dropped
+    cache.format(_exc_info(_fail, 2))
+    cache.format(_exc_info(_fail, 3))
+    assert len(extracted) == 3
+    cache.format(_exc_info(_fail, 1))
+    assert len(extracted) == 4
+
+
+def test_compact_mode():
+    cache = TracebackCache(compact=True, window=60)
+    exc_info = _exc_info(_fail, 3)
+    full = cache.format(exc_info, now=100)
+    digest = full.split()[2].rstrip(":")
+    assert full.splitlines()[1] == "Traceback (most recent call last):"
+    assert full.count("in _fail") == 4
+
+    compact = cache.format(exc_info, now=159).splitlines()
+    assert compact[0].startswith("Traceback id %s (repeated, 5 frames" % digest)
+    assert "in _exc_info" in compact[1]
+    assert "  ..." in compact
+    assert compact[-1] == "ValueError: boom 0"
+    assert compact == cache.format(_exc_info(_fail, 3), now=159).splitlines()
+
+    # Once per window in full again
+    assert cache.format(exc_info, now=160) == full
+
+
+def test_setup_logger_compact_tracebacks(tmpdir):
+    logfile = str(tmpdir.join("test.log"))
+    log = logzero.setup_logger(name="test_compact_tracebacks", logfile=logfile, disableStderrLogger=True,
+                               compactTracebacks=True)
+    for _ in range(3):
+        try:
+            _fail(3)
+        except ValueError:
+            log.exception("failed")
+    logzero.setup_logger(name="test_compact_tracebacks", disableStderrLogger=True)
+
+    with open(logfile) as f:
+        content = f.read()
+    assert content.count("Traceback (most recent call last)") == 1
+    assert content.count("(repeated, 5 frames") == 2
+
+
+@pytest.mark.skipif(sys.version_info < (3, 11), reason="exception groups need Python 3.11+")
+def test_exception_groups_rendered_by_traceback():
+    exc_info = _exc_info(_raise_group)
+    assert TracebackCache().format(exc_info) == logging.Formatter().formatException(exc_info)
+
+
+def _raise_group():
+    raise ExceptionGroup("group", [ValueError(1), KeyError(2)])  # noqa: F821